@@ -0,0 +1,98 @@
+import os
+import logging
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# base url of the application server running app.py, can be overridden with the ML_API_BASE_URL environment variable
+DEFAULT_BASE_URL = os.environ.get('ML_API_BASE_URL', 'http://127.0.0.1:8000')
+
+class ApiClient:
+    """
+    HTTP client for the endpoints in app.py, holding a pooled requests.Session so that connections are kept alive and reused between calls
+    instead of opening a new TCP connection per request
+    """
+    def __init__(self, base_url = DEFAULT_BASE_URL, pool_size = 10, timeout = 10.0):
+        """
+        Parameters:
+        - base_url (str): base url of the application server
+        - pool_size (int): maximum number of connections kept alive in the pool
+        - timeout (float or tuple): requests timeout in seconds, either one value or a (connect, read) tuple
+        """
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, path):
+        """
+        Return the full url of an endpoint
+
+        Parameters:
+        - path (str): path of the endpoint (e.g., /ml/ats/predict)
+
+        Returns
+        - str: the endpoint url
+        """
+        return self.base_url + path
+
+    def post(self, path, payload):
+        """
+        POST a JSON payload to an endpoint through the pooled session
+
+        Parameters:
+        - path (str): path of the endpoint (e.g., /ml/ats/predict)
+        - payload (dict or list): JSON-serializable body of the request
+
+        Returns
+        - requests.Response: the response of the endpoint
+        """
+        return self.session.post(self.url(path), json=payload, timeout=self.timeout)
+
+    def close(self):
+        """
+        Close the session and all its pooled connections
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+default_client = None
+
+def get_default_client():
+    """
+    Return the shared ApiClient used when no client is passed to the api_interaction functions, creating it on first use
+
+    Returns
+    - ApiClient: the shared client
+    """
+    global default_client
+    if default_client is None:
+        logging.info('Creating default API client for %s', DEFAULT_BASE_URL)
+        default_client = ApiClient()
+    return default_client
+
+def create_async_client(base_url = DEFAULT_BASE_URL, pool_size = 10, timeout = 10.0):
+    """
+    Create the asyncio counterpart of ApiClient: an httpx.AsyncClient with a bounded pool of keep-alive connections
+
+    Parameters:
+    - base_url (str): base url of the application server
+    - pool_size (int): maximum number of connections kept open at the same time
+    - timeout (float): timeout of the requests in seconds
+
+    Returns
+    - httpx.AsyncClient: the client, to be closed with aclose() or used as an async context manager
+    """
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return httpx.AsyncClient(base_url=base_url.rstrip('/'), limits=limits, timeout=timeout)
@@ -1,15 +1,20 @@
 import pandas as pd
 import os
-import requests
-import time
 import logging
 
-from .data_processing import read_member_data, create_member_features
+from .api_client import get_default_client
+from .cache import data_version, version_as_of
+from .instrumentation import instrumented, timed
+from .log_sampling import log_member, batch_logged
+from .data_processing import read_member_data, create_member_features, build_member_feature_table
+from .parallel_features import build_member_feature_table_parallel
 from .member_features import MemberFeatures
 from .prediction_ep import Prediction
+from .records import MemberFeaturesRecord, PredictionRecord
 
 
-def post_predict_ats_ep(member_id, member_features):
+@timed
+def post_predict_ats_ep(member_id, member_features, client = None):
     """
     POST inputs to the ATS prediction endpoint to get the estimated amount of purchase per member
 
@@ -17,32 +22,30 @@ def post_predict_ats_ep(member_id, member_features):
     - member_id (str): member_id for which to calculate the average points bought
     - member_features (MemberFeatures): an object of MemberFeatures including the transformed member data
 
+    - client (ApiClient): client to send the request with (the shared default client if None)
     Returns
     - result (float or None): ATS predicted result
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
-    # specify the url of the predict_at_ep endpoint
-    predict_ats_endpoint = "http://127.0.0.1:8000/ml/ats/predict"
+    client = client or get_default_client()
+    # specify the path of the predict_at_ep endpoint
+    predict_ats_path = "/ml/ats/predict"
 
-    logging.info(f'Sending POST request to {predict_ats_endpoint} with member_id {member_id}')
+    log_member(member_id, 'Sending POST request to %s with member_id %s', client.url(predict_ats_path), member_id)
 
     # make a POST request to predict_ats_ep endpoint
-    response = requests.post(predict_ats_endpoint, json=member_features.dict())
+    response = client.post(predict_ats_path, MemberFeaturesRecord.dump(member_features))
 
     if response.status_code == 200:
         result = response.json()
-        logging.info(f"Prediction for member {member_id}: {result['prediction']}")
-        end_time = time.time()
-        latency = end_time - start_time
-        return result['prediction'], latency
+        log_member(member_id, "Prediction for member %s: %s", member_id, result['prediction'])
+        return result['prediction']
     else:
-        logging.error(f"Error: {response.status_code} - {response.text}")
-        end_time = time.time()
-        latency = end_time - start_time
-        return None, latency
+        logging.error("Error: %s - %s", response.status_code, response.text)
+        return None
     
-def post_predict_resp_ep(member_id, member_features):
+@timed
+def post_predict_resp_ep(member_id, member_features, client = None):
     """
     POST inputs to the RESP prediction endpoint to get the estimated likelihood of purchase per member
 
@@ -50,30 +53,27 @@ def post_predict_resp_ep(member_id, member_features):
     - member_id (str): member_id for which to calculate the average points bought
     - member_features (MemberFeatures): an object of MemberFeatures including the transformed member data
 
+    - client (ApiClient): client to send the request with (the shared default client if None)
     Returns
     - result (float or None): ATS predicted result
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
-    # specify the url of the predict_at_ep endpoint
-    predict_resp_endpoint = "http://127.0.0.1:8000/ml/resp/predict"
+    client = client or get_default_client()
+    # specify the path of the predict_at_ep endpoint
+    predict_resp_path = "/ml/resp/predict"
 
-    logging.info(f'Sending POST request to {predict_resp_endpoint} with member_id {member_id}')
+    log_member(member_id, 'Sending POST request to %s with member_id %s', client.url(predict_resp_path), member_id)
 
     # make a POST request to predict_ats_ep endpoint
-    response = requests.post(predict_resp_endpoint, json=member_features.dict())
+    response = client.post(predict_resp_path, MemberFeaturesRecord.dump(member_features))
 
     if response.status_code == 200:
         result = response.json()
-        logging.info(f"Prediction for member {member_id}: {result['prediction']}")
-        end_time = time.time()
-        latency = end_time - start_time
-        return result['prediction'], latency
+        log_member(member_id, "Prediction for member %s: %s", member_id, result['prediction'])
+        return result['prediction']
     else:
-        logging.error(f"Error: {response.status_code} - {response.text}")
-        end_time = time.time()
-        latency = end_time - start_time
-        return None, latency
+        logging.error("Error: %s - %s", response.status_code, response.text)
+        return None
 
 def combine_predictions(predict_ats_ep, predict_resp_ep):
     """
@@ -84,51 +84,151 @@ def combine_predictions(predict_ats_ep, predict_resp_ep):
     - predict_resp_ep (float): predicted RESP value
 
     Returns
-    - combined_prediction (Prediction): combined Prediction object
+    - combined_prediction (PredictionRecord): combined predictions, with the fields of Prediction
     """
-    combined_prediction = Prediction(
+    combined_prediction = PredictionRecord(
         ats_prediction= predict_ats_ep,
         resp_prediction = predict_resp_ep
     )
 
-    logging.info(f'Combining ATS and RESP predictions')
+    logging.debug('Combining ATS and RESP predictions')
 
     return combined_prediction
 
-def post_offer_ep(member_id, prediction):
+@timed
+def post_offer_ep(member_id, prediction, client = None):
     """
     POST Prediction object to the offer endpoint to get which offer should be given to the member
 
     Parameters:
     - member_id (str): member_id for which to calculate the average points bought
-    - prediction (Prediction): an object of Prediction including the combination of ATS and RESP predictions
+    - prediction (Prediction or PredictionRecord): an object with the fields of Prediction, including the combination of ATS and RESP predictions
 
+    - client (ApiClient): client to send the request with (the shared default client if None)
     Returns
     - result (str or None): the offer given to the member
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
-    # specify the url of the offer endpoint
-    offer_endpoint = "http://127.0.0.1:8000/offer/assign"
+    client = client or get_default_client()
+    # specify the path of the offer endpoint
+    offer_path = "/offer/assign"
 
-    logging.info(f'Sending POST request to {offer_endpoint} with member_id {member_id}')
+    log_member(member_id, 'Sending POST request to %s with member_id %s', client.url(offer_path), member_id)
 
     # make a POST request to offer_ep endpoint
-    response = requests.post(offer_endpoint, json=prediction.dict())
+    response = client.post(offer_path, PredictionRecord.dump(prediction))
 
     if response.status_code == 200:
         result = response.json()
-        logging.info(f"Offer for member {member_id}: {result['offer']}")
-        end_time = time.time()
-        latency = end_time - start_time
-        return result['offer'], latency
+        log_member(member_id, "Offer for member %s: %s", member_id, result['offer'])
+        return result['offer']
     else:
-        logging.error(f"Error: {response.status_code} - {response.text}")
-        end_time = time.time()
-        latency = end_time - start_time
-        return None, latency
+        logging.error("Error: %s - %s", response.status_code, response.text)
+        return None
 
-def summarize(member_id, dataset_file_path):
+@timed
+def post_score_ep(member_id, member_features, client = None):
+    """
+    POST inputs to the fused scoring endpoint to get the ATS and RESP predictions and the offer of a member in one round trip
+
+    Parameters:
+    - member_id (str): member_id for which to calculate the average points bought
+    - member_features (MemberFeatures): an object of MemberFeatures including the transformed member data
+
+    - client (ApiClient): client to send the request with (the shared default client if None)
+    Returns
+    - result (dict or None): including ats_prediction, resp_prediction and offer
+    - latency (float): time taken to process the function
+    """
+    client = client or get_default_client()
+    # specify the path of the score endpoint
+    score_path = "/score"
+
+    log_member(member_id, 'Sending POST request to %s with member_id %s', client.url(score_path), member_id)
+
+    # make a POST request to score endpoint
+    response = client.post(score_path, MemberFeaturesRecord.dump(member_features))
+
+    if response.status_code == 200:
+        result = response.json()
+        log_member(member_id, "Score for member %s: %s", member_id, result)
+        return result
+    else:
+        logging.error("Error: %s - %s", response.status_code, response.text)
+        return None
+
+@timed
+def post_batch_ep(path, payload, result_key, client = None):
+    """
+    POST a list of inputs to one of the batch endpoints
+
+    Parameters:
+    - path (str): path of the batch endpoint
+    - payload (list): list of dictionaries, one per member
+    - result_key (str): key of the list of results in the response
+    - client (ApiClient): client to send the request with (the shared default client if None)
+
+    Returns
+    - result (list or None): one result per member, in the order of the payload
+    - latency (float): time taken to process the function
+    """
+    client = client or get_default_client()
+
+    logging.info('Sending POST request to %s with %s members', client.url(path), len(payload))
+
+    response = client.post(path, payload)
+
+    if response.status_code == 200:
+        result = response.json()
+        return result[result_key]
+    else:
+        logging.error("Error: %s - %s", response.status_code, response.text)
+        return None
+
+def post_predict_ats_batch_ep(member_features_list, client = None):
+    """
+    POST the features of many members to the ATS batch prediction endpoint
+
+    Parameters:
+    - member_features_list (list): list of MemberFeatures objects
+
+    - client (ApiClient): client to send the request with (the shared default client if None)
+    Returns
+    - result (list or None): ATS predicted result per member
+    - latency (float): time taken to process the function
+    """
+    return post_batch_ep("/ml/ats/predict_batch", [MemberFeaturesRecord.dump(member_features) for member_features in member_features_list], 'predictions', client = client)
+
+def post_predict_resp_batch_ep(member_features_list, client = None):
+    """
+    POST the features of many members to the RESP batch prediction endpoint
+
+    Parameters:
+    - member_features_list (list): list of MemberFeatures objects
+
+    - client (ApiClient): client to send the request with (the shared default client if None)
+    Returns
+    - result (list or None): RESP predicted result per member
+    - latency (float): time taken to process the function
+    """
+    return post_batch_ep("/ml/resp/predict_batch", [MemberFeaturesRecord.dump(member_features) for member_features in member_features_list], 'predictions', client = client)
+
+def post_offer_batch_ep(predictions, client = None):
+    """
+    POST the predictions of many members to the batch offer endpoint
+
+    Parameters:
+    - predictions (list): list of Prediction objects
+
+    - client (ApiClient): client to send the request with (the shared default client if None)
+    Returns
+    - result (list or None): the offer given to each member
+    - latency (float): time taken to process the function
+    """
+    return post_batch_ep("/offer/assign_batch", [PredictionRecord.dump(prediction) for prediction in predictions], 'offers', client = client)
+
+@instrumented
+def summarize(member_id, dataset_file_path, fused = False, client = None, cache = None, as_of = None):
     """
     POST inputs to the ATS prediction endpoint to get the estimated amount of purchase per member,
     combine the predictions into a Prediction object,
@@ -137,29 +237,76 @@ def summarize(member_id, dataset_file_path):
     Parameters:
     - member_id (str): member_id for which to calculate the average points bought
     - dataset_file_path (str): path to the complete dataset
+    - fused (bool): if True, get the predictions and the offer from the fused score endpoint in one round trip (the latencies then include
+      score_ep_latency instead of the three endpoint latencies)
+    - client (ApiClient): client to send the requests with (the shared default client if None)
+    - cache (LRUCache): if given, reuse the features and the predictions computed for the member by an earlier call on the same version of
+      the data (see cache.data_version); the latencies of the cached steps are then 0, and the result includes the cache statistics. Without
+      as_of, the features are then computed at the time of the version, the UTC midnight of the current date (see cache.version_as_of)
+    - as_of (str or datetime or pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at, in UTC (the current UTC time if None)
 
     Returns
     - result (dict): including all the predictions, combinations, offer, and latencies for each of the modules within the fucntion
     """
-    logging.info(f'Summarizing data for member_id {member_id} with dataset_file_path {dataset_file_path}')
-    
-    # load raw dataset
-    member_data, read_data_latency = read_member_data(dataset_file_path)
-
-    # compute MemberFeatures object using the given dataset and memebr_id
-    member_features, member_features_latency = create_member_features(member_data, member_id)
+    log_member(member_id, 'Summarizing data for member_id %s with dataset_file_path %s', member_id, dataset_file_path)
+
+    version = None
+    if cache is not None:
+        # the features are computed at the time of their version, so that a cached entry is what the same call would compute
+        as_of = version_as_of(as_of)
+        version = data_version(dataset_file_path, as_of)
+    member_features_hit, cached_member_features = cache.get(('member_features', version, member_id)) if cache is not None else (False, None)
+
+    if member_features_hit:
+        member_features, member_features_latency = cached_member_features
+        read_data_latency = 0
+        member_features_latency = dict.fromkeys(member_features_latency, 0)
+    else:
+        # load raw dataset
+        member_data, read_data_latency = read_member_data(dataset_file_path)
+
+        # compute MemberFeatures object using the given dataset and memebr_id
+        member_features, member_features_latency = create_member_features(member_data, member_id, as_of = as_of)
+
+        if cache is not None:
+            cache.put(('member_features', version, member_id), (member_features, member_features_latency))
+
+    # the predictions and the offer only depend on the features, so they are cached with the same version
+    predictions_hit, cached_predictions = cache.get(('predictions', version, member_id)) if cache is not None else (False, None)
+
+    if predictions_hit:
+        prediction_ats_ep_output, prediction_resp_ep_output, offer_ep_output = cached_predictions
+        latencies = {"score_ep_latency": 0} if fused else {"prediction_ats_ep_latency": 0, "prediction_resp_ep_latency": 0, "offer_ep_latency": 0}
+    elif fused:
+        # POST member features to the score endpoint to get both predictions and the offer at once
+        score_ep_output, score_ep_latency = post_score_ep(member_id, member_features, client = client)
+        score_ep_output = score_ep_output or {}
+
+        prediction_ats_ep_output = score_ep_output.get("ats_prediction")
+        prediction_resp_ep_output = score_ep_output.get("resp_prediction")
+        offer_ep_output = score_ep_output.get("offer")
+        latencies = {"score_ep_latency": score_ep_latency}
+    else:
+        # POST member features to ATS endpoint
+        prediction_ats_ep_output, prediction_ats_ep_latency = post_predict_ats_ep(member_id, member_features, client = client)
 
-    # POST member features to ATS endpoint
-    prediction_ats_ep_output, prediction_ats_ep_latency = post_predict_ats_ep(member_id, member_features)
+        # POST member features to RESP endpoint
+        prediction_resp_ep_output, prediction_resp_ep_latency = post_predict_resp_ep(member_id, member_features, client = client)
 
-    # POST member features to RESP endpoint
-    prediction_resp_ep_output, prediction_resp_ep_latency = post_predict_resp_ep(member_id, member_features)
+        # combine ATS and RESP predictions into the Prediction object
+        combine_pred = combine_predictions(prediction_ats_ep_output, prediction_resp_ep_output)
 
-    # combine ATS and RESP predictions into the Prediction object
-    combine_pred = combine_predictions(prediction_ats_ep_output, prediction_resp_ep_output)
+        # predict which offer should be given to the memeber (OFFER_1 or OFFER_2)
+        offer_ep_output, offer_ep_latency = post_offer_ep(member_id, combine_pred, client = client)
+        latencies = {
+            "prediction_ats_ep_latency": prediction_ats_ep_latency,
+            "prediction_resp_ep_latency": prediction_resp_ep_latency,
+            "offer_ep_latency": offer_ep_latency
+        }
 
-    # predict which offer should be given to the memeber (OFFER_1 or OFFER_2)
-    offer_ep_output, offer_ep_latency = post_offer_ep(member_id, combine_pred)
+    # failed requests are not cached, so that they are retried by the next call
+    if cache is not None and not predictions_hit and offer_ep_output is not None:
+        cache.put(('predictions', version, member_id), (prediction_ats_ep_output, prediction_resp_ep_output, offer_ep_output))
 
     res = {
         "member_id": member_id,
@@ -170,13 +317,150 @@ def summarize(member_id, dataset_file_path):
         "latencies": {
             "read_data_latency": read_data_latency,
             "member_features_latency": member_features_latency,
-            "prediction_ats_ep_latency": prediction_ats_ep_latency,
-            "prediction_resp_ep_latency": prediction_resp_ep_latency,
-            "offer_ep_latency": offer_ep_latency
+            **latencies
         }
     }
+    if cache is not None:
+        res["cache_stats"] = {
+            "member_features_hit": member_features_hit,
+            "predictions_hit": predictions_hit,
+            **cache.stats()
+        }
 
-    logging.info(f'Summarization completed for member_id {member_id}')
+    log_member(member_id, 'Summarization completed for member_id %s', member_id)
+
+    return res
+
+@timed
+def read_batch_features(feature_table, member_ids):
+    """
+    Read the features of a batch of members from the feature table column by column, instead of looking up each feature of each member
+
+    Parameters:
+    - feature_table (pd.DataFrame): features of every member (see build_member_feature_table)
+    - member_ids (list): member_ids of the batch, all in the feature table
+
+    Returns:
+    - member_features_list (list): MemberFeatures of each member of the batch
+    - latency (float): time taken to process the function
+    """
+    batch_table = feature_table.loc[member_ids, list(MemberFeatures.model_fields)]
+    feature_columns = {column: batch_table[column].tolist() for column in batch_table.columns}
+    return [MemberFeatures(**dict(zip(feature_columns, values))) for values in zip(*feature_columns.values())]
+
+@timed
+def score_members(member_ids, feature_table, batch_size, client):
+    """
+    Score the members of summarize_batch batch_size at a time, with one request per batch to each of the batch endpoints
+
+    Parameters:
+    - member_ids (list): list of member_ids to score
+    - feature_table (pd.DataFrame): features of every member in the dataset (see build_member_feature_table)
+    - batch_size (int): number of members sent per request to the batch endpoints
+    - client (ApiClient): client to send the requests with (the shared default client if None)
+
+    Returns:
+    - results (list): result of each member, in the order of member_ids (see summarize_batch)
+    - latency (float): time taken to process the function
+    """
+    # members without transactions have no features to score (all their features are None, as with create_member_features)
+    results = [{
+        "member_id": member_id,
+        "member_features": MemberFeatures(**dict.fromkeys(MemberFeatures.model_fields)),
+        "predict_ats_ep": None,
+        "predict_resp_ep": None,
+        "offer_ep": None,
+        "latencies": {
+            "member_features_latency": {"transform_features_latency": 0},
+            "prediction_ats_ep_latency": 0,
+            "prediction_resp_ep_latency": 0,
+            "offer_ep_latency": 0
+        }
+    } for member_id in member_ids]
+    scorable_results = [res for res in results if res["member_id"] in feature_table.index]
+    if len(scorable_results) < len(results):
+        logging.warning('No transactions for %s of the %s members. They are not scored.', len(results) - len(scorable_results), len(results))
+
+    for batch_start in range(0, len(scorable_results), batch_size):
+        batch = scorable_results[batch_start:batch_start + batch_size]
+
+        member_features_list, member_features_latency = read_batch_features(feature_table, [res["member_id"] for res in batch])
+
+        # POST member features to the ATS and RESP batch endpoints
+        prediction_ats_ep_output, prediction_ats_ep_latency = post_predict_ats_batch_ep(member_features_list, client = client)
+        prediction_resp_ep_output, prediction_resp_ep_latency = post_predict_resp_batch_ep(member_features_list, client = client)
+
+        offer_ep_output, offer_ep_latency = None, 0
+        if prediction_ats_ep_output is not None and prediction_resp_ep_output is not None:
+            # combine ATS and RESP predictions and POST them to the batch offer endpoint
+            combine_preds = [combine_predictions(ats, resp) for ats, resp in zip(prediction_ats_ep_output, prediction_resp_ep_output)]
+            offer_ep_output, offer_ep_latency = post_offer_batch_ep(combine_preds, client = client)
+
+        for i, res in enumerate(batch):
+            res["member_features"] = member_features_list[i]
+            res["latencies"]["member_features_latency"]["transform_features_latency"] = member_features_latency / len(batch)
+            res["predict_ats_ep"] = prediction_ats_ep_output[i] if prediction_ats_ep_output is not None else None
+            res["predict_resp_ep"] = prediction_resp_ep_output[i] if prediction_resp_ep_output is not None else None
+            res["offer_ep"] = offer_ep_output[i] if offer_ep_output is not None else None
+            res["latencies"]["prediction_ats_ep_latency"] = prediction_ats_ep_latency / len(batch)
+            res["latencies"]["prediction_resp_ep_latency"] = prediction_resp_ep_latency / len(batch)
+            res["latencies"]["offer_ep_latency"] = offer_ep_latency / len(batch)
+
+    return results
+
+@instrumented
+@batch_logged
+def summarize_batch(member_ids, dataset_file_path, batch_size = 1000, client = None, feature_workers = None, as_of = None):
+    """
+    Score many members with a single read of the dataset: load the file once, compute the features of every member in one feature table,
+    then score the rows of the requested members batch_size at a time, with one request per batch to each of the batch endpoints
+
+    Parameters:
+    - member_ids (list or str): list of member_ids to score, or "all" to score every member in the dataset
+    - dataset_file_path (str): path to the complete dataset
+    - batch_size (int): number of members sent per request to the batch endpoints (at most the MAX_BATCH_SIZE of the app)
+    - client (ApiClient): client to send the requests with (the shared default client if None)
+    - feature_workers (int): if given, compute the features on this many worker processes (see build_member_feature_table_parallel)
+    - as_of (str or datetime or pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at for all the members, in UTC
+      (the time the batch starts if None)
+
+    Returns
+    - result (dict): including the per-member results (same format as summarize, without the read latency, with the time taken to read the
+      features of a batch from the feature table as transform_features_latency, and with the feature and endpoint latencies divided evenly
+      between the members of a batch), the number of members scored, the throughput in members per second, and the latencies of the shared steps
+    """
+    logging.info('Summarizing data for a batch of members with dataset_file_path %s', dataset_file_path)
+
+    # load raw dataset once for the whole batch
+    member_data, read_data_latency = read_member_data(dataset_file_path)
+
+    # compute the features of every member in one pass
+    if feature_workers:
+        feature_table, feature_table_latency = build_member_feature_table_parallel(member_data, workers = feature_workers, as_of = as_of)
+    else:
+        feature_table, feature_table_latency = build_member_feature_table(member_data, as_of = as_of)
+
+    if isinstance(member_ids, str) and member_ids == "all":
+        member_ids = feature_table.index.tolist()
+
+    results, scoring_latency = score_members(member_ids, feature_table, batch_size, client)
+    # the total is the sum of the steps, each of them timed once
+    total_latency = read_data_latency + feature_table_latency + scoring_latency
+    throughput = len(results) / total_latency if total_latency > 0 else 0.0
+
+    res = {
+        "results": results,
+        "member_count": len(results),
+        "throughput": throughput,
+        "latencies": {
+            "read_data_latency": read_data_latency,
+            "feature_table_latency": feature_table_latency,
+            "scoring_latency": scoring_latency,
+            "total_latency": total_latency
+        }
+    }
+
+    logging.info('Batch summarization completed for %s members. Throughput: %s members/sec', len(results), throughput)
 
     return res
 
@@ -191,10 +475,14 @@ if __name__ == "__main__":
     # get the path to the dataset file
     file_path = path + file_name
 
-    # specify a member_id for testing
+    # specify a member_id for testing, several comma-separated member_ids, or "all"
     # test_member_id = '5D72524D'
     test_member_id = input("Please enter member_id: ")
 
-    predict_output = summarize(test_member_id, file_path)
+    if test_member_id == "all" or "," in test_member_id:
+        member_ids = "all" if test_member_id == "all" else [member_id.strip() for member_id in test_member_id.split(",")]
+        predict_output = summarize_batch(member_ids, file_path)
+    else:
+        predict_output = summarize(test_member_id, file_path)
     print("predict output and latencies: ", predict_output)
     # print("latency for different functions: ", latency)
\ No newline at end of file
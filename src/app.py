@@ -1,9 +1,225 @@
-from fastapi import FastAPI
-from .prediction_ep import predict_ats, predict_resp, Prediction
-from .offer_ep import get_offer
+import os
+import threading
+import json
+import email.message
+from datetime import datetime
+from time import perf_counter_ns
+from typing import Optional
+
+import orjson
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
+from starlette.routing import Match
+from .prediction_ep import predict_ats, predict_resp, predict_ats_batch, predict_resp_batch, Prediction
+from .prediction_ep import ATS_FEATURES, RESP_FEATURES, unscorable_members
+from .offer_ep import get_offer, get_offer_batch
 from .member_features import MemberFeatures
+from .records import MemberFeaturesRecord, PredictionRecord, RecordValidationError, error_details
+from .feature_store import FeatureStore, FeatureStoreSchemaError, DEFAULT_STORE_PATH
+from .instrumentation import MetricsRegistry, REGISTRY
+
+# responses are serialized with orjson, unless JSON_RESPONSE is "json" (the standard library encoder)
+JSON_RESPONSE = os.environ.get("JSON_RESPONSE", "orjson")
+ResponseClass = JSONResponse if JSON_RESPONSE == "json" else ORJSONResponse
+
+app = FastAPI(default_response_class=ResponseClass)
+
+# maximum number of items accepted by the batch endpoints
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 1000))
+
+
+# upper bounds of the payload size histogram buckets, in bytes
+SIZE_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000, 5000000)
+
+
+def route_name(scope) -> str:
+    # the path template of the route (e.g. /members/{member_id}/score), so that there is one series per route and not per member
+    partial = None
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or "unmatched"
+
+
+class MetricsMiddleware:
+    # records the number of requests, the requests in progress, the payload sizes and the latency per route, served by /metrics
+    def __init__(self, app, registry: MetricsRegistry = REGISTRY):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels = {"method": scope["method"], "route": route_name(scope)}
+        in_progress = self.registry.gauge("http_requests_in_progress", "Requests being processed", **labels)
+        in_progress.inc()
+        start_ns = perf_counter_ns()
+        status = 500
+        request_size = 0
+        response_size = 0
+
+        async def receive_counted():
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message):
+            nonlocal status, response_size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            # an unhandled exception is counted as a 500
+            in_progress.dec()
+            self.registry.counter("http_requests_total", "Requests processed", status=str(status), **labels).inc()
+            self.registry.histogram("http_request_duration_seconds", "Latency of the requests", **labels).observe((perf_counter_ns() - start_ns) / 1e9)
+            self.registry.histogram("http_request_size_bytes", "Size of the request bodies", buckets=SIZE_BUCKETS, **labels).observe(request_size)
+            self.registry.histogram("http_response_size_bytes", "Size of the response bodies", buckets=SIZE_BUCKETS, **labels).observe(response_size)
+
+
+app.add_middleware(MetricsMiddleware)
+
+
+def to_columns(items: list, fields) -> dict:
+    return {field: [getattr(item, field) for item in items] for field in fields}
+
+
+def reject_unscorable(columns: dict, features) -> None:
+    # the scalar endpoints fail on these members, so the batch endpoints reject them instead of predicting NaN or inf
+    errors = [
+        error_details("value_error", ("body", i, name), "Value error, the feature is required" if value is None else "Value error, DAYS_SINCE_LAST_TRANSACTION cannot be -1", value)
+        for i, name, value in unscorable_members(columns, features)
+    ]
+    if errors:
+        raise RequestValidationError(errors)
+
+
+def body_schema(model, many: bool = False) -> dict:
+    # the request bodies are read by read_body, so their schema is documented in the OpenAPI spec by hand
+    schema = model.model_json_schema()
+    if many:
+        schema = {"type": "array", "items": schema, "title": f"List[{model.__name__}]"}
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": schema}}}}
+
+
+def body_errors(errors: list, loc: tuple) -> list:
+    return [{**error, "loc": loc + tuple(error["loc"])} for error in errors]
+
+
+def is_json(content_type: Optional[str]) -> bool:
+    # same rule as FastAPI: bodies without a content type, application/json or application/*+json are decoded as JSON
+    if not content_type:
+        return True
+    message = email.message.Message()
+    message["content-type"] = content_type
+    subtype = message.get_content_subtype()
+    return message.get_content_maintype() == "application" and (subtype == "json" or subtype.endswith("+json"))
 
-app = FastAPI()
+
+def decode_json(body: bytes):
+    # the standard library decoder FastAPI uses, with its errors
+    try:
+        return json.loads(body)
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([{"type": "json_invalid", "loc": ("body", e.pos), "msg": "JSON decode error", "input": {}, "ctx": {"error": e.msg}}], body=e.doc)
+    except Exception:
+        raise HTTPException(status_code=400, detail="There was an error parsing the body")
+
+
+def validate_body(data, record_class, many: bool = False):
+    # errors are located in the body as FastAPI locates them; a missing body (None) is rejected
+    if data is None:
+        raise RequestValidationError([error_details("missing", ("body",), "Field required", None)])
+    if not many:
+        try:
+            return record_class.from_dict(data)
+        except RecordValidationError as e:
+            raise RequestValidationError(body_errors(e.errors(), ("body",)), body=data)
+
+    if not isinstance(data, list):
+        raise RequestValidationError([error_details("list_type", ("body",), "Input should be a valid list", data)], body=data)
+    # oversized batches are rejected before any of their items is validated
+    if len(data) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch size {len(data)} exceeds the maximum of {MAX_BATCH_SIZE}",
+        )
+    records = []
+    errors = []
+    for i, item in enumerate(data):
+        try:
+            records.append(record_class.from_dict(item))
+        except RecordValidationError as e:
+            errors.extend(body_errors(e.errors(), ("body", i)))
+    if errors:
+        raise RequestValidationError(errors, body=data)
+    return records
+
+
+async def read_body(request: Request, record_class, many: bool = False):
+    # validates the JSON body with the __slots__ records (see records.py) instead of the pydantic models, which is cheaper on the hot path;
+    # invalid bodies get the same 422 response as FastAPI gives for the models
+    body = await request.body()
+    if not body:
+        return validate_body(None, record_class, many)
+    if not is_json(request.headers.get("content-type")):
+        # bodies of other content types are validated as they are, and rejected
+        return validate_body(body, record_class, many)
+
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        # invalid JSON, but also what only the standard library accepts (e.g. NaN, or UTF-16 bodies)
+        return validate_body(decode_json(body), record_class, many)
+    try:
+        return validate_body(data, record_class, many)
+    except RequestValidationError:
+        # orjson reads integers beyond 64 bits as floats, so invalid bodies are decoded again by the standard library before being rejected
+        return validate_body(decode_json(body), record_class, many)
+
+
+# the feature store opened by get_feature_store, and the (device, inode) of the file it was opened from
+FEATURE_STORE = {"store": None, "file_id": None}
+FEATURE_STORE_LOCK = threading.Lock()
+
+
+def get_feature_store() -> FeatureStore:
+    # opened on the first lookup and kept while the file stays the same: build_feature_store replaces the file (os.replace), so a new
+    # inode is a rebuilt store to open again, while update_feature_store writes in place, which the open connection already reads
+    try:
+        stat = os.stat(DEFAULT_STORE_PATH)
+        file_id = (stat.st_dev, stat.st_ino)
+    except FileNotFoundError:
+        file_id = None
+    with FEATURE_STORE_LOCK:
+        if file_id is None or FEATURE_STORE["file_id"] != file_id:
+            try:
+                # the previous store is closed when the requests still using it are done (when it is garbage collected)
+                FEATURE_STORE.update(store=FeatureStore(DEFAULT_STORE_PATH), file_id=file_id)
+            except (FileNotFoundError, FeatureStoreSchemaError) as e:
+                FEATURE_STORE.update(store=None, file_id=None)
+                raise HTTPException(status_code=503, detail=str(e))
+        return FEATURE_STORE["store"]
+
+
+def score(member_features: MemberFeatures) -> dict:
+    ats_prediction = predict_ats(member_features)["prediction"]
+    resp_prediction = predict_resp(member_features)["prediction"]
+    offer = get_offer(PredictionRecord(ats_prediction=ats_prediction, resp_prediction=resp_prediction))["offer"]
+    return {"ats_prediction": ats_prediction, "resp_prediction": resp_prediction, "offer": offer}
 
 
 @app.get("/")
@@ -11,16 +227,69 @@ async def ping():
     return {"msg": "pong"}
 
 
-@app.post("/ml/ats/predict")
-async def predict_ats_ep(member_features: MemberFeatures):
-    return predict_ats(member_features)
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format, for scraping
+    return PlainTextResponse(REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+# the POST endpoints return their response directly, which skips FastAPI's jsonable_encoder pass over the content
+
+
+@app.post("/ml/ats/predict", openapi_extra=body_schema(MemberFeatures))
+async def predict_ats_ep(request: Request):
+    member_features = await read_body(request, MemberFeaturesRecord)
+    return ResponseClass(predict_ats(member_features))
+
+
+@app.post("/ml/resp/predict", openapi_extra=body_schema(MemberFeatures))
+async def predict_resp_ep(request: Request):
+    member_features = await read_body(request, MemberFeaturesRecord)
+    return ResponseClass(predict_resp(member_features))
+
+
+@app.post("/offer/assign", openapi_extra=body_schema(Prediction))
+async def assign_offer_ep(request: Request):
+    prediction = await read_body(request, PredictionRecord)
+    return ResponseClass(get_offer(prediction))
+
+
+@app.post("/score", openapi_extra=body_schema(MemberFeatures))
+async def score_ep(request: Request):
+    # ATS, RESP and the offer in one request, instead of three round trips
+    member_features = await read_body(request, MemberFeaturesRecord)
+    return ResponseClass(score(member_features))
+
+
+@app.get("/members/{member_id}/score")
+def score_member_ep(member_id: str, as_of: Optional[datetime] = None, feature_store: FeatureStore = Depends(get_feature_store)):
+    # a plain function, so that the blocking SQLite lookup runs in the threadpool instead of the event loop;
+    # the features are looked up in the precomputed feature store instead of being sent by the client;
+    # as_of fixes the time DAYS_SINCE_LAST_TRANSACTION is computed at, so that the score can be reproduced
+    member_features = feature_store.get(member_id, as_of=as_of)
+    if member_features is None:
+        raise HTTPException(status_code=404, detail=f"Member {member_id} not found in the feature store")
+    return {"member_id": member_id, **score(member_features)}
+
+
+@app.post("/ml/ats/predict_batch", openapi_extra=body_schema(MemberFeatures, many=True))
+async def predict_ats_batch_ep(request: Request):
+    member_features = await read_body(request, MemberFeaturesRecord, many=True)
+    columns = to_columns(member_features, MemberFeaturesRecord.__slots__)
+    reject_unscorable(columns, ATS_FEATURES)
+    return ResponseClass({"predictions": predict_ats_batch(columns).tolist()})
 
 
-@app.post("/ml/resp/predict")
-async def predict_resp_ep(member_features: MemberFeatures):
-    return predict_resp(member_features)
+@app.post("/ml/resp/predict_batch", openapi_extra=body_schema(MemberFeatures, many=True))
+async def predict_resp_batch_ep(request: Request):
+    member_features = await read_body(request, MemberFeaturesRecord, many=True)
+    columns = to_columns(member_features, MemberFeaturesRecord.__slots__)
+    reject_unscorable(columns, RESP_FEATURES)
+    return ResponseClass({"predictions": predict_resp_batch(columns).tolist()})
 
 
-@app.post("/offer/assign")
-async def assign_offer_ep(prediction: Prediction):
-    return get_offer(prediction)
+@app.post("/offer/assign_batch", openapi_extra=body_schema(Prediction, many=True))
+async def assign_offer_batch_ep(request: Request):
+    predictions = await read_body(request, PredictionRecord, many=True)
+    columns = to_columns(predictions, PredictionRecord.__slots__)
+    return ResponseClass({"offers": get_offer_batch(columns).tolist()})
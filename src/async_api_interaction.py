@@ -0,0 +1,273 @@
+import asyncio
+import contextvars
+import functools
+import os
+import logging
+
+from .api_client import create_async_client
+from .api_interaction import combine_predictions
+from .data_processing import read_member_data, create_member_features, build_member_feature_table
+from .instrumentation import timed
+from .log_sampling import log_member, batch_logged
+from .member_features import MemberFeatures
+from .records import MemberFeaturesRecord, PredictionRecord
+
+
+async def run_in_thread(function, *args, **kwargs):
+    """
+    Run a blocking function in the default executor, so that it does not block the event loop (asyncio.to_thread, which needs Python 3.9).
+    The current context is copied, so that the spans of the function are nested in the span of the caller
+
+    Parameters:
+    - function (callable): function to run
+    - args, kwargs: arguments of the function
+
+    Returns
+    - the value returned by the function
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(context.run, function, *args, **kwargs))
+
+@timed
+async def post_ep_async(client, path, payload, result_key, member_id):
+    """
+    POST a JSON payload to one of the endpoints without blocking the event loop
+
+    Parameters:
+    - client (httpx.AsyncClient): client to send the request with
+    - path (str): path of the endpoint
+    - payload (dict): JSON-serializable body of the request
+    - result_key (str): key of the result in the response
+    - member_id (str): member_id the request is sent for (used for logging)
+
+    Returns
+    - result (float or str or None): the result returned by the endpoint
+    - latency (float): time taken to process the function
+    """
+    log_member(member_id, 'Sending POST request to %s with member_id %s', path, member_id)
+
+    response = await client.post(path, json=payload)
+
+    if response.status_code == 200:
+        result = response.json()
+        log_member(member_id, "Result of %s for member %s: %s", path, member_id, result[result_key])
+        return result[result_key]
+    else:
+        logging.error("Error: %s - %s", response.status_code, response.text)
+        return None
+
+async def score_member_async(member_id, member_features, client):
+    """
+    Get the ATS and RESP predictions of a member concurrently, then the offer once both are available
+
+    Parameters:
+    - member_id (str): member_id to score
+    - member_features (MemberFeatures): an object of MemberFeatures including the transformed member data
+    - client (httpx.AsyncClient): client to send the requests with
+
+    Returns
+    - result (dict): the predictions and the offer of the member, and the latency of each endpoint call
+    """
+    member_features_dict = MemberFeaturesRecord.dump(member_features)
+
+    # the two predictions are independent, so both requests are in flight at the same time
+    (prediction_ats_ep_output, prediction_ats_ep_latency), (prediction_resp_ep_output, prediction_resp_ep_latency) = await asyncio.gather(
+        post_ep_async(client, "/ml/ats/predict", member_features_dict, 'prediction', member_id),
+        post_ep_async(client, "/ml/resp/predict", member_features_dict, 'prediction', member_id)
+    )
+
+    offer_ep_output, offer_ep_latency = None, 0
+    if prediction_ats_ep_output is not None and prediction_resp_ep_output is not None:
+        combine_pred = combine_predictions(prediction_ats_ep_output, prediction_resp_ep_output)
+        offer_ep_output, offer_ep_latency = await post_ep_async(client, "/offer/assign", PredictionRecord.dump(combine_pred), 'offer', member_id)
+
+    return {
+        "predict_ats_ep": prediction_ats_ep_output,
+        "predict_resp_ep": prediction_resp_ep_output,
+        "offer_ep": offer_ep_output,
+        "latencies": {
+            "prediction_ats_ep_latency": prediction_ats_ep_latency,
+            "prediction_resp_ep_latency": prediction_resp_ep_latency,
+            "offer_ep_latency": offer_ep_latency
+        }
+    }
+
+async def summarize_async(member_id, dataset_file_path, client = None, as_of = None):
+    """
+    Asyncio version of api_interaction.summarize: the ATS and RESP requests run concurrently and the offer request is chained after both
+
+    Parameters:
+    - member_id (str): member_id for which to calculate the average points bought
+    - dataset_file_path (str): path to the complete dataset
+    - client (httpx.AsyncClient): client to send the requests with (a new client from create_async_client if None)
+    - as_of (str or datetime or pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at, in UTC (the current UTC time if None)
+
+    Returns
+    - result (dict): same format as api_interaction.summarize
+    """
+    log_member(member_id, 'Summarizing data for member_id %s with dataset_file_path %s', member_id, dataset_file_path)
+
+    # reading the dataset and computing the features block, so they run in a worker thread instead of the event loop
+    member_data, read_data_latency = await run_in_thread(read_member_data, dataset_file_path)
+    member_features, member_features_latency = await run_in_thread(create_member_features, member_data, member_id, as_of = as_of)
+
+    if client is None:
+        async with create_async_client() as client:
+            scores = await score_member_async(member_id, member_features, client)
+    else:
+        scores = await score_member_async(member_id, member_features, client)
+
+    res = {
+        "member_id": member_id,
+        "member_features": member_features,
+        "predict_ats_ep": scores["predict_ats_ep"],
+        "predict_resp_ep": scores["predict_resp_ep"],
+        "offer_ep": scores["offer_ep"],
+        "latencies": {
+            "read_data_latency": read_data_latency,
+            "member_features_latency": member_features_latency,
+            **scores["latencies"]
+        }
+    }
+
+    log_member(member_id, 'Summarization completed for member_id %s', member_id)
+
+    return res
+
+@timed
+async def score_members_async(member_ids, member_data, feature_table, concurrency, client):
+    """
+    Score the members of summarize_many_async with concurrency workers fed by a bounded queue
+
+    Parameters:
+    - member_ids (list): list of member_ids to score
+    - member_data (pd.DataFrame): the complete dataset
+    - feature_table (pd.DataFrame): features of every member in the dataset (see build_member_feature_table)
+    - concurrency (int): maximum number of members being scored at the same time
+    - client (httpx.AsyncClient): client to send the requests with (a new client if None, see summarize_many_async)
+
+    Returns
+    - results (list): result of each member, in the order of member_ids
+    - latency (float): time taken to process the function
+    """
+    results = [None] * len(member_ids)
+    # members without transactions have no features to score, so they are not sent to the endpoints (same as summarize_batch)
+    scorable = [index for index, member_id in enumerate(member_ids) if member_id in feature_table.index]
+    for index in set(range(len(member_ids))).difference(scorable):
+        results[index] = {
+            "member_id": member_ids[index],
+            "member_features": MemberFeatures(**dict.fromkeys(MemberFeatures.model_fields)),
+            "predict_ats_ep": None,
+            "predict_resp_ep": None,
+            "offer_ep": None,
+            "latencies": {
+                "member_features_latency": {"transform_features_latency": 0},
+                "prediction_ats_ep_latency": 0,
+                "prediction_resp_ep_latency": 0,
+                "offer_ep_latency": 0
+            }
+        }
+    if len(scorable) < len(member_ids):
+        logging.warning('No transactions for %s of the %s members. They are not scored.', len(member_ids) - len(scorable), len(member_ids))
+
+    # positions of the members left to score; None tells a worker to stop
+    queue = asyncio.Queue(maxsize = concurrency)
+    workers = min(concurrency, len(scorable))
+
+    async def enqueue_members():
+        for index in scorable:
+            await queue.put(index)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def summarize_members(client):
+        while (index := await queue.get()) is not None:
+            member_id = member_ids[index]
+            member_features, member_features_latency = create_member_features(member_data, member_id, feature_table = feature_table)
+            scores = await score_member_async(member_id, member_features, client)
+            results[index] = {
+                "member_id": member_id,
+                "member_features": member_features,
+                "predict_ats_ep": scores["predict_ats_ep"],
+                "predict_resp_ep": scores["predict_resp_ep"],
+                "offer_ep": scores["offer_ep"],
+                "latencies": {
+                    "member_features_latency": member_features_latency,
+                    **scores["latencies"]
+                }
+            }
+
+    if client is None:
+        # each member has up to two requests in flight
+        async with create_async_client(pool_size = concurrency * 2) as client:
+            await asyncio.gather(enqueue_members(), *(summarize_members(client) for _ in range(workers)))
+    else:
+        await asyncio.gather(enqueue_members(), *(summarize_members(client) for _ in range(workers)))
+
+    return results
+
+@batch_logged
+async def summarize_many_async(member_ids, dataset_file_path, concurrency = 10, client = None, as_of = None):
+    """
+    Score many members concurrently: load the dataset and compute the features once, in a worker thread, then run the pipeline of the members
+    with concurrency workers fed by a bounded queue, so that there are at most concurrency members being scored at the same time
+
+    Parameters:
+    - member_ids (list or str): list of member_ids to score, or "all" to score every member in the dataset
+    - dataset_file_path (str): path to the complete dataset
+    - concurrency (int): maximum number of members being scored at the same time
+    - client (httpx.AsyncClient): client to send the requests with (a new client from create_async_client with a pool of concurrency * 2 connections if None)
+    - as_of (str or datetime or pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at for all the members, in UTC
+      (the time the batch starts if None)
+
+    Returns
+    - result (dict): same format as api_interaction.summarize_batch
+    """
+    logging.info('Summarizing data for a batch of members with dataset_file_path %s', dataset_file_path)
+
+    # reading the dataset and building the feature table block, so they run in a worker thread instead of the event loop
+    member_data, read_data_latency = await run_in_thread(read_member_data, dataset_file_path)
+    feature_table, feature_table_latency = await run_in_thread(build_member_feature_table, member_data, as_of = as_of)
+
+    if isinstance(member_ids, str) and member_ids == "all":
+        member_ids = feature_table.index.tolist()
+
+    results, scoring_latency = await score_members_async(member_ids, member_data, feature_table, concurrency, client)
+    # the total is the sum of the steps, each of them timed once
+    total_latency = read_data_latency + feature_table_latency + scoring_latency
+    throughput = len(results) / total_latency if total_latency > 0 else 0.0
+
+    res = {
+        "results": results,
+        "member_count": len(results),
+        "throughput": throughput,
+        "latencies": {
+            "read_data_latency": read_data_latency,
+            "feature_table_latency": feature_table_latency,
+            "scoring_latency": scoring_latency,
+            "total_latency": total_latency
+        }
+    }
+
+    logging.info('Batch summarization completed for %s members. Throughput: %s members/sec', len(results), throughput)
+
+    return res
+
+if __name__ == "__main__":
+    # get current directory
+    path = os.getcwd()
+
+    file_name = '/member_data.csv'
+
+    # get the path to the dataset file
+    file_path = path + file_name
+
+    # specify a member_id for testing, several comma-separated member_ids, or "all"
+    test_member_id = input("Please enter member_id: ")
+
+    if test_member_id == "all" or "," in test_member_id:
+        member_ids = "all" if test_member_id == "all" else [member_id.strip() for member_id in test_member_id.split(",")]
+        predict_output = asyncio.run(summarize_many_async(member_ids, file_path))
+    else:
+        predict_output = asyncio.run(summarize_async(test_member_id, file_path))
+    print("predict output and latencies: ", predict_output)
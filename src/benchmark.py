@@ -0,0 +1,431 @@
+import os
+import sys
+import time
+import json
+import logging
+import itertools
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+
+from .app import app
+from .data_processing import read_member_data, build_member_feature_table, create_member_features
+from .excel import excel_save, excel_save_batch
+from .instrumentation import instrumented, timed
+from .prediction_ep import Prediction
+
+# benchmarks run by default, in order
+BENCHMARKS = ['read', 'features', 'endpoints', 'excel', 'schema']
+
+
+class InProcessApiClient:
+    """
+    Stand-in for ApiClient that sends the requests to the app in-process through a FastAPI TestClient, so that the client-side pipeline
+    (summarize, excel_save) can be benchmarked without a running server
+    """
+    def __init__(self):
+        self.client = TestClient(app)
+
+    def url(self, path):
+        return path
+
+    def post(self, path, payload):
+        return self.client.post(path, json=payload)
+
+@timed
+def generate_member_data(file_path, rows = 10000, members = 1000, skew = 0.0, missing_rate = 0.02, seed = 0, chunksize = 1000000):
+    """
+    Write a synthetic member data csv file with the same schema and value ranges as member_data.csv, chunksize rows at a time so that
+    files much larger than memory can be generated
+
+    Parameters:
+    - file_path (str): path of the csv file (overwritten)
+    - rows (int): number of transactions
+    - members (int): number of distinct member_ids the transactions are drawn from
+    - skew (float): exponent of the Zipf-like distribution of the transactions over the members (0 for uniform, larger for a few heavy members)
+    - missing_rate (float): fraction of the transactions with every value but the memberId missing, as in member_data.csv
+    - seed (int): seed of the random generator, the same seed and chunksize give the same file
+    - chunksize (int): number of rows generated and written at a time
+
+    Returns:
+    - rows (int): number of transactions written
+    - latency (float): time taken to process the function
+    """
+    rng = np.random.default_rng(seed)
+
+    # distinct 8 hex digit member_ids, like the dataset's (an odd multiplier is a bijection modulo 2**32)
+    member_ids = pd.Series((np.arange(1, members + 1, dtype=np.uint64) * np.uint64(2654435761) + np.uint64(seed)) % np.uint64(2 ** 32)).map('{:08X}'.format).to_numpy()
+    weights = 1 / np.arange(1, members + 1) ** skew
+    weights /= weights.sum()
+
+    start_ts = int(pd.Timestamp('2019-01-01').timestamp())
+    end_ts = int(pd.Timestamp('2024-01-01').timestamp())
+    transaction_types = np.array(['buy', 'gift', 'redeem'])
+
+    for chunk_start in range(0, rows, chunksize):
+        size = min(chunksize, rows - chunk_start)
+        transaction_type = transaction_types[rng.integers(0, 3, size)]
+        redeem = transaction_type == 'redeem'
+        points = rng.integers(1, 101, size) * 100
+        revenue = np.clip(rng.exponential(9.0, size), 0.05, 99.0).round(2)
+
+        chunk = pd.DataFrame({
+            'memberId': member_ids[rng.choice(members, size, p=weights)],
+            'lastTransatcionUtcTs': pd.to_datetime(rng.integers(start_ts, end_ts, size), unit='s'),
+            'lastTransactionType': transaction_type,
+            'lastTransactionPointsBought': np.where(redeem, -points, points).astype(np.float64),
+            'lastTransactionRevenueUSD': np.where(redeem, 0.0, revenue)
+        })
+        missing = rng.random(size) < missing_rate
+        chunk.loc[missing, ['lastTransatcionUtcTs', 'lastTransactionType', 'lastTransactionPointsBought', 'lastTransactionRevenueUSD']] = None
+
+        chunk.to_csv(file_path, mode='w' if chunk_start == 0 else 'a', header=chunk_start == 0, index=False, date_format='%Y-%m-%d %H:%M:%S')
+
+    logging.info('Generated %s transactions of %s members in %s', rows, members, file_path)
+
+    return rows
+
+def time_call(function, repeat):
+    """
+    Time a function over several runs
+
+    Parameters:
+    - function (callable): function to call without arguments
+    - repeat (int): number of runs
+
+    Returns:
+    - float: best (minimum) time of a run in seconds
+    """
+    return min(time_calls(function, repeat))
+
+def time_calls(function, repeat):
+    """
+    Time each of several runs of a function
+
+    Parameters:
+    - function (callable): function to call without arguments
+    - repeat (int): number of runs
+
+    Returns:
+    - list: time of each run in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+    return timings
+
+def peak_memory(function):
+    """
+    Measure the peak memory allocated while running a function once (in a separate run, since tracing the allocations slows the function down)
+
+    Parameters:
+    - function (callable): function to call without arguments
+
+    Returns:
+    - int: peak number of bytes allocated by the function
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def summarize_timings(timings, items = 1, memory = None):
+    """
+    Summarize the timings of a benchmark
+
+    Parameters:
+    - timings (list): time of each call in seconds
+    - items (int): number of items (rows, members, requests) processed by each call
+    - memory (int): peak memory of a call in bytes
+
+    Returns:
+    - dict: number of calls, throughput in items per second over all the calls, latency percentiles in seconds, and the peak memory
+    """
+    timings = np.asarray(timings, dtype=np.float64)
+    return {
+        'calls': len(timings),
+        'items_per_call': items,
+        'throughput': float(items * len(timings) / timings.sum()) if timings.sum() > 0 else None,
+        'latency': {
+            'mean': float(timings.mean()),
+            'min': float(timings.min()),
+            'p50': float(np.percentile(timings, 50)),
+            'p95': float(np.percentile(timings, 95)),
+            'p99': float(np.percentile(timings, 99)),
+            'max': float(timings.max())
+        },
+        'peak_memory_bytes': memory
+    }
+
+def benchmark_read_member_data(file_path, repeat = 5):
+    """
+    Benchmark reading and cleaning the dataset, with the default and the typed schema
+
+    Parameters:
+    - file_path (str): path to the member data csv file
+    - repeat (int): number of runs
+
+    Returns:
+    - dict: summary of the timings for each schema (throughput in rows per second)
+    """
+    rows = len(read_member_data(file_path)[0])
+    return {
+        f'read_member_data{suffix}': summarize_timings(
+            time_calls(lambda: read_member_data(file_path, typed = typed), repeat), rows, peak_memory(lambda: read_member_data(file_path, typed = typed))
+        )
+        for suffix, typed in [('', False), ('_typed', True)]
+    }
+
+def benchmark_member_features(member_data, member_ids, repeat = 5):
+    """
+    Benchmark the features: the feature table of every member in one pass, and create_member_features for a sample of members on their own
+
+    Parameters:
+    - member_data (pd.DataFrame): member data
+    - member_ids (list): sample of member_ids to compute the features of one by one
+    - repeat (int): number of runs of the feature table
+
+    Returns:
+    - dict: summary of the timings of each step (throughput in members per second)
+    """
+    members = len(build_member_feature_table(member_data)[0])
+    return {
+        'build_member_feature_table': summarize_timings(
+            time_calls(lambda: build_member_feature_table(member_data), repeat), members, peak_memory(lambda: build_member_feature_table(member_data))
+        ),
+        'create_member_features': summarize_timings(
+            [time_call(lambda: create_member_features(member_data, member_id), 1) for member_id in member_ids], 1,
+            peak_memory(lambda: create_member_features(member_data, member_ids[0]))
+        )
+    }
+
+def benchmark_endpoints(member_features_list):
+    """
+    Benchmark the endpoints of the app through an in-process client: one request per member on the single-member endpoints, and one request
+    for all the members on the batch endpoints
+
+    Parameters:
+    - member_features_list (list): MemberFeatures of a sample of members
+
+    Returns:
+    - dict: summary of the timings of each endpoint (throughput in members per second)
+    """
+    client = TestClient(app)
+    payloads = [member_features.model_dump() for member_features in member_features_list]
+    predictions = [Prediction(**client.post('/score', json=payload).json()).model_dump() for payload in payloads]
+
+    report = {}
+    for path, path_payloads in [('/ml/ats/predict', payloads), ('/ml/resp/predict', payloads), ('/offer/assign', predictions), ('/score', payloads)]:
+        report[path] = summarize_timings(
+            [time_call(lambda: client.post(path, json=payload), 1) for payload in path_payloads], 1, peak_memory(lambda: client.post(path, json=path_payloads[0]))
+        )
+    for path, batch_payload in [('/ml/ats/predict_batch', payloads), ('/ml/resp/predict_batch', payloads), ('/offer/assign_batch', predictions)]:
+        report[path] = summarize_timings(
+            [time_call(lambda: client.post(path, json=batch_payload), 1)], len(batch_payload), peak_memory(lambda: client.post(path, json=batch_payload))
+        )
+    return report
+
+def benchmark_excel_save(file_path, member_ids):
+    """
+    Benchmark saving the results to excel, scoring through an in-process client: excel_save for each member of a sample (each call rewrites
+    the workbook), and excel_save_batch for all of them at once. The workbooks are written to a temporary directory
+
+    Parameters:
+    - file_path (str): path to the member data csv file
+    - member_ids (list): sample of member_ids to save
+
+    Returns:
+    - dict: summary of the timings of each function (throughput in members per second)
+    """
+    client = InProcessApiClient()
+    file_path = os.path.abspath(file_path)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # excel_save writes to the current directory
+        os.chdir(tmp_dir)
+        try:
+            excel_save_timings = [time_call(lambda: excel_save(member_id, file_path, client = client), 1) for member_id in member_ids]
+            excel_save_batch_timings = time_calls(lambda: excel_save_batch(member_ids, file_path, xlsx_path = 'batch.xlsx', client = client), 1)
+            excel_save_memory = peak_memory(lambda: excel_save(member_ids[0], file_path, client = client))
+            excel_save_batch_memory = peak_memory(lambda: excel_save_batch(member_ids, file_path, xlsx_path = 'batch.xlsx', client = client))
+        finally:
+            os.chdir(cwd)
+    return {
+        'excel_save': summarize_timings(excel_save_timings, 1, excel_save_memory),
+        'excel_save_batch': summarize_timings(excel_save_batch_timings, len(member_ids), excel_save_batch_memory)
+    }
+
+def benchmark_member_data_schema(file_path, repeat = 5):
+    """
+    Compare the default member data schema (object strings) with the typed schema (categories, datetime64, narrow integers):
+    resident memory, and the time to sort the transactions by member and timestamp and to build the feature table
+
+    Parameters:
+    - file_path (str): path to the member data csv file
+    - repeat (int): number of runs of each timed step (the best run is reported)
+
+    Returns:
+    - dict: memory in bytes and times in seconds for each schema
+    """
+    report = {}
+    for schema, typed in [('default', False), ('typed', True)]:
+        member_data, _ = read_member_data(file_path, typed = typed)
+        report[schema] = {
+            'rows': len(member_data),
+            'memory_bytes': int(member_data.memory_usage(deep=True).sum()),
+            'read_seconds': time_call(lambda: read_member_data(file_path, typed = typed), repeat),
+            'sort_seconds': time_call(lambda: member_data.sort_values(by=['memberId', 'lastTransatcionUtcTs'], ascending=[True, False], kind='mergesort'), repeat),
+            'feature_table_seconds': time_call(lambda: build_member_feature_table(member_data), repeat)
+        }
+
+    logging.info('Benchmarked member data schemas for %s', file_path)
+
+    return report
+
+def git_commit():
+    """
+    Return the current git commit of the repository, if any
+
+    Returns:
+    - str or None: commit hash
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def count_rows(file_path, chunksize = 1000000):
+    """
+    Count the rows of a csv file, reading one column chunksize rows at a time so that the file never has to fit in memory
+
+    Parameters:
+    - file_path (str): path to the csv file
+    - chunksize (int): number of rows read at a time
+
+    Returns:
+    - int: number of rows, without the header
+    """
+    return sum(len(chunk) for chunk in pd.read_csv(file_path, usecols=[0], chunksize=chunksize))
+
+def copy_head(file_path, head_file_path, rows):
+    """
+    Copy the header and the first rows of a csv file to another file, line by line
+
+    Parameters:
+    - file_path (str): path to the csv file
+    - head_file_path (str): path of the copy (overwritten)
+    - rows (int): number of rows to copy
+    """
+    with open(file_path) as source, open(head_file_path, 'w') as head:
+        head.writelines(itertools.islice(source, rows + 1))
+
+@instrumented
+def run_benchmarks(file_path, benchmarks = BENCHMARKS, repeat = 5, sample = 100, seed = 0, max_rows = 1000000):
+    """
+    Run benchmarks of the scoring pipeline on a member data csv file and collect the results in a report.
+    The benchmarks load the whole file in memory, so a file of more than max_rows rows is benchmarked on its first max_rows rows
+
+    Parameters:
+    - file_path (str): path to the member data csv file
+    - benchmarks (list): benchmarks to run, among BENCHMARKS
+    - repeat (int): number of runs of the whole-dataset steps
+    - sample (int): number of members benchmarked one by one (create_member_features, the endpoints, excel_save)
+    - seed (int): seed of the random sample of members
+    - max_rows (int): maximum number of rows benchmarked (all the rows if None)
+
+    Returns:
+    - dict: report with the environment, the dataset and the results of each benchmark
+    """
+    rows = count_rows(file_path)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        benchmark_file_path = file_path
+        if max_rows is not None and rows > max_rows:
+            logging.warning('%s has %s rows, the benchmarks run on the first %s rows', file_path, rows, max_rows)
+            benchmark_file_path = os.path.join(tmp_dir, 'member_data.csv')
+            copy_head(file_path, benchmark_file_path, max_rows)
+
+        member_data, _ = read_member_data(benchmark_file_path)
+        all_member_ids = member_data['memberId'].dropna().unique()
+        member_ids = np.random.default_rng(seed).choice(all_member_ids, min(sample, len(all_member_ids)), replace=False).tolist()
+
+        results = {}
+        if 'read' in benchmarks:
+            results.update(benchmark_read_member_data(benchmark_file_path, repeat))
+        if 'features' in benchmarks:
+            results.update(benchmark_member_features(member_data, member_ids, repeat))
+        if 'endpoints' in benchmarks:
+            feature_table, _ = build_member_feature_table(member_data)
+            results.update(benchmark_endpoints([create_member_features(member_data, member_id, feature_table = feature_table)[0] for member_id in member_ids]))
+        if 'excel' in benchmarks:
+            results.update(benchmark_excel_save(benchmark_file_path, member_ids))
+        if 'schema' in benchmarks:
+            results['schema'] = benchmark_member_data_schema(benchmark_file_path, repeat)
+
+    report = {
+        'environment': {
+            'created_at': datetime.utcnow().isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'dataset': {
+            'path': os.path.abspath(file_path),
+            'size_bytes': os.path.getsize(file_path),
+            'rows': rows,
+            'benchmarked_rows': len(member_data),
+            'members': len(all_member_ids)
+        },
+        'parameters': {'benchmarks': list(benchmarks), 'repeat': repeat, 'sample': len(member_ids), 'seed': seed, 'max_rows': max_rows},
+        'results': results
+    }
+
+    logging.info('Ran benchmarks %s on %s', list(benchmarks), file_path)
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the scoring pipeline on a member data csv file, generated unless --dataset is given')
+    parser.add_argument('--dataset', help='path to an existing member data csv file')
+    parser.add_argument('--rows', type=int, default=10000, help='number of transactions of the generated dataset')
+    parser.add_argument('--members', type=int, default=1000, help='number of members of the generated dataset')
+    parser.add_argument('--skew', type=float, default=0.0, help='skew of the transactions over the members of the generated dataset (0 for uniform)')
+    parser.add_argument('--missing-rate', type=float, default=0.02, help='fraction of the generated transactions with missing values')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated dataset and of the sample of members')
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=BENCHMARKS, help='benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs of the whole-dataset steps')
+    parser.add_argument('--sample', type=int, default=100, help='number of members benchmarked one by one')
+    parser.add_argument('--max-rows', type=int, default=1000000, help='maximum number of rows benchmarked, the first rows of a larger dataset')
+    parser.add_argument('--output', help='path of the JSON report (printed if not given)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset = args.dataset
+        if dataset is None:
+            dataset = os.path.join(tmp_dir, 'member_data.csv')
+            generate_member_data(dataset, rows = args.rows, members = args.members, skew = args.skew, missing_rate = args.missing_rate, seed = args.seed)
+
+        report = run_benchmarks(dataset, benchmarks = args.benchmarks, repeat = args.repeat, sample = args.sample, seed = args.seed, max_rows = args.max_rows)
+        if args.dataset is None:
+            report['dataset'].update({'generated': True, 'skew': args.skew, 'missing_rate': args.missing_rate})
+
+    report_json = json.dumps(report, indent=4, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report_json + '\n')
+    else:
+        sys.stdout.write(report_json + '\n')
@@ -0,0 +1,114 @@
+import time
+import threading
+from collections import OrderedDict
+
+from .data_processing import dataset_fingerprint, as_of_timestamp
+
+
+class LRUCache:
+    """
+    Bounded in-memory cache with least-recently-used eviction and an optional time-to-live, counting its hits and misses.
+    It is safe to share between threads
+    """
+    def __init__(self, maxsize = 1024, ttl = None):
+        """
+        Parameters:
+        - maxsize (int): maximum number of entries, the least recently used entry is evicted beyond it
+        - ttl (float): number of seconds an entry stays valid after it is stored (no expiry if None)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Look up an entry
+
+        Parameters:
+        - key (hashable): key of the entry
+
+        Returns:
+        - found (bool): whether a valid entry was found
+        - value: the value of the entry (None if not found)
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value):
+        """
+        Store an entry, evicting the least recently used entries if the cache is full
+
+        Parameters:
+        - key (hashable): key of the entry
+        - value: value of the entry
+        """
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all the entries (the counters are kept)
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Return the counters of the cache
+
+        Returns:
+        - dict: number of hits, misses and evictions, and current number of entries
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self.entries)}
+
+def version_as_of(as_of = None):
+    """
+    Time the cached features are computed at: as_of, or without it the UTC midnight of the current date, so that the features of a version
+    are computed at the same time for the whole day (DAYS_SINCE_LAST_TRANSACTION computed at the current time would change during the day,
+    at the time of day of each member's last transaction)
+
+    Parameters:
+    - as_of (str or datetime or pd.Timestamp): time to compute the features at, in UTC (see data_processing.as_of_timestamp)
+
+    Returns:
+    - pd.Timestamp: the time to compute the cached features at, and to version them with
+    """
+    if as_of is None:
+        return as_of_timestamp().normalize()
+    return as_of_timestamp(as_of)
+
+def data_version(dataset_file_path, as_of = None):
+    """
+    Version of the data the features of a member are computed from: the fingerprint of the dataset file and the time the features are
+    computed at; without an as_of time, the UTC midnight of the current date (see version_as_of), since DAYS_SINCE_LAST_TRANSACTION changes
+    every day even when the file does not
+
+    Parameters:
+    - dataset_file_path (str): path to the complete dataset
+    - as_of (str or datetime or pd.Timestamp): time the features are computed at, in UTC (see data_processing.as_of_timestamp)
+
+    Returns:
+    - tuple: version that changes whenever the cached features or predictions may have changed
+    """
+    return (dataset_fingerprint(dataset_file_path), version_as_of(as_of).isoformat())
@@ -1,195 +1,622 @@
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
 import datetime
 from datetime import datetime
-import time
 
 import os
 import logging
 
+from .instrumentation import timed
+from .log_sampling import log_member
 from .member_features import MemberFeatures
 
-def read_member_data(file_path):
+class IndexedMemberData:
     """
-    Read member data from csv file
+    Member data sorted by (memberId, lastTransatcionUtcTs descending) with a memberId -> (start, stop) row offset index,
+    so the transactions of a member are a contiguous slice instead of a boolean mask over the whole dataset
+    """
+    def __init__(self, member_data):
+        self.data = member_data.sort_values(by=['memberId', 'lastTransatcionUtcTs'], ascending=[True, False], kind='mergesort').reset_index(drop=True)
+
+        # rows of the same member are contiguous after sorting, so a group starts wherever the member code changes
+        codes, uniques = pd.factorize(self.data['memberId'])
+        boundaries = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate(([0], boundaries)).tolist()
+        stops = np.concatenate((boundaries, [len(codes)])).tolist()
+        member_ids = uniques.tolist()
+
+        # rows with a missing memberId get code -1 and are not indexed
+        self.offsets = {member_ids[codes[start]]: (start, stop) for start, stop in zip(starts, stops) if len(codes) > 0 and codes[start] >= 0}
+
+    def __len__(self):
+        return len(self.data)
+
+    def transactions(self, member_id):
+        """
+        Return the transactions of a member, most recent first, as a slice of the sorted data
+
+        Parameters:
+        - member_id (str): member_id for which to return the transactions
+
+        Returns:
+        - pd.DataFrame: the member's transactions (empty if the member has none)
+        """
+        start, stop = self.offsets.get(member_id, (0, 0))
+        return self.data.iloc[start:stop]
+
+@timed
+def index_member_data(member_data):
+    """
+    Sort member data once and build the memberId offset index over it
 
     Parameters:
-    - file_path (str): path to the csv file
+    - member_data (pd.DataFrame): input DataFrame including the member data
 
     Returns:
-    - pd.DataFrame: DataFrame containing member data
+    - IndexedMemberData: the sorted member data and its memberId index
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
-    member_data = pd.read_csv(file_path)
+    indexed_member_data = IndexedMemberData(member_data)
+
+    logging.info('Indexed %s members', len(indexed_member_data.offsets))
+
+    return indexed_member_data
+
+def filter_member_transactions(member_data, member_id):
+    """
+    Return the transactions of a specific member
+
+    Parameters:
+    - member_data (pd.DataFrame or IndexedMemberData): input member data
+    - member_id (str): member_id for which to return the transactions
+
+    Returns:
+    - pd.DataFrame: the member's transactions (sorted most recent first if member_data is indexed)
+    """
+    if isinstance(member_data, IndexedMemberData):
+        return member_data.transactions(member_id)
+    return member_data[member_data['memberId'] == member_id]
+
+# timestamp of the transactions already ranked by most_recent_ranks (missing timestamps rank just after the oldest ones)
+RANKED = np.iinfo(np.int64).min
+
+def transaction_timestamps(transactions):
+    """
+    Return the timestamps of transactions as int64 nanoseconds, from "%Y-%m-%d %H:%M:%S" strings or datetime64 values
+
+    Parameters:
+    - transactions (pd.DataFrame): transactions with a lastTransatcionUtcTs column
+
+    Returns:
+    - np.ndarray: int64 timestamps, with missing timestamps older than any other
+    """
+    timestamps = pd.to_datetime(transactions['lastTransatcionUtcTs'], format="%Y-%m-%d %H:%M:%S").to_numpy(dtype='datetime64[ns]').view(np.int64)
+    return np.where(timestamps == RANKED, RANKED + 1, timestamps)
+
+def most_recent_ranks(group_codes, timestamps, n, groups):
+    """
+    Rank the n most recent transactions of every group without sorting the transactions: each pass picks the latest transaction left
+    in every group at once (np.maximum.at), so the cost grows with n rather than with the size of the data or of the largest group.
+    Transactions with the same timestamp are ranked in the order of the rows, like a stable sort
+
+    Parameters:
+    - group_codes (np.ndarray): group of each transaction, from 0 to groups - 1 (e.g., the codes of pd.factorize), -1 for no group
+    - timestamps (np.ndarray): int64 timestamps of the transactions (see transaction_timestamps)
+    - n (int): number of transactions to rank in each group
+    - groups (int): number of groups
+
+    Returns:
+    - ranks (np.ndarray): recency rank of each transaction within its group (0 for the most recent), n for the other transactions
+    - latest (np.ndarray): timestamp of the most recent transaction of each group (RANKED for empty groups)
+    """
+    ranks = np.full(len(timestamps), n)
+    latest = np.full(groups, RANKED)
+    remaining = np.where(group_codes >= 0, timestamps, RANKED)
+    # transactions without a group are collected in an extra group that is never ranked
+    group_codes = np.where(group_codes >= 0, group_codes, groups)
+
+    for rank in range(n):
+        group_latest = np.full(groups + 1, RANKED)
+        np.maximum.at(group_latest, group_codes, remaining)
+        if rank == 0:
+            latest = group_latest[:groups]
+
+        candidates = np.flatnonzero((remaining == group_latest[group_codes]) & (remaining != RANKED))
+        if len(candidates) == 0:
+            break
+        # the first row of each group among the candidates is the next most recent transaction
+        first = np.full(groups + 1, len(timestamps))
+        np.minimum.at(first, group_codes[candidates], candidates)
+        picked = first[first < len(timestamps)]
+
+        ranks[picked] = rank
+        remaining[picked] = RANKED
+
+    return ranks, latest
+
+def most_recent_transactions(member_transactions, n, is_sorted = False):
+    """
+    Return the n most recent transactions of a member, most recent first, without sorting all of the member's transactions
+    (see most_recent_ranks). Transactions with the same timestamp are taken in the order of the rows, like a stable sort
+
+    Parameters:
+    - member_transactions (pd.DataFrame): transactions of a member
+    - n (int): number of transactions to return
+    - is_sorted (bool): if True, the transactions are already sorted most recent first (e.g., a slice of IndexedMemberData)
+
+    Returns:
+    - pd.DataFrame: the n most recent transactions (all of them if there are fewer than n)
+    """
+    if is_sorted:
+        return member_transactions.head(n)
+
+    ranks, _ = most_recent_ranks(np.zeros(len(member_transactions), dtype=np.intp), transaction_timestamps(member_transactions), n, 1)
+    candidates = np.flatnonzero(ranks < n)
+    return member_transactions.iloc[candidates[np.argsort(ranks[candidates])]]
+
+def clean_member_data(member_data):
+    """
+    Handle the missing values of the member data (in place)
 
+    Parameters:
+    - member_data (pd.DataFrame): raw member data, as read from the csv file
+
+    Returns:
+    - pd.DataFrame: the same DataFrame with the missing values filled
+    """
     member_data['lastTransactionPointsBought'] = member_data['lastTransactionPointsBought'].fillna(0)
     member_data['lastTransactionRevenueUSD'] = member_data['lastTransactionRevenueUSD'].fillna(0)
     member_data['lastTransactionType'] = member_data['lastTransactionType'].fillna('')
     member_data['lastTransatcionUtcTs'] = member_data['lastTransatcionUtcTs'].fillna('1990-01-01 00:00:00')
+    return member_data
+
+def to_typed_member_data(member_data):
+    """
+    Convert cleaned member data to a compact typed schema: categories for memberId and lastTransactionType, datetime64 for
+    lastTransatcionUtcTs, and int32 for lastTransactionPointsBought when all the points are whole numbers. lastTransactionRevenueUSD
+    stays float64, since float32 revenues change some of the rounded averages
+
+    Parameters:
+    - member_data (pd.DataFrame): member data with the missing values handled (see clean_member_data)
+
+    Returns:
+    - pd.DataFrame: the member data with the typed schema
+    """
+    points = member_data['lastTransactionPointsBought']
+    if len(points) == 0 or ((points % 1 == 0).all() and points.abs().max() <= np.iinfo(np.int32).max):
+        points = points.astype(np.int32)
+
+    return pd.DataFrame({
+        'memberId': member_data['memberId'].astype('category'),
+        'lastTransatcionUtcTs': pd.to_datetime(member_data['lastTransatcionUtcTs'], format="%Y-%m-%d %H:%M:%S"),
+        'lastTransactionType': member_data['lastTransactionType'].astype('category'),
+        'lastTransactionPointsBought': points,
+        'lastTransactionRevenueUSD': member_data['lastTransactionRevenueUSD'].astype(np.float64)
+    })
+
+def dataset_fingerprint(file_path):
+    """
+    Identify the current version of a dataset file by its path, size and modification time
+
+    Parameters:
+    - file_path (str): path to the dataset file
+
+    Returns:
+    - str: fingerprint that changes whenever the file is modified
+    """
+    stat = os.stat(file_path)
+    return f'{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+def member_data_cache_path(file_path, typed = False):
+    """
+    Return the path of the columnar cache of a member data csv file, a hidden file next to it
+
+    Parameters:
+    - file_path (str): path to the csv file
+    - typed (bool): if True, the path of the cache of the typed member data (see to_typed_member_data)
 
-    end_time = time.time()
-    latency = end_time - start_time
+    Returns:
+    - str: path to the cache file
+    """
+    directory, file_name = os.path.split(file_path)
+    return os.path.join(directory, f'.{file_name}.typed.cache.feather' if typed else f'.{file_name}.cache.feather')
+
+def read_member_data_cache(file_path, typed = False):
+    """
+    Read the cleaned member data from the columnar cache of a csv file, if the cache was written for the current version of the file
+
+    Parameters:
+    - file_path (str): path to the csv file
+    - typed (bool): if True, read the cache of the typed member data
+
+    Returns:
+    - pd.DataFrame or None: the cached member data, or None if there is no valid cache
+    """
+    cache_path = member_data_cache_path(file_path, typed)
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        # uncompressed feather files are memory-mapped instead of read into memory
+        table = feather.read_table(cache_path, memory_map=True)
+    except (OSError, pa.ArrowException) as e:
+        logging.warning('Could not read the cache %s: %s', cache_path, e)
+        return None
 
-    logging.info(f'Read member data from {file_path}. Latency: {latency} seconds')
+    metadata = table.schema.metadata or {}
+    if metadata.get(b'dataset_fingerprint', b'').decode() != dataset_fingerprint(file_path):
+        logging.info('Cache %s is out of date with %s', cache_path, file_path)
+        return None
 
-    return member_data, latency
+    return table.to_pandas()
+
+def write_member_data_cache(file_path, member_data, typed = False):
+    """
+    Write the cleaned member data to the columnar cache of a csv file, tagged with the fingerprint of the file
+
+    Parameters:
+    - file_path (str): path to the csv file
+    - member_data (pd.DataFrame): the cleaned member data read from the file
+    - typed (bool): if True, member_data has the typed schema and is written to the cache of the typed member data
+    """
+    cache_path = member_data_cache_path(file_path, typed)
+    table = pa.Table.from_pandas(member_data, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'dataset_fingerprint': dataset_fingerprint(file_path).encode()})
+
+    try:
+        # write to a temporary file first, so that a reader never sees a partially written cache
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        feather.write_feather(table, temp_path, compression='uncompressed')
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        logging.warning('Could not write the cache %s: %s', cache_path, e)
+
+@timed
+def read_member_data(file_path, index = False, cache = False, typed = False):
+    """
+    Read member data from csv file
+
+    Parameters:
+    - file_path (str): path to the csv file
+    - index (bool): if True, sort the data and index it by memberId (see IndexedMemberData)
+    - cache (bool): if True, read the cleaned data from a columnar cache file next to the csv file, which is (re)written whenever it is
+      missing or the csv file has changed since it was written
+    - typed (bool): if True, convert the data to the compact typed schema (see to_typed_member_data)
+
+    Returns:
+    - pd.DataFrame or IndexedMemberData: DataFrame containing member data (wrapped in IndexedMemberData if index is True)
+    - latency (float): time taken to process the function
+    """
+    member_data = read_member_data_cache(file_path, typed) if cache else None
+    if member_data is None:
+        member_data = clean_member_data(pd.read_csv(file_path))
+        if typed:
+            member_data = to_typed_member_data(member_data)
+        if cache:
+            write_member_data_cache(file_path, member_data, typed)
+
+    if index:
+        member_data = IndexedMemberData(member_data)
+
+    logging.info('Read member data from %s', file_path)
+
+    return member_data
+
+
+def as_of_timestamp(as_of = None):
+    """
+    Resolve the time the DAYS_SINCE_LAST_TRANSACTION feature is computed at
+
+    Parameters:
+    - as_of (str or datetime or pd.Timestamp): time to compute the features at, in UTC (the current UTC time if None)
+
+    Returns:
+    - pd.Timestamp: the time as a timezone-naive UTC timestamp, like the transaction timestamps
+    """
+    if as_of is None:
+        return pd.Timestamp(datetime.utcnow())
+    as_of = pd.Timestamp(as_of)
+    if as_of.tzinfo is not None:
+        as_of = as_of.tz_convert('UTC').tz_localize(None)
+    return as_of
+
+def days_since(last_transaction_time, as_of):
+    """
+    Compute the number of days between the last transactions of many members and the as-of time in one vectorized operation
+
+    Parameters:
+    - last_transaction_time (pd.Series): time of the last transaction of each member, as "%Y-%m-%d %H:%M:%S" strings or datetime64 values
+    - as_of (pd.Timestamp): time to count the days to (see as_of_timestamp)
+
+    Returns:
+    - pd.Series: number of whole days since the last transaction of each member
+    """
+    return (as_of - pd.to_datetime(last_transaction_time, format="%Y-%m-%d %H:%M:%S")).dt.days
+
+# sizes of the longer LAST_n_TRANSACTIONS windows computed along with the LAST_3_TRANSACTIONS features
+EXTRA_WINDOWS = [5, 10]
+
+# columns of the feature table, in the same order as the MemberFeatures fields
+FEATURE_COLUMNS = [
+    'AVG_POINTS_BOUGHT',
+    'AVG_REVENUE_USD',
+    'LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT',
+    'LAST_3_TRANSACTIONS_AVG_REVENUE_USD',
+    'PCT_BUY_TRANSACTIONS',
+    'PCT_GIFT_TRANSACTIONS',
+    'PCT_REDEEM_TRANSACTIONS',
+    'DAYS_SINCE_LAST_TRANSACTION'
+] + [f'LAST_{window}_TRANSACTIONS_AVG_{value}' for window in EXTRA_WINDOWS for value in ['POINTS_BOUGHT', 'REVENUE_USD']]
+
+def last_n_window_averages(member_data, rank, windows, members = None):
+    """
+    Average the points and revenue of the last n transactions of every member, for several window sizes in a single groupby pass
+
+    Parameters:
+    - member_data (pd.DataFrame): transactions with a memberId, lastTransactionPointsBought and lastTransactionRevenueUSD column
+    - rank (pd.Series or np.ndarray): recency rank of each transaction within its member (0 for the most recent)
+    - windows (list): window sizes
+    - members (pd.Categorical): member of each transaction to group by (the memberId column if None)
+
+    Returns:
+    - pd.DataFrame: LAST_n_TRANSACTIONS_AVG_POINTS_BOUGHT and LAST_n_TRANSACTIONS_AVG_REVENUE_USD columns for each window, indexed by memberId
+    """
+    window_columns = {}
+    for window in windows:
+        # transactions outside of the window are masked out of the mean
+        in_window = rank < window
+        window_columns[f'LAST_{window}_TRANSACTIONS_AVG_POINTS_BOUGHT'] = member_data['lastTransactionPointsBought'].where(in_window)
+        window_columns[f'LAST_{window}_TRANSACTIONS_AVG_REVENUE_USD'] = member_data['lastTransactionRevenueUSD'].where(in_window)
+    members = member_data['memberId'] if members is None else members
+    return pd.DataFrame(window_columns).groupby(members, sort=False, observed=True).mean().round(2)
+
+@timed
+def build_member_feature_table(member_data, n = 3, as_of = None, extra_windows = EXTRA_WINDOWS):
+    """
+    Compute all the MemberFeatures columns for every member in the dataset with a single groupby pass, the LAST_n_TRANSACTIONS windows
+    reading the ranks of the most recent transactions of each member (see most_recent_ranks) instead of sorting the data
+
+    Parameters:
+    - member_data (pd.DataFrame or IndexedMemberData): input member data
+    - n (int): number of recent transactions to consider for the LAST_n_TRANSACTIONS features
+    - extra_windows (list): sizes of the longer LAST_n_TRANSACTIONS windows, computed in the same pass (added after the other columns)
+    - as_of (str or datetime or pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at, in UTC (the current UTC time if None)
+
+    Returns:
+    - feature_table (pd.DataFrame): DataFrame indexed by memberId with one column per feature
+    - latency (float): time taken to process the function
+    """
+    if isinstance(member_data, IndexedMemberData):
+        member_data = member_data.data
+
+    # group by the member codes, in memberId order, so that every groupby below reuses the same factorization
+    member_codes, member_ids = pd.factorize(member_data['memberId'], sort=True)
+    member_ids = pd.Index(member_ids, name='memberId')
+    members = pd.Categorical.from_codes(member_codes, categories=pd.RangeIndex(len(member_ids)))
+    member_groups = member_data.groupby(members, sort=True, observed=True)
+
+    # rank the most recent transactions of each member up to the largest window, the first pass giving the latest transaction of the member
+    windows = [n] + [window for window in extra_windows if window != n]
+    rank, latest = most_recent_ranks(member_codes, transaction_timestamps(member_data), max(windows), len(member_ids))
+
+    total_transactions = member_groups.size()
+    window_averages = last_n_window_averages(member_data, rank, windows, members = members)
+
+    # count the transactions of each type in the same pass
+    transaction_type = member_data['lastTransactionType']
+    type_counts = pd.DataFrame({
+        'buy': transaction_type == 'buy',
+        'gift': transaction_type == 'gift',
+        'redeem': transaction_type == 'redeem'
+    }).groupby(members, sort=True, observed=True).sum()
+
+    # members whose timestamps are all missing have no last transaction time
+    last_transaction_time = pd.Series(np.where(latest > RANKED + 1, latest, RANKED).view('datetime64[ns]'), index=total_transactions.index)
+
+    feature_table = pd.DataFrame({
+        'AVG_POINTS_BOUGHT': member_groups['lastTransactionPointsBought'].mean().round(2),
+        'AVG_REVENUE_USD': member_groups['lastTransactionRevenueUSD'].mean().round(2),
+        f'LAST_{n}_TRANSACTIONS_AVG_POINTS_BOUGHT': window_averages[f'LAST_{n}_TRANSACTIONS_AVG_POINTS_BOUGHT'],
+        f'LAST_{n}_TRANSACTIONS_AVG_REVENUE_USD': window_averages[f'LAST_{n}_TRANSACTIONS_AVG_REVENUE_USD'],
+        'PCT_BUY_TRANSACTIONS': (type_counts['buy'] / total_transactions).round(2),
+        'PCT_GIFT_TRANSACTIONS': (type_counts['gift'] / total_transactions).round(2),
+        'PCT_REDEEM_TRANSACTIONS': (type_counts['redeem'] / total_transactions).round(2),
+        'DAYS_SINCE_LAST_TRANSACTION': days_since(last_transaction_time, as_of_timestamp(as_of)),
+        **{column: window_averages[column] for column in window_averages.columns[2:]}
+    })
+    feature_table.index = member_ids
+
+    logging.info('Built feature table for %s members', len(feature_table))
+
+    return feature_table
+
+def lookup_member_feature(feature_table, member_id, feature):
+    """
+    Look up a single feature of a member in a feature table built by build_member_feature_table
+
+    Parameters:
+    - feature_table (pd.DataFrame): DataFrame indexed by memberId with one column per feature
+    - member_id (str): member_id for which to look up the feature
+    - feature (str): name of the feature column
+
+    Returns:
+    - float or int or None: the feature value, or None if the member has no transactions
+    """
+    if member_id not in feature_table.index:
+        logging.warning('No transactions for member_id %s. Returning None.', member_id)
+        return None # no transactions for the specified member
+
+    value = feature_table.at[member_id, feature]
+    # convert numpy scalars to python values so they behave like the computed features
+    value = value.item() if hasattr(value, 'item') else value
+
+    log_member(member_id, 'Looked up %s for member_id %s', feature, member_id)
+
+    return value
 
 
 ''' Transform the input member_data dataset into features for each member '''
-def calculate_avg_points_bought(member_data, member_id):
+@timed
+def calculate_avg_points_bought(member_data, member_id, feature_table = None):
     """
     Transform input data into AVG_POINTS_BOUGHT feature, calculated as $\text{total points bought} / \text{number of transactions}$ for a specific member
 
     Parameters:
-    - member_data (pd.DataFrame): input DataFrame including the the member data
+    - member_data (pd.DataFrame or IndexedMemberData): input DataFrame including the the member data
     - member_id (str): member_id for which to calculate the average points bought
+    - feature_table (pd.DataFrame): optional output of build_member_feature_table to look the feature up from
 
     Returns:
     - float: average points bought for the specified member
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
+    if feature_table is not None and 'AVG_POINTS_BOUGHT' in feature_table.columns:
+        return lookup_member_feature(feature_table, member_id, 'AVG_POINTS_BOUGHT')
+
     # filter data for the specific member id
-    member_transactions = member_data[member_data['memberId'] == member_id]
+    member_transactions = filter_member_transactions(member_data, member_id)
 
     if len(member_transactions) == 0:
-        logging.warning(f'No transactions for member_id {member_id}. Returning None.')
-        return None, 0 # no transactions for the specified member
+        logging.warning('No transactions for member_id %s. Returning None.', member_id)
+        return None # no transactions for the specified member
 
     # calculate average points bought
     avg_points_bought = member_transactions['lastTransactionPointsBought'].mean()
-    end_time = time.time()
-    latency = end_time - start_time
 
-    logging.info(f'Calculated AVG_POINTS_BOUGHT for member_id {member_id}. Latency: {latency} seconds')
+    log_member(member_id, 'Calculated AVG_POINTS_BOUGHT for member_id %s', member_id)
 
-    return round(avg_points_bought, 2), latency
+    return round(avg_points_bought, 2)
 
-def calculate_avg_revenue_usd(member_data, member_id):
+@timed
+def calculate_avg_revenue_usd(member_data, member_id, feature_table = None):
     """
     Transform input data into AVG_REVENUE_USD feature, calculated as $\text{total transaction revenue} / \text{number of transactions}$ for a specific member
 
     Parameters:
-    - member_data (pd.DataFrame): input DataFrame including the the member data
+    - member_data (pd.DataFrame or IndexedMemberData): input DataFrame including the the member data
     - member_id (str): member_id for which to calculate the average points bought
+    - feature_table (pd.DataFrame): optional output of build_member_feature_table to look the feature up from
 
     Returns:
     - float: average revenue USD for the specified member
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
+    if feature_table is not None and 'AVG_REVENUE_USD' in feature_table.columns:
+        return lookup_member_feature(feature_table, member_id, 'AVG_REVENUE_USD')
+
     # filter data for the specific member id
-    member_transactions = member_data[member_data['memberId'] == member_id]
+    member_transactions = filter_member_transactions(member_data, member_id)
 
     if len(member_transactions) == 0:
-        logging.warning(f'No transactions for member_id {member_id}. Returning None.')
-        return None, 0 # no transactions for the specified member
+        logging.warning('No transactions for member_id %s. Returning None.', member_id)
+        return None # no transactions for the specified member
 
     # calculate average revenue USD
     avg_revenue_usd = member_transactions['lastTransactionRevenueUSD'].mean()
-    end_time = time.time()
-    latency = end_time - start_time
 
-    logging.info(f'Calculated AVG_REVENUE_USD for member_id {member_id}. Latency: {latency} seconds')
+    log_member(member_id, 'Calculated AVG_REVENUE_USD for member_id %s', member_id)
 
-    return round(avg_revenue_usd, 2), latency
+    return round(avg_revenue_usd, 2)
 
-def calculate_last_3_transactions_avg_points_bought(member_data, member_id, n = 3):
+@timed
+def calculate_last_3_transactions_avg_points_bought(member_data, member_id, n = 3, feature_table = None):
     """
     Transform input data into LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT feature, which is the AVG_POINTS_BOUGHT for the 3 most recent transactions for a specific member
 
     Parameters:
-    - member_data (pd.DataFrame): input DataFrame including the the member data
+    - member_data (pd.DataFrame or IndexedMemberData): input DataFrame including the the member data
     - member_id (str): member_id for which to calculate the average points bought
     - n (int): number of recent trancations to consider
+    - feature_table (pd.DataFrame): optional output of build_member_feature_table to look the feature up from
 
     Returns:
     - float: average points bought for the last n transactions for the specified member
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
+    if feature_table is not None and f'LAST_{n}_TRANSACTIONS_AVG_POINTS_BOUGHT' in feature_table.columns:
+        return lookup_member_feature(feature_table, member_id, f'LAST_{n}_TRANSACTIONS_AVG_POINTS_BOUGHT')
+
     # filter data for the specific member id
-    member_transactions = member_data[member_data['memberId'] == member_id]
+    member_transactions = filter_member_transactions(member_data, member_id)
 
 
     if len(member_transactions) == 0:
-        logging.warning(f'No transactions for member_id {member_id}. Returning None.')
-        return None, 0 # no transactions for the specified member
+        logging.warning('No transactions for member_id %s. Returning None.', member_id)
+        return None # no transactions for the specified member
 
     # #### convert ot datetime format
     # last_transaction_datetime_format = datetime.strptime(member_transactions['lastTransactionUtcTs'], "%Y-%m-%d %H:%M:%S")
 
-    # sort transactions by lastTransatcionUtcTs (date and time) in descending order
-    member_transactions_sort = member_transactions.sort_values(by='lastTransatcionUtcTs', ascending=False)
-    # print('sorted dataframe: ', member_transactions_sort)
-
-    # take the first n transactions
-    last_n_transactions = member_transactions_sort.head(n)
+    # take the n most recent transactions (slices of indexed data are already sorted)
+    last_n_transactions = most_recent_transactions(member_transactions, n, is_sorted = isinstance(member_data, IndexedMemberData))
 
     # calculate average points bought for the last n transactions
     avg_points_bought_last_n_transactions = last_n_transactions['lastTransactionPointsBought'].mean()
-    end_time = time.time()
-    latency = end_time - start_time
 
-    logging.info(f'Calculated AVG_POINTS_BOUGHT_LAST_N_TRANSACTIONS for member_id {member_id}. Latency: {latency} seconds')
+    log_member(member_id, 'Calculated AVG_POINTS_BOUGHT_LAST_N_TRANSACTIONS for member_id %s', member_id)
 
-    return round(avg_points_bought_last_n_transactions, 2), latency
+    return round(avg_points_bought_last_n_transactions, 2)
 
-def calculate_last_3_transactions_avg_revenue_usd(member_data, member_id, n = 3):
+@timed
+def calculate_last_3_transactions_avg_revenue_usd(member_data, member_id, n = 3, feature_table = None):
     """
     Transform input data into LAST_3_TRANSACTIONS_AVG_REVENUE_USD feature, which is the AVG_REVENUE_USD for the 3 most recent transactions for a specific member
 
     Parameters:
-    - member_data (pd.DataFrame): input DataFrame including the the member data
+    - member_data (pd.DataFrame or IndexedMemberData): input DataFrame including the the member data
     - member_id (str): member_id for which to calculate the average revenue USD
     - n (int): number of recent trancations to consider
+    - feature_table (pd.DataFrame): optional output of build_member_feature_table to look the feature up from
 
     Returns:
     - float: average revenue USD for the last n transactions for the specified member
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
+    if feature_table is not None and f'LAST_{n}_TRANSACTIONS_AVG_REVENUE_USD' in feature_table.columns:
+        return lookup_member_feature(feature_table, member_id, f'LAST_{n}_TRANSACTIONS_AVG_REVENUE_USD')
+
     # filter data for the specific member id
-    member_transactions = member_data[member_data['memberId'] == member_id]
+    member_transactions = filter_member_transactions(member_data, member_id)
 
     if len(member_transactions) == 0:
-        logging.warning(f'No transactions for member_id {member_id}. Returning None.')
-        return None, 0 # no transactions for the specified member
-
-    # sort transactions by lastTransatcionUtcTs (date and time) in descending order
-    member_transactions_sort = member_transactions.sort_values(by='lastTransatcionUtcTs', ascending=False)
+        logging.warning('No transactions for member_id %s. Returning None.', member_id)
+        return None # no transactions for the specified member
 
-    # take the first n transactions
-    last_n_transactions = member_transactions_sort.head(n)
+    # take the n most recent transactions (slices of indexed data are already sorted)
+    last_n_transactions = most_recent_transactions(member_transactions, n, is_sorted = isinstance(member_data, IndexedMemberData))
 
     # calculate average revenue USD for the last n transactions
     avg_revenue_usd_last_n_transactions = last_n_transactions['lastTransactionRevenueUSD'].mean()
-    end_time = time.time()
-    latency = end_time - start_time
 
-    logging.info(f'Calculated AVG_REVENUE_USD_LAST_N_TRANSACTIONS for member_id {member_id}. Latency: {latency} seconds')
+    log_member(member_id, 'Calculated AVG_REVENUE_USD_LAST_N_TRANSACTIONS for member_id %s', member_id)
 
-    return round(avg_revenue_usd_last_n_transactions, 2), latency
+    return round(avg_revenue_usd_last_n_transactions, 2)
 
-def calculate_pct_buy_transactions(member_data, member_id):
+@timed
+def calculate_pct_buy_transactions(member_data, member_id, feature_table = None):
     """
     Transform input data into PCT_BUY_TRANSACTIONS feature, as the rate (i.e., percentage) of BUY transactions for a specific member, calculated as $\text{Number of transactions where transaction type was BUY} / \text{number of transactions}$ for a specified member
 
     Parameters:
-    - member_data (pd.DataFrame): input DataFrame including the the member data
+    - member_data (pd.DataFrame or IndexedMemberData): input DataFrame including the the member data
     - member_id (str): member_id for which to calculate the percentage of BUY transaction
+    - feature_table (pd.DataFrame): optional output of build_member_feature_table to look the feature up from
 
     Returns:
     - float: rate (i.e., percentage) of BUY transactions for a specified member
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
+    if feature_table is not None and 'PCT_BUY_TRANSACTIONS' in feature_table.columns:
+        return lookup_member_feature(feature_table, member_id, 'PCT_BUY_TRANSACTIONS')
+
     # filter data for the specific member id
-    member_transactions = member_data[member_data['memberId'] == member_id]
+    member_transactions = filter_member_transactions(member_data, member_id)
 
     if len(member_transactions) == 0:
-        logging.warning(f'No transactions for member_id {member_id}. Returning None.')
-        return None, 0 # no transactions for the specified member
+        logging.warning('No transactions for member_id %s. Returning None.', member_id)
+        return None # no transactions for the specified member
 
     # calculate total number of transactions
     total_transactions = len(member_transactions)
@@ -199,32 +626,34 @@ def calculate_pct_buy_transactions(member_data, member_id):
 
     # calculate the rate (i.e., percentage) of BUY transactions
     pct_buy_transactions = buy_transactions / total_transactions if total_transactions > 0 else 0.0
-    end_time = time.time()
-    latency = end_time - start_time
 
-    logging.info(f'Calculated PCT_BUY_TRANSACTIONS for member_id {member_id}. Latency: {latency} seconds')
+    log_member(member_id, 'Calculated PCT_BUY_TRANSACTIONS for member_id %s', member_id)
 
-    return round(pct_buy_transactions, 2), latency
+    return round(pct_buy_transactions, 2)
 
-def calculate_pct_gift_transactions(member_data, member_id):
+@timed
+def calculate_pct_gift_transactions(member_data, member_id, feature_table = None):
     """
     Transform input data into PCT_GIFT_TRANSACTIONS feature, as the rate (i.e., percentage) of GIFT transactions for a specific member, calculated as $\text{Number of transactions where transaction type was GIFT} / \text{number of transactions}$ for a specified member
 
     Parameters:
-    - member_data (pd.DataFrame): input DataFrame including the the member data
+    - member_data (pd.DataFrame or IndexedMemberData): input DataFrame including the the member data
     - member_id (str): member_id for which to calculate the percentage of GIFT transaction
+    - feature_table (pd.DataFrame): optional output of build_member_feature_table to look the feature up from
 
     Returns:
     - float: rate (i.e., percentage) of GIFT transactions for a specified member
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
+    if feature_table is not None and 'PCT_GIFT_TRANSACTIONS' in feature_table.columns:
+        return lookup_member_feature(feature_table, member_id, 'PCT_GIFT_TRANSACTIONS')
+
     # filter data for the specific member id
-    member_transactions = member_data[member_data['memberId'] == member_id]
+    member_transactions = filter_member_transactions(member_data, member_id)
 
     if len(member_transactions) == 0:
-        logging.warning(f'No transactions for member_id {member_id}. Returning None.')
-        return None, 0 # no transactions for the specified member
+        logging.warning('No transactions for member_id %s. Returning None.', member_id)
+        return None # no transactions for the specified member
 
     # calculate total number of transactions
     total_transactions = len(member_transactions)
@@ -234,32 +663,34 @@ def calculate_pct_gift_transactions(member_data, member_id):
 
     # calculate the rate (i.e., percentage) of GIFT transactions
     pct_gift_transactions = gift_transactions / total_transactions if total_transactions > 0 else 0.0
-    end_time = time.time()
-    latency = end_time - start_time
 
-    logging.info(f'Calculated PCT_GIFT_TRANSACTIONS for member_id {member_id}. Latency: {latency} seconds')
+    log_member(member_id, 'Calculated PCT_GIFT_TRANSACTIONS for member_id %s', member_id)
 
-    return round(pct_gift_transactions, 2), latency
+    return round(pct_gift_transactions, 2)
 
-def calculate_pct_redeem_transactions(member_data, member_id):
+@timed
+def calculate_pct_redeem_transactions(member_data, member_id, feature_table = None):
     """
     Transform input data into PCT_REDEEM_TRANSACTIONS feature, as the rate (i.e., percentage) of REDEEM transactions for a specific member, calculated as $\text{Number of transactions where transaction type was REDEEM} / \text{number of transactions}$ for a specified member
 
     Parameters:
-    - member_data (pd.DataFrame): input DataFrame including the the member data
+    - member_data (pd.DataFrame or IndexedMemberData): input DataFrame including the the member data
     - member_id (str): member_id for which to calculate the percentage of REDEEM transaction
+    - feature_table (pd.DataFrame): optional output of build_member_feature_table to look the feature up from
 
     Returns:
     - float: rate (i.e., percentage) of REDEEM transactions for a specified member
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
+    if feature_table is not None and 'PCT_REDEEM_TRANSACTIONS' in feature_table.columns:
+        return lookup_member_feature(feature_table, member_id, 'PCT_REDEEM_TRANSACTIONS')
+
     # filter data for the specific member id
-    member_transactions = member_data[member_data['memberId'] == member_id]
+    member_transactions = filter_member_transactions(member_data, member_id)
 
     if len(member_transactions) == 0:
-        logging.warning(f'No transactions for member_id {member_id}. Returning None.')
-        return None, 0 # no transactions for the specified member
+        logging.warning('No transactions for member_id %s. Returning None.', member_id)
+        return None # no transactions for the specified member
 
     # calculate total number of transactions
     total_transactions = len(member_transactions)
@@ -269,80 +700,85 @@ def calculate_pct_redeem_transactions(member_data, member_id):
 
     # calculate the rate (i.e., percentage) of redeem transactions
     pct_redeem_transactions = redeem_transactions / total_transactions if total_transactions > 0 else 0.0
-    end_time = time.time()
-    latency = end_time - start_time
 
-    logging.info(f'Calculated PCT_REDEEM_TRANSACTIONS for member_id {member_id}. Latency: {latency} seconds')
+    log_member(member_id, 'Calculated PCT_REDEEM_TRANSACTIONS for member_id %s', member_id)
 
-    return round(pct_redeem_transactions, 2), latency
+    return round(pct_redeem_transactions, 2)
 
-def calcualte_days_sicne_last_transaction(member_data, member_id):
+@timed
+def calcualte_days_sicne_last_transaction(member_data, member_id, feature_table = None, as_of = None):
     """
     calculate the number of days since the last transaction for a specific member ((ie. Current day in UTC - last day of transaction in UTC))
 
     Parameters:
-    - member_data (pd.DataFrame): input DataFrame including the member data
+    - member_data (pd.DataFrame or IndexedMemberData): input DataFrame including the member data
     - member_id (str): member_id for which to calculate the days since last transaction
+    - feature_table (pd.DataFrame): optional output of build_member_feature_table to look the feature up from (the feature is then the one
+      computed at the as_of time the table was built with)
+    - as_of (str or datetime or pd.Timestamp): time to count the days to, in UTC (the current UTC time if None)
 
     Returns:
     - int: number of days since the last transaction for the specified member
     - latency (float): time taken to process the function
     """
-    start_time = time.time()
+    if feature_table is not None and 'DAYS_SINCE_LAST_TRANSACTION' in feature_table.columns:
+        return lookup_member_feature(feature_table, member_id, 'DAYS_SINCE_LAST_TRANSACTION')
+
     # filter data for the specific member id
-    member_transactions = member_data[member_data['memberId'] == member_id]
+    member_transactions = filter_member_transactions(member_data, member_id)
 
     if len(member_transactions) == 0:
-        logging.warning(f'No transactions for member_id {member_id}. Returning None.')
-        return None, 0 # no transactions for the specified member
+        logging.warning('No transactions for member_id %s. Returning None.', member_id)
+        return None # no transactions for the specified member
 
-    # sort transactions by lastTransatcionUtcTs (date and time) in descending order
-    member_transactions_sort = member_transactions.sort_values(by='lastTransatcionUtcTs', ascending=False)
+    # sort transactions by lastTransatcionUtcTs (date and time) in descending order (slices of indexed data are already sorted)
+    if isinstance(member_data, IndexedMemberData):
+        member_transactions_sort = member_transactions
+    else:
+        member_transactions_sort = member_transactions.sort_values(by='lastTransatcionUtcTs', ascending=False)
 
     # take the UtsTs of the latest transaction
     last_transaction_time = member_transactions_sort['lastTransatcionUtcTs'].iloc[0]
 
-    #### convert ot datetime format
-    last_transaction_datetime_format = datetime.strptime(last_transaction_time, "%Y-%m-%d %H:%M:%S")
-
-    # current time
-    current_datetime_format = datetime.utcnow()
+    # calculate the number of days since the last transaction (typed member data already holds timestamps)
+    delta_days = (as_of_timestamp(as_of) - pd.to_datetime(last_transaction_time, format="%Y-%m-%d %H:%M:%S")).days
 
-    # calculate the number of days since the last transaction
-    delta_days = (current_datetime_format - last_transaction_datetime_format).days
-    end_time = time.time()
-    latency = end_time - start_time
+    log_member(member_id, 'Calculated DAYS_SINCE_LAST_TRANSACTION for member_id %s', member_id)
 
-    logging.info(f'Calculated DAYS_SINCE_LAST_TRANSACTION for member_id {member_id}. Latency: {latency} seconds')
+    return delta_days
 
-    return delta_days, latency
-
-# create member_features object based on the above functions that transform the raw features to the desired features
-def create_member_features(member_data, member_id):
+@timed(name = 'create_member_features')
+def transform_member_features(member_data, member_id, feature_table = None, as_of = None):
     """
-    Combine all the transforming functions to create a MemberFeatures object
-
-    Parameters:
-    - member_data (pd.DataFrame): input DataFrame including the member data
-    - member_id (str): member_id for which to calculate different transformed features
+    Combine all the transforming functions to create a MemberFeatures object, see create_member_features
 
     Returns:
-    - member_features (MemberFeatures): an object of MemberFeatures including the transformed member data
-    - member_features_latency (dict): a dictionary containing all the latencies for different transforming functions
+    - (member_features, latencies) (tuple): the MemberFeatures object and the latencies of the transforming functions
+    - latency (float): time taken to process the function
     """
-    start_time = time.time()
-
-    logging.debug(f'Creating member features for member_id {member_id}.')
-
-    # compute individual features
-    avg_points_bought, avg_points_bought_latency = calculate_avg_points_bought(member_data, member_id)
-    avg_revenue_usd, avg_revenue_usd_latency = calculate_avg_revenue_usd(member_data, member_id)
-    last_3_transactions_avg_points_bought, last_3_transactions_avg_points_bought_latency = calculate_last_3_transactions_avg_points_bought(member_data, member_id)
-    last_3_transactions_avg_revenue_usd, last_3_transactions_avg_revenue_usd_latency = calculate_last_3_transactions_avg_revenue_usd(member_data, member_id)
-    pct_buy_transactions, pct_buy_transactions_latency = calculate_pct_buy_transactions(member_data, member_id)
-    pct_gift_transactions, pct_gift_transactions_latency = calculate_pct_gift_transactions(member_data, member_id)
-    pct_redeem_transactions, pct_redeem_transactions_latency = calculate_pct_redeem_transactions(member_data, member_id)
-    days_sicne_last_transaction, days_sicne_last_transaction_latency = calcualte_days_sicne_last_transaction(member_data, member_id)
+    logging.debug('Creating member features for member_id %s.', member_id)
+
+    # compute all the features of the member in one pass over its transactions, instead of filtering the dataset once per feature
+    feature_table_latency = 0
+    if feature_table is None:
+        member_transactions = filter_member_transactions(member_data, member_id)
+        feature_table, feature_table_latency = build_member_feature_table(member_transactions, as_of = as_of)
+
+    # look up individual features
+    avg_points_bought, avg_points_bought_latency = calculate_avg_points_bought(member_data, member_id, feature_table = feature_table)
+    avg_revenue_usd, avg_revenue_usd_latency = calculate_avg_revenue_usd(member_data, member_id, feature_table = feature_table)
+    last_3_transactions_avg_points_bought, last_3_transactions_avg_points_bought_latency = calculate_last_3_transactions_avg_points_bought(member_data, member_id, feature_table = feature_table)
+    last_3_transactions_avg_revenue_usd, last_3_transactions_avg_revenue_usd_latency = calculate_last_3_transactions_avg_revenue_usd(member_data, member_id, feature_table = feature_table)
+    pct_buy_transactions, pct_buy_transactions_latency = calculate_pct_buy_transactions(member_data, member_id, feature_table = feature_table)
+    pct_gift_transactions, pct_gift_transactions_latency = calculate_pct_gift_transactions(member_data, member_id, feature_table = feature_table)
+    pct_redeem_transactions, pct_redeem_transactions_latency = calculate_pct_redeem_transactions(member_data, member_id, feature_table = feature_table)
+    days_sicne_last_transaction, days_sicne_last_transaction_latency = calcualte_days_sicne_last_transaction(member_data, member_id, feature_table = feature_table)
+
+    # the longer windows of the LAST_3_TRANSACTIONS features
+    window_features = {}
+    for window in EXTRA_WINDOWS:
+        window_features[f'LAST_{window}_TRANSACTIONS_AVG_POINTS_BOUGHT'], _ = calculate_last_3_transactions_avg_points_bought(member_data, member_id, n = window, feature_table = feature_table)
+        window_features[f'LAST_{window}_TRANSACTIONS_AVG_REVENUE_USD'], _ = calculate_last_3_transactions_avg_revenue_usd(member_data, member_id, n = window, feature_table = feature_table)
 
     # create MemberFeatures object
     member_features = MemberFeatures(
@@ -353,16 +789,14 @@ def create_member_features(member_data, member_id):
         PCT_BUY_TRANSACTIONS = pct_buy_transactions,
         PCT_GIFT_TRANSACTIONS = pct_gift_transactions,
         PCT_REDEEM_TRANSACTIONS = pct_redeem_transactions,
-        DAYS_SINCE_LAST_TRANSACTION = days_sicne_last_transaction
+        DAYS_SINCE_LAST_TRANSACTION = days_sicne_last_transaction,
+        **window_features
     )
 
-    logging.debug(f'Finished creating member features for member_id {member_id}.')
+    logging.debug('Finished creating member features for member_id %s.', member_id)
 
-    end_time = time.time()
-    latency = end_time - start_time
-
-    memebr_features_latency = {
-        "transform_features_latency": latency,
+    latencies = {
+        "feature_table_latency": feature_table_latency,
         "avg_points_bought_latency": avg_points_bought_latency,
         "avg_revenue_usd_latency": avg_revenue_usd_latency,
         "last_3_transactions_avg_points_bought_latency": last_3_transactions_avg_points_bought_latency,
@@ -373,7 +807,26 @@ def create_member_features(member_data, member_id):
         "days_since_last_transaction_latency": days_sicne_last_transaction_latency
     }
 
-    return member_features, memebr_features_latency
+    return member_features, latencies
+
+# create member_features object based on the above functions that transform the raw features to the desired features
+def create_member_features(member_data, member_id, feature_table = None, as_of = None):
+    """
+    Combine all the transforming functions to create a MemberFeatures object
+
+    Parameters:
+    - member_data (pd.DataFrame or IndexedMemberData): input DataFrame including the member data
+    - member_id (str): member_id for which to calculate different transformed features
+    - feature_table (pd.DataFrame): optional output of build_member_feature_table; if not given, a table is built from the member's transactions only
+    - as_of (str or datetime or pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at when the table is built here, in UTC
+      (the current UTC time if None)
+
+    Returns:
+    - member_features (MemberFeatures): an object of MemberFeatures including the transformed member data
+    - member_features_latency (dict): a dictionary containing all the latencies for different transforming functions
+    """
+    (member_features, latencies), latency = transform_member_features(member_data, member_id, feature_table, as_of)
+    return member_features, {"transform_features_latency": latency, **latencies}
 
 
 if __name__ == "__main__":
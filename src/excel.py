@@ -1,9 +1,13 @@
 import pandas as pd
 import os
 import logging
+from openpyxl import Workbook
 
-from .api_interaction import summarize
+from .api_interaction import summarize, summarize_batch
+from .instrumentation import timed
+from .log_sampling import log_member
 from .member_features import MemberFeatures
+from .result_store import SQLiteResultStore
 
 def flatten_dict(nested_dict, parent_key='', sep='_'): # input parameter is itself a dict (nested dict)
     """
@@ -17,7 +21,7 @@ def flatten_dict(nested_dict, parent_key='', sep='_'): # input parameter is itse
     Returns
     -  dict: flatten dictionary of the nested input dictionary (and considering the parent keys)
     """
-    logging.info(f'Flattening nested dictionary')
+    logging.debug('Flattening nested dictionary')
     temp_res = {}
     for key, value in nested_dict.items():
         new_key = f"{parent_key}{sep}{key}" if parent_key else key
@@ -27,6 +31,28 @@ def flatten_dict(nested_dict, parent_key='', sep='_'): # input parameter is itse
             temp_res[new_key] = value
     return temp_res # output is a dictionary
 
+def flatten_dicts(nested_dicts, parent_key='', sep='_'):
+    """
+    flatten many nested dictionaries with the same keys into columns, one list of values per flattened key (same keys as flatten_dict)
+
+    Parameters:
+    - nested_dicts (list): the dictionaries we want to flatten, all with the keys of the first one
+    - parent_key (str): the key for the current values, if the values are nested
+    - sep (str): separator of the current key and its parent, in case there is a parent for the current key
+
+    Returns
+    -  dict: the values of each key of the flatten dictionaries, in the order of nested_dicts
+    """
+    columns = {}
+    for key, value in nested_dicts[0].items():
+        new_key = f"{parent_key}{sep}{key}" if parent_key else key
+        values = [nested_dict[key] for nested_dict in nested_dicts]
+        if isinstance(value, dict):
+            columns.update(flatten_dicts(values, new_key, sep))
+        else:
+            columns[new_key] = values
+    return columns
+
 def convert_object_to_dict(obj):
     """
     convert a class instance to dictionary
@@ -37,42 +63,65 @@ def convert_object_to_dict(obj):
     Returns
     -  dict: dictionary representation of the MemberFeatures object
     """
-    logging.info(f'Converting class instance to dictionary')
+    logging.debug('Converting class instance to dictionary')
     if hasattr(obj, "__dict__"):
         return {k: v for k, v in obj.__dict__.items() if not k.startswith('_')}
     else:
         return obj
 
-def excel_save(member_id, dataset_file):
+def flatten_summary(summary):
     """
-    add all the information from a member in the dataset including the raw data, the transformed data, the predictions, the offer, and all the latencies into an excel file
-    (note: if a row already exists with the current member_id, replace it with the most updates info (i.e., the new one))
+    flatten the result of summarize into a single row (the nested latencies are flattened and the MemberFeatures are expanded into columns)
 
     Parameters:
-    - member_id (str): member_id for which to calculate different transformed features
-    - dataset_file (str): path to the dataset file of the members
+    - summary (dict): result of summarize for a member
 
     Returns
-    save the dataframe to excel file
+    -  dict: flat dictionary with one value per column
     """
-    logging.info(f'Saving Excel file for member_id {member_id}')
-    # generate the dictionary of the required features, predictions, offers, and latencies of each of them
-    curr_member_res = summarize(member_id, dataset_file)
     final_dict = {}
 
-    for key, value in curr_member_res.items():
+    for key, value in summary.items():
         if isinstance(value, dict):
-            logging.info(f'Flattening nested dictionary for key {key}')
+            logging.debug('Flattening nested dictionary for key %s', key)
             # flatten nested dictionaries (i.e., latencies dictionary) (no nested dictionary is required)
             flat_dict = flatten_dict(value)
             final_dict.update(flat_dict)
         elif isinstance(value, MemberFeatures):
-            logging.info(f'Converting MemberFeatures instance to dictionary for key {key}')
+            logging.debug('Converting MemberFeatures instance to dictionary for key %s', key)
             # convert MemberFeatures class instance to dictionary
             member_features_dict = convert_object_to_dict(value)
             final_dict.update(member_features_dict)
         else:
             final_dict[key] = value
+    return final_dict
+
+def excel_save(member_id, dataset_file, cache = None, sink = None, client = None):
+    """
+    add all the information from a member in the dataset including the raw data, the transformed data, the predictions, the offer, and all the latencies into an excel file
+    (note: if a row already exists with the current member_id, replace it with the most updates info (i.e., the new one))
+
+    Parameters:
+    - member_id (str): member_id for which to calculate different transformed features
+    - dataset_file (str): path to the dataset file of the members
+    - cache (LRUCache): if given, passed to summarize to reuse the features and predictions of earlier calls (the cache statistics are
+      then saved with the latencies)
+    - sink (SQLiteResultStore or JSONLinesResultLog): if given, upsert the row into this result store instead of rewriting the excel file
+      (the excel file is then written once with export_excel, after all the members are saved)
+    - client (ApiClient): client to send the requests with (the shared default client if None)
+
+    Returns
+    save the dataframe to excel file
+    """
+    log_member(member_id, 'Saving Excel file for member_id %s', member_id)
+    # generate the dictionary of the required features, predictions, offers, and latencies of each of them
+    curr_member_res = summarize(member_id, dataset_file, cache = cache, client = client)
+    final_dict = flatten_summary(curr_member_res)
+
+    if sink is not None:
+        log_member(member_id, 'Saving the result of member_id %s to the result store', member_id)
+        sink.upsert(final_dict)
+        return
 
     # convert dictionary to pandas dataframe
     new_df = pd.DataFrame(data = final_dict, index = [0])
@@ -94,13 +143,114 @@ def excel_save(member_id, dataset_file):
 
         # append the current dataframe to the exsting one
         new_df = pd.concat([existing_df, new_df], ignore_index=True)
-        
-    print(new_df)
 
-    logging.info(f'Saving DataFrame to Excel file at path {xlsx_path}')
+    # the DataFrame is only formatted if debug logging is enabled
+    logging.debug('Results to save:\n%s', new_df)
+
+    logging.info('Saving DataFrame to Excel file at path %s', xlsx_path)
     new_df.to_excel(xlsx_path)
 
+def export_excel(sink, xlsx_path = './test_member_process.xlsx'):
+    """
+    write all the results saved in a result store to an excel file at once, in the same layout as excel_save
+
+    Parameters:
+    - sink (SQLiteResultStore or JSONLinesResultLog): result store to export
+    - xlsx_path (str): path of the excel file (overwritten)
+
+    Returns
+    - int: number of rows written
+    """
+    results_df = pd.DataFrame(sink.rows())
+
+    logging.info('Exporting %s results to Excel file at path %s', len(results_df), xlsx_path)
+    write_excel({'Sheet1': results_df}, xlsx_path)
+    return len(results_df)
+
+def flatten_summaries(results):
+    """
+    flatten the results of many members at once, column by column instead of row by row (same columns as flatten_summary)
+
+    Parameters:
+    - results (list): results of summarize (or the per-member results of summarize_batch), all with the same keys
+
+    Returns
+    -  pd.DataFrame: one row per member and one column per value
+    """
+    if len(results) == 0:
+        return pd.DataFrame()
+
+    columns = {}
+    for key, value in results[0].items():
+        values = [res[key] for res in results]
+        if isinstance(value, dict):
+            # nested dictionaries (i.e., latencies dictionary) get the same column names as flatten_dict
+            columns.update(flatten_dicts(values))
+        elif isinstance(value, MemberFeatures):
+            columns.update({field: [getattr(obj, field) for obj in values] for field in MemberFeatures.model_fields})
+        else:
+            columns[key] = values
+    return pd.DataFrame(columns)
+
+def write_excel(sheets, xlsx_path):
+    """
+    write DataFrames to an excel file with a write-only workbook, which streams the rows to the file instead of keeping a cell object per value
+    in memory (the layout is the same as DataFrame.to_excel, with the index in the first column)
 
+    Parameters:
+    - sheets (dict): DataFrame to write for each sheet name
+    - xlsx_path (str): path of the excel file (overwritten)
+    """
+    workbook = Workbook(write_only=True)
+    for sheet_name, df in sheets.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append([None] + list(df.columns))
+        # missing values are written as empty cells
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=True, name=None):
+            worksheet.append(list(row))
+    workbook.save(xlsx_path)
+
+@timed
+def excel_save_batch(member_ids, dataset_file, xlsx_path = './test_member_process.xlsx', sheets = False, batch_size = 1000, client = None, as_of = None):
+    """
+    score many members with summarize_batch and write all the results to an excel file at once
+
+    Parameters:
+    - member_ids (list or str): list of member_ids to score, or "all" to score every member in the dataset
+    - dataset_file (str): path to the dataset file of the members
+    - xlsx_path (str): path of the excel file (overwritten)
+    - sheets (bool): if True, write the features, the predictions and the latencies to separate sheets (each with the member_id), instead of
+      all the columns on a single sheet like excel_save
+    - batch_size (int): number of members sent per request to the batch endpoints
+    - client (ApiClient): client to send the requests with (the shared default client if None)
+    - as_of (str or datetime or pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at for all the members, in UTC (see summarize_batch)
+
+    Returns
+    - results_df (pd.DataFrame): the flattened results written to the file
+    - latency (float): time taken to process the function
+    """
+    logging.info('Saving Excel file for a batch of members')
+
+    batch_res = summarize_batch(member_ids, dataset_file, batch_size = batch_size, client = client, as_of = as_of)
+    results_df = flatten_summaries(batch_res["results"])
+
+    if sheets and len(results_df) > 0:
+        feature_columns = list(MemberFeatures.model_fields)
+        prediction_columns = ['predict_ats_ep', 'predict_resp_ep', 'offer_ep']
+        latency_columns = [column for column in results_df.columns if column not in ['member_id'] + feature_columns + prediction_columns]
+        excel_sheets = {
+            'features': results_df[['member_id'] + feature_columns],
+            'predictions': results_df[['member_id'] + prediction_columns],
+            'latencies': results_df[['member_id'] + latency_columns]
+        }
+    else:
+        excel_sheets = {'Sheet1': results_df}
+
+    logging.info('Saving %s results to Excel file at path %s', len(results_df), xlsx_path)
+    write_excel(excel_sheets, xlsx_path)
+
+    return results_df
 
 if __name__ == "__main__":
     # get current directory
@@ -113,8 +263,18 @@ if __name__ == "__main__":
     # get the path to the dataset file
     file_path = path + file_name
 
-    # specify a member_id for testing
+    # specify a member_id for testing, several comma-separated member_ids, or "all"
     # test_member_id = '5D72524D'
     test_member_id = input("Please enter member_id: ")
 
-    excel_save(test_member_id, file_path)
\ No newline at end of file
+    if test_member_id == "all":
+        # score every member with the batch endpoints and write the excel file once
+        excel_save_batch("all", file_path)
+    elif "," in test_member_id:
+        # save the results to a result store as they come, and write the excel file once at the end
+        with SQLiteResultStore('./test_member_process.db') as sink:
+            for member_id in test_member_id.split(","):
+                excel_save(member_id.strip(), file_path, sink = sink)
+            export_excel(sink)
+    else:
+        excel_save(test_member_id, file_path)
\ No newline at end of file
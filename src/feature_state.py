@@ -0,0 +1,161 @@
+import os
+import logging
+
+import pandas as pd
+
+from .data_processing import clean_member_data, as_of_timestamp, days_since, last_n_window_averages, EXTRA_WINDOWS
+from .instrumentation import timed
+
+# per-member sums and counts of the aggregates
+COUNT_COLUMNS = ['transaction_count', 'points_sum', 'points_count', 'revenue_sum', 'revenue_count', 'buy_count', 'gift_count', 'redeem_count']
+
+# columns of the transactions kept for the LAST_n_TRANSACTIONS features
+RECENT_COLUMNS = ['memberId', 'lastTransatcionUtcTs', 'lastTransactionPointsBought', 'lastTransactionRevenueUSD']
+
+class MemberFeatureState:
+    """
+    Running per-member aggregates of the transactions seen so far: sums and counts, the number of transactions of each type,
+    and the most recent transactions (as many as the largest LAST_n_TRANSACTIONS window) (the first of which gives the time of the last transaction). The MemberFeatures of every member can be computed from it
+    at any time, so transactions can be added in chunks and dropped once aggregated; memory grows with the number of members, not rows
+    """
+    def __init__(self, n = 3, extra_windows = EXTRA_WINDOWS):
+        """
+        Parameters:
+        - n (int): number of recent transactions to consider for the LAST_n_TRANSACTIONS features
+        - extra_windows (list): sizes of the longer LAST_n_TRANSACTIONS windows (see build_member_feature_table)
+        """
+        self.n = n
+        self.windows = [n] + [window for window in extra_windows if window != n]
+        # one row per member
+        self.totals = None
+        # up to the largest window of rows per member, sorted by member and most recent transaction first
+        self.recent = None
+
+    def __len__(self):
+        return 0 if self.totals is None else len(self.totals)
+
+    def update(self, transactions):
+        """
+        Add transactions to the aggregates
+
+        Parameters:
+        - transactions (pd.DataFrame): new transactions, with the missing values handled (see clean_member_data)
+
+        Returns:
+        - list: the member_ids whose aggregates changed
+        """
+        transactions = transactions[transactions['memberId'].notna()]
+        if len(transactions) == 0:
+            return []
+
+        member_groups = transactions.groupby('memberId', sort=False, observed=True)
+        transaction_type = transactions['lastTransactionType']
+        type_counts = pd.DataFrame({
+            'buy_count': transaction_type == 'buy',
+            'gift_count': transaction_type == 'gift',
+            'redeem_count': transaction_type == 'redeem'
+        }).groupby(transactions['memberId'], sort=False, observed=True).sum()
+
+        chunk_totals = pd.DataFrame({
+            'transaction_count': member_groups.size(),
+            'points_sum': member_groups['lastTransactionPointsBought'].sum(),
+            'points_count': member_groups['lastTransactionPointsBought'].count(),
+            'revenue_sum': member_groups['lastTransactionRevenueUSD'].sum(),
+            'revenue_count': member_groups['lastTransactionRevenueUSD'].count(),
+            'buy_count': type_counts['buy_count'],
+            'gift_count': type_counts['gift_count'],
+            'redeem_count': type_counts['redeem_count']
+        })
+
+        # merge the chunk into the running aggregates
+        if self.totals is None:
+            self.totals = chunk_totals
+        else:
+            self.totals = self.totals.add(chunk_totals, fill_value=0)
+
+        # keep the n most recent transactions of each member; the stable sort keeps earlier rows first on equal timestamps
+        recent = transactions[RECENT_COLUMNS] if self.recent is None else pd.concat([self.recent, transactions[RECENT_COLUMNS]], ignore_index=True)
+        recent = recent.sort_values(by=['memberId', 'lastTransatcionUtcTs'], ascending=[True, False], kind='mergesort')
+        self.recent = recent[recent.groupby('memberId', sort=False, observed=True).cumcount() < max(self.windows)].reset_index(drop=True)
+
+        return chunk_totals.index.tolist()
+
+    def features(self, member_ids = None, as_of = None):
+        """
+        Compute the feature table from the aggregates
+
+        Parameters:
+        - member_ids (list): member_ids to compute the features for (all the members if None)
+        - as_of (str or datetime or pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at, in UTC (the current UTC time if None)
+
+        Returns:
+        - pd.DataFrame: same as data_processing.build_member_feature_table
+        """
+        totals = self.totals
+        recent = self.recent
+        if totals is None:
+            totals = pd.DataFrame(columns=COUNT_COLUMNS)
+            recent = pd.DataFrame(columns=RECENT_COLUMNS)
+        if member_ids is not None:
+            totals = totals[totals.index.isin(member_ids)]
+            recent = recent[recent['memberId'].isin(member_ids)]
+
+        recent_groups = recent.groupby('memberId', sort=False, observed=True)
+        # the recent transactions are sorted most recent first
+        last_transaction_time = recent_groups['lastTransatcionUtcTs'].first()
+        transaction_count = totals['transaction_count'].astype('float64')
+        window_averages = last_n_window_averages(recent, recent_groups.cumcount(), self.windows)
+
+        feature_table = pd.DataFrame({
+            'AVG_POINTS_BOUGHT': (totals['points_sum'].astype('float64') / totals['points_count']).round(2),
+            'AVG_REVENUE_USD': (totals['revenue_sum'].astype('float64') / totals['revenue_count']).round(2),
+            f'LAST_{self.n}_TRANSACTIONS_AVG_POINTS_BOUGHT': window_averages[f'LAST_{self.n}_TRANSACTIONS_AVG_POINTS_BOUGHT'].astype('float64'),
+            f'LAST_{self.n}_TRANSACTIONS_AVG_REVENUE_USD': window_averages[f'LAST_{self.n}_TRANSACTIONS_AVG_REVENUE_USD'].astype('float64'),
+            'PCT_BUY_TRANSACTIONS': (totals['buy_count'] / transaction_count).round(2),
+            'PCT_GIFT_TRANSACTIONS': (totals['gift_count'] / transaction_count).round(2),
+            'PCT_REDEEM_TRANSACTIONS': (totals['redeem_count'] / transaction_count).round(2),
+            'DAYS_SINCE_LAST_TRANSACTION': days_since(last_transaction_time, as_of_timestamp(as_of)),
+            **{column: window_averages[column].astype('float64') for column in window_averages.columns[2:]}
+        }, index=totals.index)
+        feature_table.index.name = 'memberId'
+
+        return feature_table.sort_index()
+
+@timed
+def stream_member_features(file_path, chunksize = 100000, n = 3, as_of = None):
+    """
+    Compute the feature table of a member data csv file by reading it in chunks, so that the whole file never has to fit in memory.
+    memberId is read as a string, so that a chunk with only numeric-looking ids does not change its type
+
+    Parameters:
+    - file_path (str): path to the csv file
+    - chunksize (int): number of rows read at a time
+    - n (int): number of recent transactions to consider for the LAST_n_TRANSACTIONS features
+    - as_of (str or datetime or pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at, in UTC (the current UTC time if None)
+
+    Returns:
+    - feature_table (pd.DataFrame): same as data_processing.build_member_feature_table
+    - latency (float): time taken to process the function
+    """
+    state = MemberFeatureState(n = n)
+    row_count = 0
+    for chunk in pd.read_csv(file_path, chunksize=chunksize, dtype={'memberId': str, 'lastTransatcionUtcTs': str, 'lastTransactionType': str}):
+        state.update(clean_member_data(chunk))
+        row_count += len(chunk)
+
+    feature_table = state.features(as_of = as_of)
+
+    logging.info('Streamed %s rows from %s into features for %s members', row_count, file_path, len(feature_table))
+
+    return feature_table
+
+
+if __name__ == "__main__":
+    # get current directory
+    path = os.getcwd()
+
+    chunksize = int(input('Enter the number of rows per chunk: '))
+
+    feature_table, latency = stream_member_features(path + '/member_data.csv', chunksize = chunksize)
+    print(feature_table)
+    print('latency: ', latency)
@@ -0,0 +1,284 @@
+import os
+import logging
+import sqlite3
+import threading
+
+import pandas as pd
+
+from .data_processing import read_member_data, clean_member_data, as_of_timestamp, FEATURE_COLUMNS
+from .feature_state import MemberFeatureState, COUNT_COLUMNS, RECENT_COLUMNS
+from .instrumentation import timed
+from .member_features import MemberFeatures
+
+# path of the feature store, can be overridden with the FEATURE_STORE_PATH environment variable
+DEFAULT_STORE_PATH = os.environ.get('FEATURE_STORE_PATH', 'feature_store.db')
+
+# the stored features; DAYS_SINCE_LAST_TRANSACTION changes every day, so the time of the last transaction is stored instead
+# and the days are computed when the features are looked up
+STORED_COLUMNS = [column for column in FEATURE_COLUMNS if column != 'DAYS_SINCE_LAST_TRANSACTION']
+
+CREATE_FEATURES_TABLE = (
+    'CREATE TABLE IF NOT EXISTS member_features ('
+    'memberId TEXT PRIMARY KEY, '
+    + ''.join(f'{column} REAL, ' for column in STORED_COLUMNS) +
+    'LAST_TRANSACTION_TS TEXT)'
+)
+
+# the MemberFeatureState of every member, so that new transactions can be added without reading the whole dataset again
+CREATE_STATE_TABLES = [
+    'CREATE TABLE IF NOT EXISTS member_totals (memberId TEXT PRIMARY KEY, ' + ', '.join(f'{column} REAL' for column in COUNT_COLUMNS) + ')',
+    'CREATE TABLE IF NOT EXISTS member_recent (memberId TEXT, lastTransatcionUtcTs TEXT, lastTransactionPointsBought REAL, lastTransactionRevenueUSD REAL)',
+    'CREATE INDEX IF NOT EXISTS member_recent_memberId ON member_recent (memberId)'
+]
+
+class FeatureStoreSchemaError(ValueError):
+    """
+    Feature store built with other feature columns than the current ones (e.g., by a previous version), to be rebuilt with build_feature_store
+    """
+
+def check_store_schema(connection, store_path):
+    """
+    Check that the features table of a store has the current feature columns
+
+    Parameters:
+    - connection (sqlite3.Connection): connection to the store
+    - store_path (str): path of the feature store file (used in the error message)
+
+    Raises:
+    - FeatureStoreSchemaError: if columns are missing from the features table
+    """
+    columns = {row[1] for row in connection.execute('PRAGMA table_info(member_features)')}
+    missing = [column for column in STORED_COLUMNS + ['LAST_TRANSACTION_TS'] if column not in columns]
+    if missing:
+        raise FeatureStoreSchemaError(f'The feature store {store_path} has no {", ".join(missing)} columns, rebuild it with build_feature_store')
+
+def write_member_features(connection, feature_table, last_transaction_time):
+    """
+    Insert or replace the features of the members of a feature table in the store
+
+    Parameters:
+    - connection (sqlite3.Connection): connection to the store
+    - feature_table (pd.DataFrame): feature table, as returned by build_member_feature_table
+    - last_transaction_time (pd.Series): time of the last transaction of each member of the feature table, as a "%Y-%m-%d %H:%M:%S" string
+
+    Returns:
+    - int: number of members written
+    """
+    columns = ['memberId'] + STORED_COLUMNS + ['LAST_TRANSACTION_TS']
+    rows = zip(
+        [str(member_id) for member_id in feature_table.index],
+        *[feature_table[column].astype('float64').tolist() for column in STORED_COLUMNS],
+        last_transaction_time.reindex(feature_table.index).tolist()
+    )
+    connection.executemany(f'INSERT OR REPLACE INTO member_features ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', rows)
+    return len(feature_table)
+
+def write_member_state(connection, state):
+    """
+    Write the aggregates and the features of the members of a MemberFeatureState to the store, replacing their previous rows
+
+    Parameters:
+    - connection (sqlite3.Connection): connection to the store
+    - state (MemberFeatureState): state of the members to write
+
+    Returns:
+    - int: number of members written
+    """
+    if len(state) == 0:
+        return 0
+
+    member_ids = [str(member_id) for member_id in state.totals.index]
+    connection.executemany(
+        f'INSERT OR REPLACE INTO member_totals (memberId, {", ".join(COUNT_COLUMNS)}) VALUES ({", ".join("?" * (len(COUNT_COLUMNS) + 1))})',
+        zip(member_ids, *[state.totals[column].astype('float64').tolist() for column in COUNT_COLUMNS])
+    )
+    connection.executemany('DELETE FROM member_recent WHERE memberId = ?', ((member_id,) for member_id in member_ids))
+    connection.executemany(
+        f'INSERT INTO member_recent ({", ".join(RECENT_COLUMNS)}) VALUES ({", ".join("?" * len(RECENT_COLUMNS))})',
+        zip(
+            state.recent['memberId'].astype(str).tolist(),
+            state.recent['lastTransatcionUtcTs'].astype(str).tolist(),
+            state.recent['lastTransactionPointsBought'].astype('float64').tolist(),
+            state.recent['lastTransactionRevenueUSD'].astype('float64').tolist()
+        )
+    )
+
+    # the recent transactions are sorted most recent first
+    last_transaction_time = state.recent.groupby('memberId', sort=False, observed=True)['lastTransatcionUtcTs'].first().astype(str)
+    return write_member_features(connection, state.features(), last_transaction_time)
+
+def read_member_state(connection, member_ids):
+    """
+    Read the MemberFeatureState of some members from the store
+
+    Parameters:
+    - connection (sqlite3.Connection): connection to the store
+    - member_ids (list): member_ids to read the state of (as strings)
+
+    Returns:
+    - MemberFeatureState: the state of the members that are in the store
+    """
+    connection.execute('CREATE TEMP TABLE IF NOT EXISTS selected_members (memberId TEXT PRIMARY KEY)')
+    connection.execute('DELETE FROM selected_members')
+    connection.executemany('INSERT OR IGNORE INTO selected_members VALUES (?)', ((member_id,) for member_id in member_ids))
+
+    totals = pd.read_sql_query('SELECT member_totals.* FROM member_totals JOIN selected_members USING (memberId)', connection, index_col='memberId')
+    recent = pd.read_sql_query('SELECT member_recent.* FROM member_recent JOIN selected_members USING (memberId)', connection)
+
+    state = MemberFeatureState()
+    if len(totals) > 0:
+        state.totals = totals
+        state.recent = recent.sort_values(by=['memberId', 'lastTransatcionUtcTs'], ascending=[True, False], kind='mergesort').reset_index(drop=True)
+    return state
+
+@timed
+def build_feature_store(dataset_file_path, store_path = DEFAULT_STORE_PATH):
+    """
+    Compute the features of every member in the dataset and materialize them in an SQLite feature store keyed by memberId,
+    along with the aggregates they are computed from (see update_feature_store).
+    The store is written to a temporary file that replaces the previous store once complete, so readers never see a partial store
+
+    Parameters:
+    - dataset_file_path (str): path to the complete dataset
+    - store_path (str): path of the feature store file
+
+    Returns:
+    - member_count (int): number of members in the store
+    - latency (float): time taken to process the function
+    """
+    member_data, _ = read_member_data(dataset_file_path)
+    state = MemberFeatureState()
+    state.update(member_data)
+
+    tmp_path = f'{store_path}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        with connection:
+            connection.execute(CREATE_FEATURES_TABLE)
+            for statement in CREATE_STATE_TABLES:
+                connection.execute(statement)
+            member_count = write_member_state(connection, state)
+    finally:
+        connection.close()
+    os.replace(tmp_path, store_path)
+
+    logging.info('Built feature store %s for %s members', store_path, member_count)
+
+    return member_count
+
+@timed
+def update_feature_store(transactions, store_path = DEFAULT_STORE_PATH):
+    """
+    Add new transactions to a feature store built by build_feature_store: the stored aggregates of the members with new transactions
+    are updated and only their features are recomputed, so the cost depends on the number of new transactions, not on the full history.
+    The update is a single transaction, so readers see either all or none of it
+
+    Parameters:
+    - transactions (pd.DataFrame): new transactions, with the same columns as the dataset
+    - store_path (str): path of the feature store file
+
+    Returns:
+    - member_ids (list): the member_ids whose features were updated
+    - latency (float): time taken to process the function
+    """
+    transactions = clean_member_data(transactions.copy())
+    transactions = transactions[transactions['memberId'].notna()]
+    # the store is keyed by the string member_id
+    transactions['memberId'] = transactions['memberId'].astype(str)
+
+    connection = sqlite3.connect(store_path)
+    try:
+        check_store_schema(connection, store_path)
+        with connection:
+            state = read_member_state(connection, transactions['memberId'].unique().tolist())
+            member_ids = state.update(transactions)
+            write_member_state(connection, state)
+    finally:
+        connection.close()
+
+    logging.info('Updated feature store %s with %s transactions of %s members', store_path, len(transactions), len(member_ids))
+
+    return member_ids
+
+class FeatureStore:
+    """
+    Read-only point lookups of MemberFeatures in a feature store built by build_feature_store: one indexed query per member
+    instead of a scan of the dataset
+    """
+    def __init__(self, store_path = DEFAULT_STORE_PATH):
+        """
+        Parameters:
+        - store_path (str): path of the feature store file
+
+        Raises:
+        - FileNotFoundError: if there is no feature store at store_path
+        - FeatureStoreSchemaError: if the store was built with other feature columns
+        """
+        if not os.path.exists(store_path):
+            raise FileNotFoundError(f'No feature store at {store_path}, build it with build_feature_store')
+        self.store_path = store_path
+        # the connection may be used from any thread of the server, one query at a time
+        self.connection = sqlite3.connect(f'file:{store_path}?mode=ro', uri=True, check_same_thread=False)
+        try:
+            check_store_schema(self.connection, store_path)
+        except FeatureStoreSchemaError:
+            self.connection.close()
+            raise
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM member_features').fetchone()[0]
+
+    def get(self, member_id, as_of = None):
+        """
+        Look up the features of a member
+
+        Parameters:
+        - member_id (str): member_id to look up
+        - as_of (str or datetime or pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at, in UTC (the current UTC time if None)
+
+        Returns:
+        - MemberFeatures or None: the features of the member, or None if the member is not in the store
+        """
+        with self.lock:
+            row = self.connection.execute(
+                f'SELECT {", ".join(STORED_COLUMNS)}, LAST_TRANSACTION_TS FROM member_features WHERE memberId = ?', (str(member_id),)
+            ).fetchone()
+        if row is None:
+            return None
+
+        features = dict(zip(STORED_COLUMNS, row[:-1]))
+        # same as calcualte_days_sicne_last_transaction
+        features['DAYS_SINCE_LAST_TRANSACTION'] = (as_of_timestamp(as_of) - pd.Timestamp(row[-1])).days
+        return MemberFeatures(**features)
+
+    def close(self):
+        """
+        Close the connection to the store
+        """
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    # get current directory
+    path = os.getcwd()
+
+    # build the store from the dataset, or add the transactions of another csv file to it
+    new_transactions_file = input('Enter the path to a csv file of new transactions (leave empty to build the store from the dataset): ')
+
+    if new_transactions_file:
+        member_ids, latency = update_feature_store(pd.read_csv(new_transactions_file))
+        print('updated members: ', len(member_ids))
+    else:
+        member_count, latency = build_feature_store(path + '/member_data.csv')
+        print('members: ', member_count)
+    print('latency: ', latency)
@@ -0,0 +1,491 @@
+import os
+import json
+import atexit
+import bisect
+import inspect
+import logging
+import threading
+import functools
+import contextvars
+from time import perf_counter_ns
+
+# instrumentation is off unless the INSTRUMENTATION environment variable is "on" (or "1", "true"); when it is off at import time,
+# the decorated functions are left undecorated, so the hot paths do not pay anything for it
+ENABLED = os.environ.get('INSTRUMENTATION', 'off').lower() in ('on', '1', 'true')
+
+# if set, the span trees are appended to this JSON lines file, and the histograms are written to this Prometheus text file at exit
+TRACE_FILE = os.environ.get('INSTRUMENTATION_TRACE_FILE')
+METRICS_FILE = os.environ.get('INSTRUMENTATION_METRICS_FILE')
+
+# upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values (e.g., durations in seconds) over fixed buckets, in the Prometheus model
+    """
+    def __init__(self, buckets = DEFAULT_BUCKETS):
+        """
+        Parameters:
+        - buckets (tuple): sorted upper bounds of the buckets (a +Inf bucket is always added)
+        """
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Add an observation
+
+        Parameters:
+        - value (float): observed value
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.bucket_counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def samples(self):
+        """
+        Return the samples of the histogram, in the Prometheus text format order
+
+        Returns:
+        - list: (suffix, extra labels, value) of the cumulative buckets, the sum and the count
+        """
+        with self.lock:
+            bucket_counts, count, total = list(self.bucket_counts), self.count, self.sum
+        samples = []
+        cumulative_count = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+            cumulative_count += bucket_count
+            samples.append(('_bucket', {'le': format_value(bound)}, cumulative_count))
+        samples.append(('_sum', {}, total))
+        samples.append(('_count', {}, count))
+        return samples
+
+class Counter:
+    """
+    Value that only goes up (e.g., a number of requests)
+    """
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount = 1):
+        """
+        Increase the counter
+
+        Parameters:
+        - amount (float): non-negative amount to add
+        """
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        return [('', {}, self.value)]
+
+class Gauge:
+    """
+    Value that goes up and down (e.g., a number of requests in progress)
+    """
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount = 1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount = 1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def samples(self):
+        return [('', {}, self.value)]
+
+class MetricsRegistry:
+    """
+    Named metric families (histograms, counters or gauges), each holding one metric per set of label values, that can be rendered
+    in the Prometheus text format
+    """
+    def __init__(self):
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def get(self, metric_class, name, help, labels, **kwargs):
+        """
+        Get the metric of a family with the given label values, creating the family and the metric if needed
+
+        Parameters:
+        - metric_class (type): class of the metrics of the family (e.g., Histogram)
+        - name (str): name of the family
+        - help (str): description of the family
+        - labels (dict): label values of the metric
+        - kwargs: arguments of the metric class, used when the metric is created
+
+        Returns:
+        - the metric
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.setdefault(name, {'class': metric_class, 'help': help, 'metrics': {}})
+            if family['class'] is not metric_class:
+                raise ValueError(f'Metric {name} is a {family["class"].__name__}, not a {metric_class.__name__}')
+            metric = family['metrics'].get(key)
+            if metric is None:
+                metric = family['metrics'][key] = metric_class(**kwargs)
+            return metric
+
+    def histogram(self, name, help = '', buckets = DEFAULT_BUCKETS, **labels):
+        """
+        Get the histogram of a family with the given label values
+
+        Parameters:
+        - name (str): name of the family
+        - help (str): description of the family
+        - buckets (tuple): upper bounds of the buckets, used when the histogram is created
+        - labels: label values of the histogram
+
+        Returns:
+        - Histogram: the histogram
+        """
+        return self.get(Histogram, name, help, labels, buckets = buckets)
+
+    def counter(self, name, help = '', **labels):
+        """
+        Get the counter of a family with the given label values
+
+        Parameters:
+        - name (str): name of the family
+        - help (str): description of the family
+        - labels: label values of the counter
+
+        Returns:
+        - Counter: the counter
+        """
+        return self.get(Counter, name, help, labels)
+
+    def gauge(self, name, help = '', **labels):
+        """
+        Get the gauge of a family with the given label values
+
+        Parameters:
+        - name (str): name of the family
+        - help (str): description of the family
+        - labels: label values of the gauge
+
+        Returns:
+        - Gauge: the gauge
+        """
+        return self.get(Gauge, name, help, labels)
+
+    def render_prometheus(self):
+        """
+        Render all the metrics in the Prometheus text exposition format
+
+        Returns:
+        - str: the metrics
+        """
+        with self.lock:
+            families = [(name, family['class'], family['help'], list(family['metrics'].items())) for name, family in sorted(self.families.items())]
+        lines = []
+        for name, metric_class, help, metrics in families:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {metric_class.__name__.lower()}')
+            for key, metric in metrics:
+                for suffix, extra_labels, value in metric.samples():
+                    lines.append(f'{name}{suffix}{format_labels({**dict(key), **extra_labels})} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """
+        Remove all the metrics
+        """
+        with self.lock:
+            self.families.clear()
+
+def format_labels(labels):
+    """
+    Format label values for the Prometheus text format
+
+    Parameters:
+    - labels (dict): label values
+
+    Returns:
+    - str: the labels in braces, or an empty string if there are none
+    """
+    if not labels:
+        return ''
+    escaped = {key: str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for key, value in labels.items()}
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped.items()) + '}'
+
+def format_value(value):
+    """
+    Format a sample value for the Prometheus text format
+
+    Parameters:
+    - value (float): value
+
+    Returns:
+    - str: the value (+Inf for infinity)
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# the metrics of the process: the histograms of the spans, and the metrics of the app (see app.MetricsMiddleware)
+REGISTRY = MetricsRegistry()
+
+class Span:
+    """
+    Timed section of code, nested in the span that was current when it started: the spans of a call form a tree whose root is exported
+    when it ends. The tree is only kept while an exporter is registered; otherwise each span only records its duration histogram.
+    The duration is measured with the monotonic perf_counter_ns clock
+    """
+    __slots__ = ('name', 'attributes', 'start_ns', 'duration_ns', 'children', 'token')
+
+    def __init__(self, name, attributes = None):
+        """
+        Parameters:
+        - name (str): name of the span, also the label of its duration histogram
+        - attributes (dict): values describing the span (e.g., the member_id)
+        """
+        self.name = name
+        self.attributes = attributes or {}
+        self.start_ns = None
+        self.duration_ns = None
+        self.children = []
+        self.token = None
+
+    @property
+    def seconds(self):
+        return self.duration_ns / 1e9 if self.duration_ns is not None else None
+
+    def __enter__(self):
+        self.token = current_span.set(self)
+        self.start_ns = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration_ns = perf_counter_ns() - self.start_ns
+        current_span.reset(self.token)
+        self.token = None
+
+        REGISTRY.histogram('span_duration_seconds', 'Duration of the instrumented spans', span = self.name).observe(self.duration_ns / 1e9)
+        if not EXPORTERS:
+            return
+        parent = current_span.get()
+        if parent is not None:
+            parent.children.append(self)
+        else:
+            for exporter in EXPORTERS:
+                exporter.export(self)
+
+    def to_dict(self):
+        """
+        Convert the span and its children to a dictionary
+
+        Returns:
+        - dict: name, attributes, start (perf_counter_ns) and duration in nanoseconds, and children of the span
+        """
+        return {
+            'name': self.name,
+            'attributes': self.attributes,
+            'start_ns': self.start_ns,
+            'duration_ns': self.duration_ns,
+            'children': [child.to_dict() for child in self.children]
+        }
+
+class NullSpan:
+    """
+    Span that does nothing, used when the instrumentation is off
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+NULL_SPAN = NullSpan()
+
+# the span of the current thread or task
+current_span = contextvars.ContextVar('current_span', default=None)
+
+def span(name, **attributes):
+    """
+    Time a section of code as a span of the current span tree
+
+    Parameters:
+    - name (str): name of the span
+    - attributes: values describing the span
+
+    Returns:
+    - Span or NullSpan: context manager of the span (a no-op if the instrumentation is off)
+    """
+    if not ENABLED:
+        return NULL_SPAN
+    return Span(name, attributes)
+
+def instrumented(function = None, name = None):
+    """
+    Decorator running each call of a function in a span named after the function. If the instrumentation is off at import time,
+    the function is returned undecorated
+
+    Parameters:
+    - function (callable): function to decorate (when used as @instrumented)
+    - name (str): name of the span (the name of the function if None, when used as @instrumented(name = ...))
+
+    Returns:
+    - callable: the decorated function
+    """
+    if function is None:
+        return lambda function: instrumented(function, name = name)
+    if not ENABLED:
+        return function
+    span_name = name or function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return function(*args, **kwargs)
+        with Span(span_name):
+            return function(*args, **kwargs)
+    return wrapper
+
+def timed(function = None, name = None):
+    """
+    Decorator for the functions that report their latency: the function returns its value only, and the decorated function returns
+    the value and the latency of the call in seconds (a decorated coroutine function returns them when awaited). The latency is the duration
+    of the span of the call when the instrumentation is on, and is measured with perf_counter_ns otherwise, so each call is timed once
+
+    Parameters:
+    - function (callable): function to decorate (when used as @timed)
+    - name (str): name of the span (the name of the function if None, when used as @timed(name = ...))
+
+    Returns:
+    - callable: the decorated function
+    """
+    if function is None:
+        return lambda function: timed(function, name = name)
+    span_name = name or function.__name__
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            if ENABLED:
+                with Span(span_name) as call_span:
+                    value = await function(*args, **kwargs)
+                return value, call_span.duration_ns / 1e9
+            start_ns = perf_counter_ns()
+            value = await function(*args, **kwargs)
+            return value, (perf_counter_ns() - start_ns) / 1e9
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if ENABLED:
+            with Span(span_name) as call_span:
+                value = function(*args, **kwargs)
+            return value, call_span.duration_ns / 1e9
+        start_ns = perf_counter_ns()
+        value = function(*args, **kwargs)
+        return value, (perf_counter_ns() - start_ns) / 1e9
+    return wrapper
+
+def enable():
+    """
+    Turn the instrumentation on (functions decorated while it was off stay undecorated)
+    """
+    global ENABLED
+    ENABLED = True
+
+def disable():
+    """
+    Turn the instrumentation off: span returns a no-op and the decorated functions skip their span
+    """
+    global ENABLED
+    ENABLED = False
+
+class JSONLinesExporter:
+    """
+    Exporter appending each finished span tree as a line of a JSON lines file
+    """
+    def __init__(self, path):
+        """
+        Parameters:
+        - path (str): path of the file (created if missing)
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+
+    def export(self, span):
+        """
+        Write a span tree
+
+        Parameters:
+        - span (Span): root span of the tree
+        """
+        line = json.dumps(span.to_dict(), default=str) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        """
+        Close the file
+        """
+        self.file.close()
+
+# exporters of the finished span trees
+EXPORTERS = []
+
+def add_exporter(exporter):
+    """
+    Export the finished span trees with an exporter
+
+    Parameters:
+    - exporter: object with an export(span) method, e.g., JSONLinesExporter
+    """
+    EXPORTERS.append(exporter)
+
+def remove_exporter(exporter):
+    """
+    Stop exporting the span trees with an exporter
+
+    Parameters:
+    - exporter: exporter previously added with add_exporter
+    """
+    EXPORTERS.remove(exporter)
+
+def write_prometheus(path, registry = REGISTRY):
+    """
+    Write the metrics of a registry to a file in the Prometheus text format (e.g., for the node exporter textfile collector).
+    The file is written to a temporary file first, so readers never see a partial file
+
+    Parameters:
+    - path (str): path of the file
+    - registry (MetricsRegistry): metrics to write
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(registry.render_prometheus())
+    os.replace(tmp_path, path)
+
+    logging.info('Wrote metrics to %s', path)
+
+
+if ENABLED and TRACE_FILE:
+    add_exporter(JSONLinesExporter(TRACE_FILE))
+if ENABLED and METRICS_FILE:
+    atexit.register(write_prometheus, METRICS_FILE)
@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+from .api_client import create_async_client
+from .benchmark import summarize_timings
+from .member_features import MemberFeatures
+from .prediction_ep import Prediction
+
+# request body of each endpoint the load is sent to
+PAYLOADS = {
+    '/score': MemberFeatures(
+        AVG_POINTS_BOUGHT = 1500.0, AVG_REVENUE_USD = 12.5, LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT = 2000.0, LAST_3_TRANSACTIONS_AVG_REVENUE_USD = 15.0,
+        PCT_BUY_TRANSACTIONS = 0.5, PCT_GIFT_TRANSACTIONS = 0.25, PCT_REDEEM_TRANSACTIONS = 0.25, DAYS_SINCE_LAST_TRANSACTION = 30
+    ).model_dump(),
+    '/offer/assign': Prediction(ats_prediction = 120.0, resp_prediction = 0.4).model_dump()
+}
+PAYLOADS['/ml/ats/predict'] = PAYLOADS['/score']
+PAYLOADS['/ml/resp/predict'] = PAYLOADS['/score']
+
+
+async def send_load(base_url, path, concurrency, duration, warmup):
+    """
+    Send requests to an endpoint from concurrency connections for a given duration, each connection sending its next request as soon as
+    it gets the previous response
+
+    Parameters:
+    - base_url (str): base url of the application server
+    - path (str): path of the endpoint, among PAYLOADS
+    - concurrency (int): number of requests in flight at the same time
+    - duration (float): seconds the requests are measured for
+    - warmup (float): seconds of requests sent before the measure, to open the connections and warm up the workers
+
+    Returns:
+    - timings (list): latency of each successful request in seconds
+    - errors (int): number of failed requests
+    - elapsed (float): seconds the requests were measured for
+    """
+    payload = PAYLOADS[path]
+    timings = []
+    errors = 0
+
+    async with create_async_client(base_url, pool_size = concurrency, timeout = 30.0) as client:
+        async def send_requests(deadline, measured):
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start_time = time.perf_counter()
+                try:
+                    response = await client.post(path, json=payload)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if measured:
+                    if ok:
+                        timings.append(time.perf_counter() - start_time)
+                    else:
+                        errors += 1
+
+        deadline = time.perf_counter() + warmup
+        await asyncio.gather(*(send_requests(deadline, False) for _ in range(concurrency)))
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(send_requests(start_time + duration, True) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start_time
+
+    return timings, errors, elapsed
+
+def send_load_process(base_url, path, concurrency, duration, warmup):
+    # entry point of the load generator processes
+    return asyncio.run(send_load(base_url, path, concurrency, duration, warmup))
+
+def run_load(base_url, path = '/score', concurrency = 16, duration = 10.0, warmup = 1.0, processes = 1):
+    """
+    Load test an endpoint. A single load generator process saturates its own core well before a multi-worker server, so the load
+    can be split between several processes, each with concurrency requests in flight
+
+    Parameters:
+    - base_url (str): base url of the application server
+    - path (str): path of the endpoint, among PAYLOADS
+    - concurrency (int): number of requests in flight at the same time, per process
+    - duration (float): seconds the requests are measured for
+    - warmup (float): seconds of requests sent before the measure
+    - processes (int): number of load generator processes
+
+    Returns:
+    - dict: number of requests and errors, requests per second, and latency percentiles in seconds
+    """
+    if processes == 1:
+        loads = [send_load_process(base_url, path, concurrency, duration, warmup)]
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(send_load_process, base_url, path, concurrency, duration, warmup) for _ in range(processes)]
+            loads = [future.result() for future in futures]
+
+    timings = [timing for load_timings, _, _ in loads for timing in load_timings]
+    errors = sum(load_errors for _, load_errors, _ in loads)
+    elapsed = max(load_elapsed for _, _, load_elapsed in loads)
+
+    report = {
+        'url': base_url + path,
+        'processes': processes,
+        'concurrency': concurrency * processes,
+        'duration': elapsed,
+        'requests': len(timings),
+        'errors': errors,
+        'requests_per_second': len(timings) / elapsed,
+        'latency': summarize_timings(timings)['latency'] if timings else None
+    }
+
+    logging.info('Sent %s requests to %s: %s requests/sec', len(timings), base_url + path, report['requests_per_second'])
+
+    return report
+
+def start_server(command, base_url, env = None, timeout = 30.0):
+    """
+    Start an application server in a subprocess and wait until it answers
+
+    Parameters:
+    - command (list): command starting the server
+    - base_url (str): base url the server listens on
+    - env (dict): environment variables added to the environment of the server
+    - timeout (float): seconds to wait for the server
+
+    Returns:
+    - subprocess.Popen: the server process
+    """
+    process = subprocess.Popen(command, env={**os.environ, **(env or {})}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(base_url + '/').status_code == 200:
+                return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'Server {" ".join(command)} did not start within {timeout} seconds')
+
+def compare_servers(path = '/score', concurrency = 16, duration = 10.0, workers = None, port = 8100, processes = 1):
+    """
+    Compare the throughput of the default setup (a single uvicorn process with the standard library JSON encoder) with the serving profile
+    of server.py (one worker per core and orjson responses), by running the same load against each of them in turn
+
+    Parameters:
+    - path (str): path of the endpoint, among PAYLOADS
+    - concurrency (int): number of requests in flight at the same time, per load generator process
+    - duration (float): seconds the requests are measured for, per setup
+    - workers (int): number of workers of the serving profile (one per core if None)
+    - port (int): port the servers listen on
+    - processes (int): number of load generator processes
+
+    Returns:
+    - dict: load test report of each setup, and the ratio of their requests per second
+    """
+    base_url = f'http://127.0.0.1:{port}'
+    server_command = [sys.executable, '-m', 'src.server', '--port', str(port)]
+    if workers:
+        server_command += ['--workers', str(workers)]
+    setups = {
+        'default': ([sys.executable, '-m', 'uvicorn', 'src.app:app', '--port', str(port)], {'JSON_RESPONSE': 'json'}),
+        'server': (server_command, {})
+    }
+
+    report = {}
+    for name, (command, env) in setups.items():
+        process = start_server(command, base_url, env)
+        try:
+            report[name] = run_load(base_url, path, concurrency, duration, processes = processes)
+        finally:
+            process.terminate()
+            process.wait()
+    report['speedup'] = report['server']['requests_per_second'] / report['default']['requests_per_second']
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test the application server, or compare the default setup with the serving profile of server.py')
+    parser.add_argument('--url', help='base url of a running server to load (the default setup and server.py are started and compared if not given)')
+    parser.add_argument('--path', default='/score', choices=sorted(PAYLOADS), help='endpoint to send the requests to')
+    parser.add_argument('--concurrency', type=int, default=16, help='number of requests in flight at the same time, per load generator process')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds the requests are measured for')
+    parser.add_argument('--workers', type=int, help='number of workers of the server.py profile (one per core by default)')
+    parser.add_argument('--processes', type=int, default=1, help='number of load generator processes')
+    parser.add_argument('--port', type=int, default=8100, help='port of the servers started for the comparison')
+    args = parser.parse_args()
+
+    if args.url:
+        report = run_load(args.url.rstrip('/'), args.path, args.concurrency, args.duration, processes = args.processes)
+    else:
+        report = compare_servers(args.path, args.concurrency, args.duration, args.workers, args.port, args.processes)
+    sys.stdout.write(json.dumps(report, indent=4) + '\n')
@@ -0,0 +1,122 @@
+import os
+import zlib
+import logging
+import functools
+import contextlib
+import contextvars
+import inspect
+from collections import Counter
+
+# fraction of the members whose per-member log records are written, outside of a batch (all of them by default)
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1.0))
+
+# fraction of the members whose per-member log records are still written inside a batch, where the others are only counted
+# in the summary record of the batch (none of them by default)
+LOG_BATCH_SAMPLE_RATE = float(os.environ.get('LOG_BATCH_SAMPLE_RATE', 0.0))
+
+
+def is_sampled(member_id, rate):
+    """
+    Decide whether the log records of a member are written. The decision only depends on the member_id, so either all or none
+    of the records of a member are written
+
+    Parameters:
+    - member_id (str): member_id
+    - rate (float): fraction of the members that are sampled
+
+    Returns:
+    - bool: whether the member is sampled
+    """
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    return zlib.crc32(str(member_id).encode()) < rate * 2 ** 32
+
+class LogBatch:
+    """
+    Per-member log records of a batch, counted by message instead of being written, and summarized in a single record at the end of the batch
+    """
+    def __init__(self, name):
+        """
+        Parameters:
+        - name (str): name of the batch, used in the summary record
+        """
+        self.name = name
+        self.counts = Counter()
+
+    def summary(self):
+        """
+        Write the summary record of the batch
+        """
+        if not self.counts:
+            return
+        # dict views are safe to read while tasks of the batch may still be counting
+        counts = ', '.join(f'{count} x "{msg}"' for msg, count in list(self.counts.items()))
+        logging.info('Batch %s: %d per-member log records summarized: %s', self.name, sum(self.counts.values()), counts)
+
+# the batch of the current thread or task, if any
+current_batch = contextvars.ContextVar('current_batch', default=None)
+
+def log_member(member_id, msg, *args, level = logging.INFO):
+    """
+    Log a per-member record with lazy %-formatting: the message is only formatted if the level is enabled and the member is sampled.
+    Inside a batch (see log_batch), the record is counted in the summary of the batch instead, unless the member is sampled at LOG_BATCH_SAMPLE_RATE
+
+    Parameters:
+    - member_id (str): member_id the record is about
+    - msg (str): message, with %s placeholders for args
+    - args: arguments of the message
+    - level (int): level of the record
+    """
+    batch = current_batch.get()
+    if batch is not None:
+        batch.counts[msg] += 1
+        rate = LOG_BATCH_SAMPLE_RATE
+    else:
+        rate = LOG_SAMPLE_RATE
+    if logging.getLogger().isEnabledFor(level) and is_sampled(member_id, rate):
+        # attribute the record to the caller
+        logging.log(level, msg, *args, stacklevel=2)
+
+@contextlib.contextmanager
+def log_batch(name):
+    """
+    Replace the per-member log records written with log_member by a single summary record at the end of the block
+
+    Parameters:
+    - name (str): name of the batch
+
+    Returns:
+    - LogBatch: the batch
+    """
+    batch = LogBatch(name)
+    token = current_batch.set(batch)
+    try:
+        yield batch
+    finally:
+        current_batch.reset(token)
+        batch.summary()
+
+def batch_logged(function):
+    """
+    Decorator running each call of a function (or coroutine function) in a log_batch named after the function
+
+    Parameters:
+    - function (callable): function to decorate
+
+    Returns:
+    - callable: the decorated function
+    """
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            with log_batch(function.__name__):
+                return await function(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with log_batch(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
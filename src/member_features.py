@@ -11,3 +11,8 @@ class MemberFeatures(BaseModel):
     PCT_GIFT_TRANSACTIONS: Optional[float] = 0.0
     PCT_REDEEM_TRANSACTIONS: Optional[float] = 0.0
     DAYS_SINCE_LAST_TRANSACTION: Optional[int] = 0
+    # longer windows of the LAST_3_TRANSACTIONS features, optional for clients that only send the features above
+    LAST_5_TRANSACTIONS_AVG_POINTS_BOUGHT: Optional[float] = None
+    LAST_5_TRANSACTIONS_AVG_REVENUE_USD: Optional[float] = None
+    LAST_10_TRANSACTIONS_AVG_POINTS_BOUGHT: Optional[float] = None
+    LAST_10_TRANSACTIONS_AVG_REVENUE_USD: Optional[float] = None
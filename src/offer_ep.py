@@ -1,4 +1,5 @@
 from .prediction_ep import Prediction
+import numpy as np
 
 
 def get_offer(prediction: Prediction) -> dict:
@@ -7,3 +8,11 @@ def get_offer(prediction: Prediction) -> dict:
     else:
         result = "OFFER_1"
     return {"offer": result}
+
+
+# Vectorized version of get_offer. predictions is anything indexable by the Prediction field
+# names that yields one value per member (a DataFrame, a structured array, or a dict of arrays).
+def get_offer_batch(predictions) -> np.ndarray:
+    ats_prediction = np.asarray(predictions["ats_prediction"], dtype=np.float64)
+    resp_prediction = np.asarray(predictions["resp_prediction"], dtype=np.float64)
+    return np.where(ats_prediction * resp_prediction >= 200, "OFFER_2", "OFFER_1")
@@ -0,0 +1,183 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from .data_processing import read_member_data, build_member_feature_table, IndexedMemberData, as_of_timestamp
+from .instrumentation import timed
+
+
+def to_numeric_columns(member_data):
+    """
+    Encode the member data as numeric arrays that can be placed in shared memory, sorted by member and most recent transaction first
+
+    Parameters:
+    - member_data (pd.DataFrame or IndexedMemberData): input member data
+
+    Returns:
+    - columns (dict): numpy array per column; memberId and lastTransactionType are integer codes and lastTransatcionUtcTs is in nanoseconds
+    - member_ids (list): member_id of each memberId code
+    - transaction_types (list): transaction type of each lastTransactionType code
+    """
+    if not isinstance(member_data, IndexedMemberData):
+        member_data = IndexedMemberData(member_data)
+    sorted_data = member_data.data
+
+    member_codes, member_ids = pd.factorize(sorted_data['memberId'])
+    type_codes, transaction_types = pd.factorize(sorted_data['lastTransactionType'])
+    timestamps = pd.to_datetime(sorted_data['lastTransatcionUtcTs'], format="%Y-%m-%d %H:%M:%S")
+
+    # rows without a memberId are not part of any member's features
+    has_member = member_codes >= 0
+    columns = {
+        'memberId': member_codes[has_member].astype(np.int64),
+        'lastTransatcionUtcTs': timestamps.to_numpy(dtype='datetime64[ns]')[has_member].view(np.int64),
+        'lastTransactionType': type_codes[has_member].astype(np.int64),
+        'lastTransactionPointsBought': sorted_data['lastTransactionPointsBought'].to_numpy(dtype=np.float64)[has_member],
+        'lastTransactionRevenueUSD': sorted_data['lastTransactionRevenueUSD'].to_numpy(dtype=np.float64)[has_member]
+    }
+    return columns, member_ids.tolist(), transaction_types.tolist()
+
+def split_member_ranges(member_codes, chunks):
+    """
+    Split the rows into at most chunks contiguous ranges of roughly equal size, without splitting the transactions of a member
+
+    Parameters:
+    - member_codes (np.ndarray): sorted member code of each row
+    - chunks (int): number of ranges to split the rows into
+
+    Returns:
+    - list: (start, stop) row range of each chunk
+    """
+    if len(member_codes) == 0:
+        return []
+    member_starts = np.concatenate(([0], np.flatnonzero(np.diff(member_codes)) + 1))
+    targets = np.linspace(0, len(member_codes), chunks + 1)[1:-1]
+    # move every split point to the start of the member it falls into
+    boundaries = np.unique(np.concatenate(([0], member_starts[np.searchsorted(member_starts, targets, side='right') - 1], [len(member_codes)])))
+    return list(zip(boundaries[:-1].tolist(), boundaries[1:].tolist()))
+
+def compute_feature_chunk(columns, transaction_types, start, stop, as_of = None):
+    """
+    Compute the feature table of the members in rows start to stop of the numeric columns
+
+    Parameters:
+    - columns (dict): numpy array per column, as returned by to_numeric_columns
+    - transaction_types (list): transaction type of each lastTransactionType code
+    - start (int): first row of the chunk
+    - stop (int): row after the last row of the chunk
+    - as_of (pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at (the current UTC time if None)
+
+    Returns:
+    - pd.DataFrame: feature table of the chunk, indexed by memberId code
+    """
+    chunk = pd.DataFrame({
+        'memberId': columns['memberId'][start:stop],
+        'lastTransatcionUtcTs': columns['lastTransatcionUtcTs'][start:stop].view('datetime64[ns]'),
+        'lastTransactionType': pd.Categorical.from_codes(columns['lastTransactionType'][start:stop], categories=transaction_types),
+        'lastTransactionPointsBought': columns['lastTransactionPointsBought'][start:stop],
+        'lastTransactionRevenueUSD': columns['lastTransactionRevenueUSD'][start:stop]
+    })
+    feature_table, _ = build_member_feature_table(chunk, as_of = as_of)
+    return feature_table
+
+def compute_feature_chunk_shared(shared_columns, transaction_types, start, stop, as_of = None):
+    """
+    Worker process entry point: attach to the shared memory blocks of the columns and compute the feature table of a chunk
+
+    Parameters:
+    - shared_columns (dict): (shared memory name, dtype, length) of each column
+    - transaction_types (list): transaction type of each lastTransactionType code
+    - start (int): first row of the chunk
+    - stop (int): row after the last row of the chunk
+    - as_of (pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at (the current UTC time if None)
+
+    Returns:
+    - pd.DataFrame: feature table of the chunk, indexed by memberId code
+    """
+    blocks = {column: shared_memory.SharedMemory(name=name) for column, (name, dtype, length) in shared_columns.items()}
+    try:
+        columns = {column: np.ndarray((length,), dtype=dtype, buffer=blocks[column].buf) for column, (name, dtype, length) in shared_columns.items()}
+        feature_table = compute_feature_chunk(columns, transaction_types, start, stop, as_of)
+        # drop the views before closing the blocks they point into
+        del columns
+        return feature_table
+    finally:
+        for block in blocks.values():
+            block.close()
+
+@timed
+def build_member_feature_table_parallel(member_data, workers = None, executor = 'process', as_of = None):
+    """
+    Compute the feature table of every member on a pool of workers, each worker handling a contiguous range of members.
+    With process workers, the transaction table is placed in shared memory once and each worker reads its range from there instead of
+    receiving a pickled copy
+
+    Parameters:
+    - member_data (pd.DataFrame or IndexedMemberData): input member data
+    - workers (int): number of workers (the number of CPUs if None)
+    - executor (str): 'process' for a process pool, or 'thread' for a thread pool (pandas releases the GIL in parts of the computation)
+    - as_of (str or datetime or pd.Timestamp): time to compute DAYS_SINCE_LAST_TRANSACTION at, in UTC (the current UTC time if None)
+
+    Returns:
+    - feature_table (pd.DataFrame): same as build_member_feature_table
+    - latency (float): time taken to process the function
+    """
+    workers = workers or os.cpu_count() or 1
+    # resolved once, so that every worker computes the days to the same time
+    as_of = as_of_timestamp(as_of)
+
+    columns, member_ids, transaction_types = to_numeric_columns(member_data)
+    ranges = split_member_ranges(columns['memberId'], workers)
+
+    if executor == 'thread':
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            chunk_tables = list(pool.map(lambda row_range: compute_feature_chunk(columns, transaction_types, *row_range, as_of), ranges))
+    elif executor == 'process':
+        blocks = []
+        try:
+            shared_columns = {}
+            for column, values in columns.items():
+                block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+                blocks.append(block)
+                np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+                shared_columns[column] = (block.name, values.dtype.str, len(values))
+
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(compute_feature_chunk_shared, shared_columns, transaction_types, start, stop, as_of) for start, stop in ranges]
+                chunk_tables = [future.result() for future in futures]
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+    else:
+        raise ValueError(f"executor must be 'process' or 'thread', got {executor!r}")
+
+    if chunk_tables:
+        feature_table = pd.concat(chunk_tables)
+        # map the member codes back to the member ids
+        feature_table.index = pd.Index([member_ids[code] for code in feature_table.index], name='memberId')
+    else:
+        # no members to compute, the table is still built to get the feature columns
+        feature_table, _ = build_member_feature_table(member_data, as_of = as_of)
+
+    logging.info('Built feature table for %s members on %s %s workers', len(feature_table), len(ranges), executor)
+
+    return feature_table
+
+
+if __name__ == "__main__":
+    # get current directory
+    path = os.getcwd()
+
+    # reading dataset
+    member_data, read_data_latency = read_member_data(path + '/member_data.csv')
+
+    workers = int(input('Enter the number of workers: '))
+
+    feature_table, latency = build_member_feature_table_parallel(member_data, workers = workers)
+    print(feature_table)
+    print('latency: ', latency)
@@ -1,5 +1,6 @@
 from .member_features import MemberFeatures
 from pydantic import BaseModel
+import numpy as np
 
 
 class Prediction(BaseModel):
@@ -35,3 +36,70 @@ def predict_resp(member_features: MemberFeatures) -> dict:
     day_weight = 1 / (member_features.DAYS_SINCE_LAST_TRANSACTION + 1)
     product = product_weight * revenue_weight * day_weight
     return {"prediction": min(0.9, 1000 * product)}
+
+
+# Vectorized versions of the endpoints above. member_features is anything indexable by the
+# MemberFeatures field names that yields one value per member: a DataFrame, a structured
+# array, or a dict of arrays. They apply the same arithmetic in the same order as the scalar
+# functions so the results are identical.
+def _feature_column(member_features, name: str) -> np.ndarray:
+    return np.asarray(member_features[name], dtype=np.float64)
+
+
+# the features each prediction is computed from
+ATS_FEATURES = (
+    "LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT",
+    "AVG_POINTS_BOUGHT",
+    "PCT_BUY_TRANSACTIONS",
+    "PCT_GIFT_TRANSACTIONS",
+    "PCT_REDEEM_TRANSACTIONS",
+)
+RESP_FEATURES = (
+    "PCT_BUY_TRANSACTIONS",
+    "PCT_GIFT_TRANSACTIONS",
+    "PCT_REDEEM_TRANSACTIONS",
+    "AVG_REVENUE_USD",
+    "LAST_3_TRANSACTIONS_AVG_REVENUE_USD",
+    "DAYS_SINCE_LAST_TRANSACTION",
+)
+
+
+def unscorable_members(member_features, features) -> list:
+    # (position, feature, value) of the members the scalar functions cannot score: a missing feature (TypeError) or, for RESP,
+    # DAYS_SINCE_LAST_TRANSACTION = -1 (ZeroDivisionError), for which the vectorized functions would return NaN or inf
+    unscorable = []
+    for name in features:
+        for i, value in enumerate(member_features[name]):
+            if value is None or (name == "DAYS_SINCE_LAST_TRANSACTION" and value == -1):
+                unscorable.append((i, name, value))
+    return sorted(unscorable, key=lambda member: member[0])
+
+
+def predict_ats_batch(member_features) -> np.ndarray:
+    expected_volume = (
+        _feature_column(member_features, "LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT") * 0.7
+        + _feature_column(member_features, "AVG_POINTS_BOUGHT") * 0.3
+    )
+    weight = (
+        _feature_column(member_features, "PCT_BUY_TRANSACTIONS")
+        + _feature_column(member_features, "PCT_GIFT_TRANSACTIONS")
+        - _feature_column(member_features, "PCT_REDEEM_TRANSACTIONS")
+    )
+    weight = np.where(weight < 0, 0, weight)
+    return np.abs(expected_volume * weight)
+
+
+def predict_resp_batch(member_features) -> np.ndarray:
+    product_weight = (
+        _feature_column(member_features, "PCT_BUY_TRANSACTIONS") * 0.4
+        + _feature_column(member_features, "PCT_GIFT_TRANSACTIONS") * 0.3
+        + _feature_column(member_features, "PCT_REDEEM_TRANSACTIONS") * 0.3
+    )
+    revenue_weight = (
+        _feature_column(member_features, "AVG_REVENUE_USD") * 0.3
+        + _feature_column(member_features, "LAST_3_TRANSACTIONS_AVG_REVENUE_USD") * 0.7
+    ) / 100
+    day_weight = 1 / (_feature_column(member_features, "DAYS_SINCE_LAST_TRANSACTION") + 1)
+    product = 1000 * (product_weight * revenue_weight * day_weight)
+    # min(0.9, x) returns x only when x < 0.9, which np.minimum does not match for NaN
+    return np.where(product < 0.9, product, 0.9)
@@ -0,0 +1,305 @@
+import re
+import math
+from decimal import Decimal
+from typing import get_args
+
+from pydantic.version import VERSION as PYDANTIC_VERSION
+
+from .member_features import MemberFeatures
+from .prediction_ep import Prediction
+
+
+class RecordValidationError(ValueError):
+    """
+    Invalid values for the fields of a record, reported in the same format as pydantic's ValidationError
+    """
+    def __init__(self, errors):
+        """
+        Parameters:
+        - errors (list): one dict per invalid field, see error_details
+        """
+        super().__init__(f'{len(errors)} validation error(s): ' + '; '.join(f'{".".join(map(str, error["loc"]))}: {error["msg"]}' for error in errors))
+        self.error_list = errors
+
+    def errors(self):
+        return self.error_list
+
+# documentation of the error types, linked from each error as pydantic does
+ERRORS_URL = f'https://errors.pydantic.dev/{".".join(PYDANTIC_VERSION.split(".")[:2])}/v/'
+
+def error_details(type, loc, msg, input):
+    """
+    Describe a validation error the way pydantic does
+
+    Parameters:
+    - type (str): pydantic error type (e.g., float_parsing)
+    - loc (tuple): location of the invalid value
+    - msg (str): error message
+    - input: invalid value
+
+    Returns:
+    - dict: type, loc, msg, input and url of the error
+    """
+    return {'type': type, 'loc': loc, 'msg': msg, 'input': input, 'url': ERRORS_URL + type}
+
+class FieldError(ValueError):
+    # invalid value of a single field
+    def __init__(self, type, msg):
+        super().__init__(msg)
+        self.type = type
+        self.msg = msg
+
+# integer strings accepted by pydantic (once the underscores are stripped): ASCII digits, optionally followed by a decimal point and zeros
+INT_STRING = re.compile(r'[+-]?[0-9]+(?:\.0*)?')
+
+# longer integer strings are rejected with int_parsing_size
+MAX_INT_STRING_LENGTH = 4300
+
+def decode_text(value):
+    # str or UTF-8 bytes as a str (None if the bytes are not valid UTF-8)
+    if isinstance(value, str):
+        return value
+    try:
+        return value.decode()
+    except UnicodeDecodeError:
+        return None
+
+def strip_underscores(text):
+    # pydantic reads numbers with single underscores between their characters (e.g., "1_000"), but not leading, trailing or double ones
+    if text.startswith('_') or text.endswith('_') or '__' in text:
+        return None
+    return text.replace('_', '')
+
+def validate_float(value):
+    """
+    Validate a float field the way pydantic does in lax mode: floats, integers, decimals, booleans and numeric strings are accepted
+
+    Parameters:
+    - value: input value
+
+    Returns:
+    - float: the validated value
+
+    Raises:
+    - FieldError: if the value is not a number
+    """
+    if type(value) is float:
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        try:
+            return float(value)
+        except OverflowError:
+            # integers too large for a float
+            raise FieldError('float_type', 'Input should be a valid number')
+    if isinstance(value, (str, bytes)):
+        text = decode_text(value)
+        if text is not None and '_' in text:
+            text = strip_underscores(text)
+        # unlike float(), pydantic does not strip whitespace nor accept non-ASCII digits
+        if text is not None and text.isascii() and text == text.strip():
+            try:
+                return float(text)
+            except ValueError:
+                pass
+        raise FieldError('float_parsing', 'Input should be a valid number, unable to parse string as a number')
+    raise FieldError('float_type', 'Input should be a valid number')
+
+def validate_int(value):
+    """
+    Validate an integer field the way pydantic does in lax mode: integers, booleans, floats and decimals without a fractional part and integer
+    strings are accepted
+
+    Parameters:
+    - value: input value
+
+    Returns:
+    - int: the validated value
+
+    Raises:
+    - FieldError: if the value is not an integer
+    """
+    if type(value) is int:
+        return value
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, (float, Decimal)):
+        if not (value.is_finite() if isinstance(value, Decimal) else math.isfinite(value)):
+            raise FieldError('finite_number', 'Input should be a finite number')
+        if value != int(value):
+            raise FieldError('int_from_float', 'Input should be a valid integer, got a number with a fractional part')
+        # floats are limited to 64-bit integers, decimals are not
+        if isinstance(value, float) and abs(value) >= 2 ** 63:
+            raise FieldError('int_parsing_size', 'Unable to parse input string as an integer, exceeded maximum size')
+        return int(value)
+    if isinstance(value, (str, bytes)):
+        text = decode_text(value)
+        if text is not None and len(text) > MAX_INT_STRING_LENGTH:
+            raise FieldError('int_parsing_size', 'Unable to parse input string as an integer, exceeded maximum size')
+        # underscores are not accepted along with a decimal point
+        if text is not None and '.' not in text:
+            text = strip_underscores(text)
+        if text is not None and INT_STRING.fullmatch(text):
+            return int(text.partition('.')[0])
+        raise FieldError('int_parsing', 'Input should be a valid integer, unable to parse string as an integer')
+    raise FieldError('int_type', 'Input should be a valid integer')
+
+def record_fields(model):
+    """
+    Derive the fields of a record from a pydantic model, so that the model stays the single definition of the schema
+
+    Parameters:
+    - model (type): pydantic model with float and integer fields (optional or not)
+
+    Returns:
+    - tuple: (name, type, validator, whether None is accepted, whether the field is required, default) of each field
+    """
+    fields = []
+    for name, field in model.model_fields.items():
+        types = get_args(field.annotation) or (field.annotation,)
+        field_type = int if int in types else float
+        validate = validate_int if field_type is int else validate_float
+        fields.append((name, field_type, validate, type(None) in types, field.is_required(), None if field.is_required() else field.default))
+    return tuple(fields)
+
+# marker of a missing value
+MISSING = object()
+
+class Record:
+    """
+    Compact counterpart of a pydantic model: a __slots__ class with the same fields, validated by plain Python functions. It is cheaper
+    to construct and to serialize than the model, for the request hot paths
+    """
+    __slots__ = ()
+    # the pydantic model and the fields of the record, set by the subclasses
+    model = None
+    fields = ()
+
+    def __init__(self, **values):
+        """
+        Validate the values of the fields, the way the model would (missing fields take their default, unknown fields are ignored)
+
+        Parameters:
+        - values: values of the fields
+
+        Raises:
+        - RecordValidationError: if any value is invalid or a required field is missing
+        """
+        self.set_fields(values)
+
+    def set_fields(self, values):
+        # set the fields from a dict of values, see __init__
+        errors = None
+        for name, field_type, validate, optional, required, default in self.fields:
+            value = values.get(name, MISSING)
+            if value is MISSING:
+                if required:
+                    errors = errors or []
+                    errors.append(error_details('missing', (name,), 'Field required', values))
+                    continue
+                value = default
+            # values of the exact type (what JSON decoding gives) are accepted without calling the validator
+            elif type(value) is not field_type and (value is not None or not optional):
+                try:
+                    value = validate(value)
+                except FieldError as e:
+                    errors = errors or []
+                    errors.append(error_details(e.type, (name,), e.msg, value))
+                    continue
+            setattr(self, name, value)
+        if errors:
+            raise RecordValidationError(errors)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Validate a decoded JSON object
+
+        Parameters:
+        - data: decoded JSON value
+
+        Returns:
+        - Record: the record
+
+        Raises:
+        - RecordValidationError: if data is not an object or any value is invalid
+        """
+        if not isinstance(data, dict):
+            raise RecordValidationError([error_details('model_attributes_type', (), 'Input should be a valid dictionary or object to extract fields from', data)])
+        record = cls.__new__(cls)
+        record.set_fields(data)
+        return record
+
+    @classmethod
+    def from_model(cls, model):
+        """
+        Convert an instance of the model (already validated, so the values are copied as they are)
+
+        Parameters:
+        - model (BaseModel): instance of the model
+
+        Returns:
+        - Record: the record
+        """
+        record = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(record, name, getattr(model, name))
+        return record
+
+    @classmethod
+    def dump(cls, obj):
+        """
+        Serialize a record or an instance of the model to a JSON-ready dict, without going through pydantic
+
+        Parameters:
+        - obj (Record or BaseModel): object with the fields of the record
+
+        Returns:
+        - dict: the values of the fields
+        """
+        return {name: getattr(obj, name) for name in cls.__slots__}
+
+    def as_dict(self):
+        """
+        Return the values of the fields
+
+        Returns:
+        - dict: the values of the fields
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    # same interface as the models, so that a record can be passed wherever a model is serialized
+    dict = as_dict
+    model_dump = as_dict
+
+    def to_model(self):
+        """
+        Convert the record to an instance of the model
+
+        Returns:
+        - BaseModel: the model instance
+        """
+        return self.model.model_construct(**self.as_dict())
+
+    def __eq__(self, other):
+        if isinstance(other, (type(self), self.model)):
+            return self.as_dict() == self.dump(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'{type(self).__name__}(' + ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__) + ')'
+
+class MemberFeaturesRecord(Record):
+    """
+    Compact counterpart of MemberFeatures
+    """
+    __slots__ = tuple(MemberFeatures.model_fields)
+    model = MemberFeatures
+    fields = record_fields(MemberFeatures)
+
+class PredictionRecord(Record):
+    """
+    Compact counterpart of Prediction
+    """
+    __slots__ = tuple(Prediction.model_fields)
+    model = Prediction
+    fields = record_fields(Prediction)
@@ -0,0 +1,143 @@
+import os
+import json
+import logging
+import sqlite3
+
+
+def to_json(row):
+    """
+    Serialize a flat result row to JSON
+
+    Parameters:
+    - row (dict): flat result row (see excel.flatten_summary)
+
+    Returns:
+    - str: JSON representation of the row
+    """
+    # numpy scalars are converted to the python values they hold
+    return json.dumps(row, default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+
+class SQLiteResultStore:
+    """
+    Result sink keeping the latest result row of each member in an SQLite table keyed by member_id, so that saving a result is a single
+    indexed upsert instead of a rewrite of all the results
+    """
+    def __init__(self, path):
+        """
+        Parameters:
+        - path (str): path of the SQLite file (created if missing)
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results (member_id TEXT PRIMARY KEY, data TEXT)')
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def upsert(self, row):
+        """
+        Save the result row of a member, replacing the previous row of the member if any
+
+        Parameters:
+        - row (dict): flat result row, including the member_id
+        """
+        with self.connection:
+            # replacing a row gives it a new rowid, so the rows stay in the order they were last saved
+            self.connection.execute('INSERT OR REPLACE INTO results (member_id, data) VALUES (?, ?)', (str(row['member_id']), to_json(row)))
+
+    def rows(self):
+        """
+        Return the latest result row of each member
+
+        Returns:
+        - list: result rows, in the order they were last saved
+        """
+        return [json.loads(data) for (data,) in self.connection.execute('SELECT data FROM results ORDER BY rowid')]
+
+    def close(self):
+        """
+        Close the connection to the store
+        """
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class JSONLinesResultLog:
+    """
+    Result sink appending each result row as a line of a JSON lines file: saving a result only appends to the file, and the latest row of a
+    member wins when reading. The log is compacted (rewritten with the latest row of each member only) every compact_every rows
+    """
+    def __init__(self, path, compact_every = None):
+        """
+        Parameters:
+        - path (str): path of the log file (created if missing)
+        - compact_every (int): number of appended rows after which the log is compacted (never compacted automatically if None)
+        """
+        self.path = path
+        self.compact_every = compact_every
+        self.appended = 0
+        self.file = open(path, 'a')
+
+    def __len__(self):
+        return len(self.rows())
+
+    def upsert(self, row):
+        """
+        Save the result row of a member, superseding the previous row of the member if any
+
+        Parameters:
+        - row (dict): flat result row, including the member_id
+        """
+        self.file.write(to_json(row) + '\n')
+        self.file.flush()
+        self.appended += 1
+        if self.compact_every and self.appended >= self.compact_every:
+            self.compact()
+
+    def rows(self):
+        """
+        Return the latest result row of each member
+
+        Returns:
+        - list: result rows, in the order they were last saved
+        """
+        latest = {}
+        with open(self.path) as f:
+            for line in f:
+                row = json.loads(line)
+                # remove the previous row first, so that the member moves to the position of its latest row
+                latest.pop(str(row['member_id']), None)
+                latest[str(row['member_id'])] = row
+        return list(latest.values())
+
+    def compact(self):
+        """
+        Rewrite the log with only the latest row of each member
+        """
+        rows = self.rows()
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.writelines(to_json(row) + '\n' for row in rows)
+        self.file.close()
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, 'a')
+        self.appended = 0
+
+        logging.info('Compacted result log %s to %s rows', self.path, len(rows))
+
+    def close(self):
+        """
+        Close the log file
+        """
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
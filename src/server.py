@@ -0,0 +1,69 @@
+import os
+import logging
+import argparse
+
+import uvicorn
+
+# number of worker processes, one per core unless the WEB_CONCURRENCY environment variable is set
+DEFAULT_WORKERS = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+
+
+def run(host = '127.0.0.1', port = 8000, workers = DEFAULT_WORKERS, keep_alive = 5, backlog = 2048, limit_concurrency = None, limit_max_requests = None, access_log = False, log_level = 'warning'):
+    """
+    Serve app.py with uvicorn, tuned for throughput: several worker processes sharing the listening socket, uvloop and httptools when they are
+    installed, and no access log
+
+    Parameters:
+    - host (str): address to bind
+    - port (int): port to bind
+    - workers (int): number of worker processes
+    - keep_alive (int): seconds an idle keep-alive connection is kept open
+    - backlog (int): maximum number of connections waiting to be accepted
+    - limit_concurrency (int): maximum number of concurrent connections or requests per worker, beyond which 503 is returned (no limit if None)
+    - limit_max_requests (int): number of requests after which a worker is restarted (never if None)
+    - access_log (bool): whether to log every request
+    - log_level (str): level of the uvicorn logs
+    """
+    logging.info('Starting %s workers on %s:%s', workers, host, port)
+
+    # the app is given as an import string, so that each worker imports its own copy
+    uvicorn.run(
+        'src.app:app',
+        host=host,
+        port=port,
+        workers=workers,
+        loop='auto',
+        http='auto',
+        timeout_keep_alive=keep_alive,
+        backlog=backlog,
+        limit_concurrency=limit_concurrency,
+        limit_max_requests=limit_max_requests,
+        access_log=access_log,
+        log_level=log_level
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve the prediction and offer endpoints with several uvicorn workers')
+    parser.add_argument('--host', default='127.0.0.1', help='address to bind')
+    parser.add_argument('--port', type=int, default=8000, help='port to bind')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='number of worker processes (one per core by default)')
+    parser.add_argument('--keep-alive', type=int, default=5, help='seconds an idle keep-alive connection is kept open')
+    parser.add_argument('--backlog', type=int, default=2048, help='maximum number of connections waiting to be accepted')
+    parser.add_argument('--limit-concurrency', type=int, help='maximum number of concurrent connections per worker, beyond which 503 is returned')
+    parser.add_argument('--limit-max-requests', type=int, help='number of requests after which a worker is restarted')
+    parser.add_argument('--access-log', action='store_true', help='log every request')
+    parser.add_argument('--log-level', default='warning', help='level of the uvicorn logs')
+    args = parser.parse_args()
+
+    run(
+        host = args.host,
+        port = args.port,
+        workers = args.workers,
+        keep_alive = args.keep_alive,
+        backlog = args.backlog,
+        limit_concurrency = args.limit_concurrency,
+        limit_max_requests = args.limit_max_requests,
+        access_log = args.access_log,
+        log_level = args.log_level
+    )
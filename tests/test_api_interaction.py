@@ -1,14 +1,21 @@
 import unittest
 from unittest.mock import patch, Mock
 
-from src.api_interaction import post_predict_ats_ep, post_predict_resp_ep, combine_predictions, post_offer_ep, summarize
+import os
+import tempfile
+from datetime import datetime
+
+from src.api_interaction import post_predict_ats_ep, post_predict_resp_ep, combine_predictions, post_offer_ep, summarize, summarize_batch
+from src.api_interaction import post_predict_ats_batch_ep, post_offer_batch_ep, post_score_ep
 from src.member_features import MemberFeatures
 from src.prediction_ep import Prediction
+from src.api_client import ApiClient
+from src.cache import LRUCache
 from src.data_processing import read_member_data, create_member_features
 
 class TestApiInteractionFunctions(unittest.TestCase):
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_post_predict_ats_ep(self, mock_post):
         member_id = 1
         member_features = MemberFeatures(
@@ -29,7 +36,7 @@ class TestApiInteractionFunctions(unittest.TestCase):
         self.assertEqual(prediction_ats, 150)
         self.assertGreaterEqual(latency, 0.0)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_post_predict_resp_ep(self, mock_post):
         member_id = 1
         member_features = MemberFeatures(
@@ -59,7 +66,7 @@ class TestApiInteractionFunctions(unittest.TestCase):
         self.assertEqual(combined_prediction.ats_prediction, predict_ats_ep)
         self.assertEqual(combined_prediction.resp_prediction, predict_resp_ep)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_post_offer_ep(self, mock_post):
         prediction = Prediction(ats_prediction=150, resp_prediction=0.58)
         member_id = 1
@@ -107,4 +114,183 @@ class TestApiInteractionFunctions(unittest.TestCase):
         self.assertGreaterEqual(result['latencies']['member_features_latency']['days_since_last_transaction_latency'], 0.0)
         self.assertGreaterEqual(result['latencies']['prediction_ats_ep_latency'], 0.0)
         self.assertGreaterEqual(result['latencies']['prediction_resp_ep_latency'], 0.0)
-        self.assertGreaterEqual(result['latencies']['offer_ep_latency'], 0.0)
\ No newline at end of file
+        self.assertGreaterEqual(result['latencies']['offer_ep_latency'], 0.0)
+
+    @patch('requests.Session.post')
+    def test_post_score_ep(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {'ats_prediction': 150, 'resp_prediction': 0.58, 'offer': 'OFFER_1'}
+
+        score, latency = post_score_ep(1, MemberFeatures())
+
+        self.assertEqual(score['offer'], 'OFFER_1')
+        self.assertTrue(mock_post.call_args.args[0].endswith('/score'))
+        self.assertGreaterEqual(latency, 0.0)
+
+    @patch('src.api_interaction.read_member_data')
+    @patch('src.api_interaction.create_member_features')
+    @patch('src.api_interaction.post_score_ep')
+    @patch('src.api_interaction.post_predict_ats_ep')
+    def test_summarize_fused(self, mock_post_predict_ats_ep, mock_post_score_ep, mock_create_member_features, mock_read_member_data):
+        mock_read_member_data.return_value = (Mock(), 0.1)
+        mock_create_member_features.return_value = (MemberFeatures(), {'transform_features_latency': 0.2})
+        mock_post_score_ep.return_value = ({'ats_prediction': 150, 'resp_prediction': 0.58, 'offer': 'OFFER_1'}, 0.3)
+
+        result = summarize(1, 'test_members.csv', fused = True)
+
+        self.assertEqual(result['predict_ats_ep'], 150)
+        self.assertEqual(result['predict_resp_ep'], 0.58)
+        self.assertEqual(result['offer_ep'], 'OFFER_1')
+        self.assertEqual(result['latencies']['score_ep_latency'], 0.3)
+        mock_post_predict_ats_ep.assert_not_called()
+
+    @patch('requests.Session.post')
+    def test_post_predict_ats_batch_ep(self, mock_post):
+        member_features_list = [MemberFeatures(AVG_POINTS_BOUGHT = 150), MemberFeatures(AVG_POINTS_BOUGHT = 300)]
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {'predictions': [150, 300]}
+
+        predictions, latency = post_predict_ats_batch_ep(member_features_list)
+
+        self.assertEqual(predictions, [150, 300])
+        self.assertEqual(len(mock_post.call_args.kwargs['json']), 2)
+        self.assertGreaterEqual(latency, 0.0)
+
+    @patch('requests.Session.post')
+    def test_post_offer_batch_ep_error(self, mock_post):
+        mock_post.return_value.status_code = 413
+        mock_post.return_value.text = 'Batch size 2 exceeds the maximum of 1'
+
+        offers, latency = post_offer_batch_ep([Prediction(ats_prediction=150, resp_prediction=0.58)] * 2)
+
+        self.assertIsNone(offers)
+        self.assertGreaterEqual(latency, 0.0)
+
+    @patch('src.api_interaction.post_predict_ats_batch_ep')
+    @patch('src.api_interaction.post_predict_resp_batch_ep')
+    @patch('src.api_interaction.post_offer_batch_ep')
+    def test_summarize_batch(self, mock_post_offer_batch_ep, mock_post_predict_resp_batch_ep, mock_post_predict_ats_batch_ep):
+        mock_post_predict_ats_batch_ep.side_effect = lambda member_features_list, client: ([150] * len(member_features_list), 0.3)
+        mock_post_predict_resp_batch_ep.side_effect = lambda member_features_list, client: ([0.58] * len(member_features_list), 0.4)
+        mock_post_offer_batch_ep.side_effect = lambda predictions, client: (["OFFER_1"] * len(predictions), 0.5)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dataset_file_path = os.path.join(tmp_dir, 'members.csv')
+            with open(dataset_file_path, 'w') as f:
+                f.write('memberId,lastTransatcionUtcTs,lastTransactionType,lastTransactionPointsBought,lastTransactionRevenueUSD\n'
+                        '1,2023-12-10 11:24:18,buy,100,10.0\n'
+                        '1,2020-12-22 14:40:25,gift,200,20.0\n'
+                        '2,2022-06-13 17:16:38,redeem,300,30.0\n')
+
+            # the features are read from the feature table, not computed member by member
+            with patch('src.api_interaction.create_member_features') as mock_create_member_features:
+                result = summarize_batch("all", dataset_file_path, batch_size = 1)
+                mock_create_member_features.assert_not_called()
+            self.assertEqual(result['member_count'], 2)
+            self.assertEqual(mock_post_predict_ats_batch_ep.call_count, 2)
+            self.assertEqual([member_result['member_id'] for member_result in result['results']], [1, 2])
+            self.assertEqual(result['results'][0]['member_features'].AVG_POINTS_BOUGHT, 150)
+            self.assertEqual(result['results'][0]['predict_ats_ep'], 150)
+            self.assertEqual(result['results'][1]['offer_ep'], 'OFFER_1')
+            self.assertEqual(result['results'][1]['latencies']['offer_ep_latency'], 0.5)
+            self.assertGreater(result['throughput'], 0.0)
+            self.assertGreaterEqual(result['latencies']['read_data_latency'], 0.0)
+            self.assertGreaterEqual(result['latencies']['feature_table_latency'], 0.0)
+
+            # members without transactions are returned without being sent to the endpoints
+            result = summarize_batch([2, 300], dataset_file_path)
+            self.assertEqual(result['member_count'], 2)
+            self.assertEqual(result['results'][0]['member_features'].PCT_REDEEM_TRANSACTIONS, 1.0)
+            self.assertEqual(result['results'][0]['predict_resp_ep'], 0.58)
+            self.assertIsNone(result['results'][1]['predict_ats_ep'])
+            self.assertIsNone(result['results'][1]['offer_ep'])
+            self.assertIsNone(result['results'][1]['member_features'].AVG_POINTS_BOUGHT)
+            self.assertGreaterEqual(result['results'][0]['latencies']['member_features_latency']['transform_features_latency'], 0.0)
+            self.assertEqual(len(mock_post_predict_ats_batch_ep.call_args.args[0]), 1)
+
+    @patch('requests.Session.post')
+    def test_api_client(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {'offer': 'OFFER_2'}
+
+        with ApiClient(base_url = 'http://scoring:9000/', pool_size = 4, timeout = (1, 5)) as client:
+            offer, latency = post_offer_ep(1, Prediction(ats_prediction=500, resp_prediction=0.58), client = client)
+            self.assertEqual(client.session.get_adapter('http://scoring:9000')._pool_maxsize, 4)
+
+        self.assertEqual(offer, 'OFFER_2')
+        self.assertEqual(mock_post.call_args.args[0], 'http://scoring:9000/offer/assign')
+        self.assertEqual(mock_post.call_args.kwargs['timeout'], (1, 5))
+
+    @patch('src.api_interaction.post_predict_ats_ep', return_value = (150, 0.3))
+    @patch('src.api_interaction.post_predict_resp_ep', return_value = (0.58, 0.4))
+    @patch('src.api_interaction.post_offer_ep', return_value = ("OFFER_1", 0.5))
+    def test_summarize_cache(self, mock_post_offer_ep, mock_post_predict_resp_ep, mock_post_predict_ats_ep):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            test_file = os.path.join(tmp_dir, 'members.csv')
+            with open(test_file, 'w') as f:
+                f.write('memberId,lastTransatcionUtcTs,lastTransactionType,lastTransactionPointsBought,lastTransactionRevenueUSD\n'
+                        '1,2023-12-10 11:24:18,buy,100,10.0\n'
+                        '2,2022-06-13 17:16:38,redeem,300,30.0\n')
+            cache = LRUCache(maxsize = 10)
+
+            result = summarize(1, test_file, cache = cache)
+            self.assertFalse(result['cache_stats']['member_features_hit'])
+            self.assertFalse(result['cache_stats']['predictions_hit'])
+
+            # the second call is served from the cache without reading the dataset or calling the endpoints
+            with patch('src.api_interaction.read_member_data') as mock_read_member_data:
+                cached_result = summarize(1, test_file, cache = cache)
+                mock_read_member_data.assert_not_called()
+            self.assertEqual(mock_post_predict_ats_ep.call_count, 1)
+            self.assertEqual(cached_result['member_features'], result['member_features'])
+            self.assertEqual(cached_result['offer_ep'], 'OFFER_1')
+            self.assertTrue(cached_result['cache_stats']['member_features_hit'])
+            self.assertTrue(cached_result['cache_stats']['predictions_hit'])
+            self.assertEqual(cached_result['cache_stats']['hits'], 2)
+            self.assertEqual(cached_result['cache_stats']['misses'], 2)
+            self.assertEqual(cached_result['latencies']['read_data_latency'], 0)
+            self.assertEqual(cached_result['latencies']['offer_ep_latency'], 0)
+            self.assertEqual(set(cached_result['latencies']['member_features_latency']), set(result['latencies']['member_features_latency']))
+
+            # a modified dataset is a new version of the data, so the cached entries are not used
+            with open(test_file, 'a') as f:
+                f.write('1,2024-01-01 00:00:00,gift,500,50.0\n')
+            result = summarize(1, test_file, cache = cache)
+            self.assertFalse(result['cache_stats']['member_features_hit'])
+            self.assertEqual(result['member_features'].LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT, 300.0)
+            self.assertEqual(mock_post_predict_ats_ep.call_count, 2)
+
+            # failed requests are not cached
+            mock_post_offer_ep.return_value = (None, 0.5)
+            summarize(2, test_file, cache = cache)
+            result = summarize(2, test_file, cache = cache)
+            self.assertTrue(result['cache_stats']['member_features_hit'])
+            self.assertFalse(result['cache_stats']['predictions_hit'])
+
+    @patch('src.api_interaction.post_predict_ats_ep', return_value = (150, 0.3))
+    @patch('src.api_interaction.post_predict_resp_ep', return_value = (0.58, 0.4))
+    @patch('src.api_interaction.post_offer_ep', return_value = ("OFFER_1", 0.5))
+    def test_summarize_cache_as_of(self, mock_post_offer_ep, mock_post_predict_resp_ep, mock_post_predict_ats_ep):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            test_file = os.path.join(tmp_dir, 'members.csv')
+            with open(test_file, 'w') as f:
+                f.write('memberId,lastTransatcionUtcTs,lastTransactionType,lastTransactionPointsBought,lastTransactionRevenueUSD\n'
+                        '1,2023-12-10 11:24:18,buy,100,10.0\n')
+            cache = LRUCache(maxsize = 10)
+
+            # without as_of, the cached features are computed at the UTC midnight of the day, so they are the same before and after
+            # 11:24:18, when the days since member 1's last transaction change
+            for now, hit in [(datetime(2024, 1, 1, 10, 0), False), (datetime(2024, 1, 1, 12, 0), True)]:
+                with patch('src.data_processing.datetime') as mock_datetime:
+                    mock_datetime.utcnow.return_value = now
+                    result = summarize(1, test_file, cache = cache)
+                self.assertEqual(result['cache_stats']['member_features_hit'], hit)
+                self.assertEqual(result['member_features'].DAYS_SINCE_LAST_TRANSACTION, 21)
+                self.assertEqual(result['member_features'], summarize(1, test_file, as_of = '2024-01-01')['member_features'])
+
+            # the next day is a new version
+            with patch('src.data_processing.datetime') as mock_datetime:
+                mock_datetime.utcnow.return_value = datetime(2024, 1, 2, 0, 30)
+                result = summarize(1, test_file, cache = cache)
+            self.assertFalse(result['cache_stats']['member_features_hit'])
+            self.assertEqual(result['member_features'].DAYS_SINCE_LAST_TRANSACTION, 22)
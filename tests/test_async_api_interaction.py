@@ -0,0 +1,106 @@
+import unittest
+import os
+import tempfile
+import asyncio
+import threading
+import httpx
+from unittest.mock import patch
+
+from src.app import app
+from src.async_api_interaction import summarize_async, summarize_many_async, score_member_async
+from src.data_processing import read_member_data
+from src.api_interaction import combine_predictions
+from src.prediction_ep import predict_ats, predict_resp
+from src.offer_ep import get_offer
+
+class TestAsyncApiInteractionFunctions(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        """SetUp a sample csv file and a client that sends the requests to the app in-process"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_file = os.path.join(self.tmp_dir.name, 'members.csv')
+        with open(self.test_file, 'w') as f:
+            f.write('memberId,lastTransatcionUtcTs,lastTransactionType,lastTransactionPointsBought,lastTransactionRevenueUSD\n'
+                    '1,2023-12-10 11:24:18,buy,100,10.0\n'
+                    '1,2020-12-22 14:40:25,gift,200,20.0\n'
+                    '2,2022-06-13 17:16:38,redeem,300,30.0\n'
+                    '3,2022-06-13 17:16:38,buy,90000,900.0\n')
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False), base_url='http://test')
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        self.tmp_dir.cleanup()
+
+    async def test_summarize_async(self):
+        result = await summarize_async(1, self.test_file, client = self.client)
+
+        self.assertEqual(result['member_id'], 1)
+        self.assertEqual(result['predict_ats_ep'], predict_ats(result['member_features'])['prediction'])
+        self.assertEqual(result['predict_resp_ep'], predict_resp(result['member_features'])['prediction'])
+        self.assertEqual(result['offer_ep'], 'OFFER_1')
+        self.assertGreaterEqual(result['latencies']['read_data_latency'], 0.0)
+        self.assertGreaterEqual(result['latencies']['member_features_latency']['transform_features_latency'], 0.0)
+        self.assertGreater(result['latencies']['prediction_ats_ep_latency'], 0.0)
+        self.assertGreater(result['latencies']['prediction_resp_ep_latency'], 0.0)
+        self.assertGreater(result['latencies']['offer_ep_latency'], 0.0)
+
+        # member 1's last transaction is 2023-12-10 11:24:18
+        result = await summarize_async(1, self.test_file, client = self.client, as_of = '2024-01-01')
+        self.assertEqual(result['member_features'].DAYS_SINCE_LAST_TRANSACTION, 21)
+
+    async def test_summarize_many_async(self):
+        result = await summarize_many_async("all", self.test_file, concurrency = 2, client = self.client)
+
+        self.assertEqual(result['member_count'], 3)
+        self.assertEqual([member_result['member_id'] for member_result in result['results']], [1, 2, 3])
+        for member_result in result['results']:
+            prediction = combine_predictions(member_result['predict_ats_ep'], member_result['predict_resp_ep'])
+            self.assertEqual(member_result['offer_ep'], get_offer(prediction)['offer'])
+        self.assertEqual(result['results'][2]['offer_ep'], 'OFFER_2')
+        self.assertGreater(result['throughput'], 0.0)
+
+        result = await summarize_many_async([1, 3], self.test_file, client = self.client, as_of = '2024-01-01')
+        self.assertEqual([member_result['member_features'].DAYS_SINCE_LAST_TRANSACTION for member_result in result['results']], [21, 566])
+
+        # members without transactions are returned without being sent to the endpoints, and do not fail the others
+        with patch('src.async_api_interaction.score_member_async', wraps = score_member_async) as mock_score_member_async:
+            result = await summarize_many_async([2, 300], self.test_file, client = self.client)
+        self.assertEqual([call.args[0] for call in mock_score_member_async.call_args_list], [2])
+        self.assertEqual(result['member_count'], 2)
+        self.assertIsNotNone(result['results'][0]['offer_ep'])
+        self.assertEqual(result['results'][1]['member_id'], 300)
+        self.assertIsNone(result['results'][1]['member_features'].AVG_POINTS_BOUGHT)
+        self.assertIsNone(result['results'][1]['predict_ats_ep'])
+        self.assertIsNone(result['results'][1]['offer_ep'])
+
+        result = await summarize_many_async([300], self.test_file, client = self.client)
+        self.assertIsNone(result['results'][0]['offer_ep'])
+
+    async def test_summarize_many_async_workers(self):
+        # the dataset is read outside of the event loop thread, and no more than concurrency members are scored at the same time
+        read_threads = []
+        def read_member_data_in_thread(dataset_file_path):
+            read_threads.append(threading.current_thread())
+            return read_member_data(dataset_file_path)
+
+        in_flight, max_in_flight = 0, 0
+        async def score_member_counted(member_id, member_features, client):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return await score_member_async(member_id, member_features, client)
+
+        with patch('src.async_api_interaction.read_member_data', side_effect = read_member_data_in_thread), \
+             patch('src.async_api_interaction.score_member_async', side_effect = score_member_counted):
+            result = await summarize_many_async([1, 2, 3, 1, 2, 3, 300], self.test_file, concurrency = 2, client = self.client)
+
+        self.assertEqual(len(read_threads), 1)
+        self.assertIsNot(read_threads[0], threading.current_thread())
+        self.assertEqual(max_in_flight, 2)
+        self.assertEqual([member_result['member_id'] for member_result in result['results']], [1, 2, 3, 1, 2, 3, 300])
+        self.assertEqual(result['results'][3]['offer_ep'], result['results'][0]['offer_ep'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import os
+import tempfile
+import pandas as pd
+
+from src.benchmark import generate_member_data, summarize_timings, run_benchmarks, copy_head
+from src.data_processing import read_member_data
+
+class TestBenchmarkFunctions(unittest.TestCase):
+    def setUp(self) -> None:
+        """SetUp a small synthetic dataset"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_file = os.path.join(self.tmp_dir.name, 'member_data.csv')
+        self.rows, self.latency = generate_member_data(self.test_file, rows = 2000, members = 50, skew = 1.0, chunksize = 700)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_generate_member_data(self):
+        self.assertEqual(self.rows, 2000)
+        self.assertTrue(self.latency >= 0, "Latency should be non-negative")
+
+        member_data = pd.read_csv(self.test_file)
+        self.assertEqual(list(member_data.columns), ['memberId', 'lastTransatcionUtcTs', 'lastTransactionType', 'lastTransactionPointsBought', 'lastTransactionRevenueUSD'])
+        self.assertEqual(len(member_data), 2000)
+        self.assertTrue(member_data['memberId'].nunique() <= 50)
+        self.assertTrue(member_data['memberId'].str.fullmatch('[0-9A-F]{8}').all())
+        self.assertTrue(set(member_data['lastTransactionType'].dropna()) <= {'buy', 'gift', 'redeem'})
+        redeem = member_data[member_data['lastTransactionType'] == 'redeem']
+        self.assertTrue((redeem['lastTransactionPointsBought'] < 0).all())
+        self.assertTrue((redeem['lastTransactionRevenueUSD'] == 0).all())
+
+        # the skew puts the transactions on the first members
+        counts = member_data['memberId'].value_counts()
+        self.assertTrue(counts.iloc[0] > 10 * counts.iloc[-1])
+
+        # the same seed gives the same file
+        other_file = os.path.join(self.tmp_dir.name, 'other.csv')
+        generate_member_data(other_file, rows = 2000, members = 50, skew = 1.0, chunksize = 700)
+        pd.testing.assert_frame_equal(pd.read_csv(other_file), member_data)
+
+        cleaned_member_data, _ = read_member_data(self.test_file, typed = True)
+        self.assertTrue(len(cleaned_member_data) > 0)
+
+    def test_summarize_timings(self):
+        summary = summarize_timings([0.1] * 99 + [1.1], items = 10, memory = 1024)
+        self.assertEqual(summary['calls'], 100)
+        self.assertAlmostEqual(summary['throughput'], 1000 / 11)
+        self.assertAlmostEqual(summary['latency']['p50'], 0.1)
+        self.assertAlmostEqual(summary['latency']['max'], 1.1)
+        self.assertTrue(summary['latency']['p95'] <= summary['latency']['p99'] <= 1.1)
+        self.assertEqual(summary['peak_memory_bytes'], 1024)
+
+    def test_run_benchmarks(self):
+        report = run_benchmarks(self.test_file, benchmarks = ['read', 'features', 'endpoints'], repeat = 1, sample = 3)
+        self.assertEqual(report['dataset']['rows'], 2000)
+        self.assertEqual(report['dataset']['benchmarked_rows'], len(read_member_data(self.test_file)[0]))
+        self.assertEqual(report['parameters']['sample'], 3)
+        for name in ['read_member_data', 'build_member_feature_table', 'create_member_features', '/score', '/offer/assign_batch']:
+            self.assertIn(name, report['results'])
+            self.assertTrue(report['results'][name]['throughput'] > 0)
+        self.assertEqual(report['results']['create_member_features']['calls'], 3)
+        self.assertNotIn('excel_save', report['results'])
+
+    def test_run_benchmarks_max_rows(self):
+        # a larger file is benchmarked on its first max_rows rows
+        report = run_benchmarks(self.test_file, benchmarks = ['read'], repeat = 1, sample = 3, max_rows = 500)
+        self.assertEqual(report['dataset']['rows'], 2000)
+        head_file = os.path.join(self.tmp_dir.name, 'head.csv')
+        copy_head(self.test_file, head_file, 500)
+        pd.testing.assert_frame_equal(pd.read_csv(head_file), pd.read_csv(self.test_file, nrows = 500))
+        self.assertEqual(report['dataset']['benchmarked_rows'], len(read_member_data(head_file)[0]))
+        self.assertEqual(report['results']['read_member_data']['items_per_call'], report['dataset']['benchmarked_rows'])
+        self.assertEqual(report['parameters']['max_rows'], 500)
+
+
+if __name__ == "__main__":
+    unittest.main()
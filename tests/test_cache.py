@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+
+from src.cache import LRUCache, data_version
+
+class TestCacheFunctions(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize = 2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), (True, 1))
+
+        # 'b' is now the least recently used entry
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('a'), (True, 1))
+        self.assertEqual(cache.get('c'), (True, 3))
+        self.assertEqual(cache.stats(), {'hits': 3, 'misses': 1, 'evictions': 1, 'size': 2})
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    @patch('src.cache.time.monotonic')
+    def test_ttl(self, mock_monotonic):
+        cache = LRUCache(ttl = 60)
+        mock_monotonic.return_value = 1000.0
+        cache.put('a', 1)
+
+        mock_monotonic.return_value = 1059.0
+        self.assertEqual(cache.get('a'), (True, 1))
+        mock_monotonic.return_value = 1061.0
+        self.assertEqual(cache.get('a'), (False, None))
+        self.assertEqual(len(cache), 0, "Expired entries should be removed")
+
+    def test_data_version(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            test_file = os.path.join(tmp_dir, 'members.csv')
+            with open(test_file, 'w') as f:
+                f.write('memberId\n1\n')
+            version = data_version(test_file)
+            self.assertEqual(data_version(test_file), version)
+
+            with open(test_file, 'a') as f:
+                f.write('2\n')
+            self.assertNotEqual(data_version(test_file), version)
+
+
+if __name__ == "__main__":
+    unittest.main()
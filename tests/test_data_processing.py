@@ -1,4 +1,5 @@
 import unittest
+import unittest.mock
 import pandas as pd
 import numpy as np
 import datetime
@@ -7,6 +8,8 @@ import os
 
 from src.data_processing import read_member_data, calculate_avg_points_bought, calculate_avg_revenue_usd, calculate_last_3_transactions_avg_points_bought, calculate_last_3_transactions_avg_revenue_usd
 from src.data_processing import calculate_pct_buy_transactions, calculate_pct_gift_transactions, calculate_pct_redeem_transactions, calcualte_days_sicne_last_transaction, create_member_features
+from src.data_processing import build_member_feature_table, FEATURE_COLUMNS, IndexedMemberData, member_data_cache_path, as_of_timestamp
+from src.data_processing import most_recent_transactions, most_recent_ranks, transaction_timestamps
 
 class TestMemberDataFunctions(unittest.TestCase):
     def setUp(self) -> None:
@@ -197,6 +200,152 @@ class TestMemberDataFunctions(unittest.TestCase):
         self.assertGreaterEqual(latency_info['pct_redeem_transactions_latency'], 0.0)
         self.assertGreaterEqual(latency_info['days_since_last_transaction_latency'], 0.0)
 
+    def test_build_member_feature_table(self):
+        feature_table, latency = build_member_feature_table(self.sample_data)
+        self.assertEqual(list(feature_table.columns), FEATURE_COLUMNS)
+        self.assertEqual(set(feature_table.index), {1, 2, 3, 10})
+        self.assertEqual(feature_table.at[3, 'LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT'], 766.67)  # average of 600, 800, 900
+        self.assertEqual(feature_table.at[2, 'PCT_REDEEM_TRANSACTIONS'], 0.67)
+        self.assertGreaterEqual(feature_table.at[1, 'DAYS_SINCE_LAST_TRANSACTION'], 0)
+        self.assertTrue((isinstance(latency, int) or isinstance(latency, float)) and latency >= 0, "Latency should be a non-negative float")
+
+        # every feature of every member should match the per-member computation
+        for member_id in [1, 2, 3]:
+            member_features, _ = create_member_features(self.sample_data, member_id)
+            self.assertEqual(list(feature_table.loc[member_id]), list(member_features.dict().values()))
+
+    def test_feature_table_lookup(self):
+        feature_table, _ = build_member_feature_table(self.sample_data)
+        pct_gift, latency = calculate_pct_gift_transactions(self.sample_data, 2, feature_table = feature_table)
+        self.assertEqual(pct_gift, 0.33)
+        self.assertIsInstance(pct_gift, float)
+        self.assertTrue((isinstance(latency, int) or isinstance(latency, float)) and latency >= 0, "Latency should be a non-negative float")
+
+        # test for a non-existent member
+        pct_gift_none, latency = calculate_pct_gift_transactions(self.sample_data, 300, feature_table = feature_table)
+        self.assertIsNone(pct_gift_none)
+
+        member_features, latency_info = create_member_features(self.sample_data, 3, feature_table = feature_table)
+        self.assertEqual(member_features.LAST_3_TRANSACTIONS_AVG_REVENUE_USD, 76.67)
+        self.assertEqual(latency_info['feature_table_latency'], 0)
+
+    def test_read_member_data_index(self):
+        indexed_data, latency = read_member_data(self.test_file, index = True)
+        self.assertIsInstance(indexed_data, IndexedMemberData)
+        self.assertEqual(len(indexed_data), 10)
+        self.assertEqual(indexed_data.offsets[3], (5, 9))
+        self.assertTrue(latency >= 0, "Latency should be non-negative")
+
+        # member slices are contiguous and sorted by the most recent transaction first
+        member_transactions = indexed_data.transactions(3)
+        self.assertEqual(list(member_transactions['lastTransactionPointsBought']), [800, 600, 900, 700])
+        self.assertEqual(len(indexed_data.transactions(300)), 0)
+
+        # the calculate functions give the same results on indexed data
+        last_3_avg_points, latency = calculate_last_3_transactions_avg_points_bought(indexed_data, 3)
+        self.assertEqual(last_3_avg_points, 766.67)
+        avg_points_none, latency = calculate_avg_points_bought(indexed_data, 300)
+        self.assertIsNone(avg_points_none)
+        member_features, _ = create_member_features(indexed_data, 2)
+        self.assertEqual(member_features.PCT_REDEEM_TRANSACTIONS, 0.67)
+
+    def test_read_member_data_cache(self):
+        cache_path = member_data_cache_path(self.test_file)
+        self.addCleanup(lambda: os.path.exists(cache_path) and os.remove(cache_path))
+
+        data, latency = read_member_data(self.test_file, cache = True)
+        self.assertTrue(os.path.exists(cache_path), "The first read should write the cache")
+
+        # the second read comes from the cache
+        with unittest.mock.patch('pandas.read_csv') as mock_read_csv:
+            cached_data, latency = read_member_data(self.test_file, cache = True)
+            mock_read_csv.assert_not_called()
+        pd.testing.assert_frame_equal(cached_data, data)
+        self.assertTrue(latency >= 0, "Latency should be non-negative")
+
+        # changing the csv file invalidates the cache
+        self.sample_data.iloc[:3].to_csv(self.test_file, index=False)
+        os.utime(self.test_file, ns=(0, 0))
+        data, latency = read_member_data(self.test_file, cache = True)
+        self.assertEqual(len(data), 3)
+
+    def test_read_member_data_typed(self):
+        data, latency = read_member_data(self.test_file, typed = True)
+        self.assertEqual(data['memberId'].dtype, 'category')
+        self.assertEqual(data['lastTransactionType'].dtype, 'category')
+        self.assertTrue(pd.api.types.is_datetime64_dtype(data['lastTransatcionUtcTs']))
+        self.assertEqual(data['lastTransactionPointsBought'].dtype, np.int32)
+        self.assertTrue(latency >= 0, "Latency should be non-negative")
+
+        # the features are the same as with the default schema
+        default_data, _ = read_member_data(self.test_file)
+        for member_id in [1, 2, 3, 10]:
+            member_features, _ = create_member_features(data, member_id)
+            expected_member_features, _ = create_member_features(default_data, member_id)
+            self.assertEqual(member_features, expected_member_features)
+        days_since_last_transaction, latency = calcualte_days_sicne_last_transaction(data, 1)
+        self.assertEqual(days_since_last_transaction, calcualte_days_sicne_last_transaction(default_data, 1)[0])
+
+
+    def test_as_of(self):
+        as_of = '2024-01-01 00:00:00'
+        # member 1: 2023-12-10 11:24:18 is 21 days and a half before, member 10: 2020-06-27 21:48:28 is 1282 days and 2 hours before
+        feature_table, _ = build_member_feature_table(self.sample_data, as_of = as_of)
+        self.assertEqual(feature_table.at[1, 'DAYS_SINCE_LAST_TRANSACTION'], 21)
+        self.assertEqual(feature_table.at[10, 'DAYS_SINCE_LAST_TRANSACTION'], 1282)
+
+        days_since_last_transaction, _ = calcualte_days_sicne_last_transaction(self.sample_data, 1, as_of = as_of)
+        self.assertEqual(days_since_last_transaction, 21)
+        member_features, _ = create_member_features(self.sample_data, 10, as_of = as_of)
+        self.assertEqual(member_features.DAYS_SINCE_LAST_TRANSACTION, 1282)
+
+        # timezone-aware times are converted to UTC
+        self.assertEqual(as_of_timestamp('2024-01-01 02:00:00+02:00'), pd.Timestamp(as_of))
+        self.assertEqual(as_of_timestamp(datetime(2024, 1, 1)), pd.Timestamp(as_of))
+        self.assertLessEqual(abs(as_of_timestamp() - pd.Timestamp(datetime.utcnow())), pd.Timedelta(seconds=5))
+
+        # the same as_of gives the same features at any time
+        member_data, _ = read_member_data(self.test_file, typed = True)
+        typed_feature_table, _ = build_member_feature_table(member_data, as_of = as_of)
+        self.assertEqual(typed_feature_table['DAYS_SINCE_LAST_TRANSACTION'].tolist(), feature_table['DAYS_SINCE_LAST_TRANSACTION'].tolist())
+
+    def test_last_n_windows(self):
+        # member 3 has 4 transactions: 800, 600, 900 and 700 points from the most recent
+        member_features, _ = create_member_features(self.sample_data, 3)
+        self.assertEqual(member_features.LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT, 766.67)
+        self.assertEqual(member_features.LAST_5_TRANSACTIONS_AVG_POINTS_BOUGHT, 750.0)
+        self.assertEqual(member_features.LAST_10_TRANSACTIONS_AVG_REVENUE_USD, 75.0)
+
+        last_2_points_bought, _ = calculate_last_3_transactions_avg_points_bought(self.sample_data, 3, n = 2)
+        self.assertEqual(last_2_points_bought, 700.0)  # average of 800, 600
+        feature_table, _ = build_member_feature_table(self.sample_data, n = 2, extra_windows = [4])
+        self.assertEqual(list(feature_table.columns)[-2:], ['LAST_4_TRANSACTIONS_AVG_POINTS_BOUGHT', 'LAST_4_TRANSACTIONS_AVG_REVENUE_USD'])
+        self.assertEqual(feature_table.at[3, 'LAST_2_TRANSACTIONS_AVG_POINTS_BOUGHT'], 700.0)
+
+    def test_most_recent_transactions(self):
+        rng = np.random.default_rng(0)
+        # few distinct timestamps, so that many transactions have the same timestamp
+        transactions = pd.DataFrame({
+            'lastTransatcionUtcTs': rng.choice(['2021-01-01 00:00:00', '2022-01-01 00:00:00', '2023-01-01 00:00:00', '2023-06-01 12:00:00'], 200),
+            'lastTransactionPointsBought': np.arange(200)
+        })
+        for n in [1, 3, 10, 57, 200, 500]:
+            expected = transactions.sort_values(by='lastTransatcionUtcTs', ascending=False, kind='mergesort').head(n)
+            pd.testing.assert_frame_equal(most_recent_transactions(transactions, n), expected)
+
+    def test_most_recent_ranks(self):
+        rng = np.random.default_rng(0)
+        transactions = pd.DataFrame({
+            'memberId': rng.integers(-1, 20, 500),
+            'lastTransatcionUtcTs': rng.choice(['2021-01-01 00:00:00', '2022-01-01 00:00:00', '2023-01-01 00:00:00', None], 500)
+        })
+        # the ranks are the positions after a stable sort by member and most recent first (missing timestamps last), up to n
+        expected = transactions[transactions['memberId'] >= 0].sort_values(by=['memberId', 'lastTransatcionUtcTs'], ascending=[True, False], kind='mergesort')
+        expected_ranks = expected.groupby('memberId').cumcount().reindex(transactions.index, fill_value=500)
+        for n in [1, 3, 40]:
+            ranks, latest = most_recent_ranks(transactions['memberId'].to_numpy(), transaction_timestamps(transactions), n, 20)
+            self.assertEqual(ranks.tolist(), np.minimum(expected_ranks, n).tolist())
+        self.assertEqual(latest[3], pd.Timestamp(expected.loc[expected['memberId'] == 3, 'lastTransatcionUtcTs'].iloc[0]).value)
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -3,8 +3,10 @@ from unittest.mock import patch, Mock
 import pandas as pd
 from pathlib import Path
 import os
+import tempfile
 
-from src.excel import flatten_dict, convert_object_to_dict, excel_save
+from src.excel import flatten_dict, convert_object_to_dict, excel_save, export_excel, excel_save_batch, flatten_summary, flatten_summaries
+from src.result_store import SQLiteResultStore
 from src.api_interaction import summarize
 from src.member_features import MemberFeatures
 
@@ -35,7 +37,11 @@ class TestExcelFunctions(unittest.TestCase):
             "PCT_BUY_TRANSACTIONS" : 0.5,
             "PCT_GIFT_TRANSACTIONS" : 0.5,
             "PCT_REDEEM_TRANSACTIONS" : 0,
-            "DAYS_SINCE_LAST_TRANSACTION" : 90
+            "DAYS_SINCE_LAST_TRANSACTION" : 90,
+            "LAST_5_TRANSACTIONS_AVG_POINTS_BOUGHT" : None,
+            "LAST_5_TRANSACTIONS_AVG_REVENUE_USD" : None,
+            "LAST_10_TRANSACTIONS_AVG_POINTS_BOUGHT" : None,
+            "LAST_10_TRANSACTIONS_AVG_REVENUE_USD" : None
         }
         self.assertEqual(obj_dict, expected_result)
 
@@ -127,4 +133,77 @@ class TestExcelFunctions(unittest.TestCase):
 
         # Check the content of the DataFrame written to the new file
         expected_df = pd.DataFrame({'member_id': [1], 'AVG_POINTS_BOUGHT': [150], 'AVG_REVENUE_USD': [15], 'LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT': [150], 'LAST_3_TRANSACTIONS_AVG_REVENUE_USD': [15], 'PCT_BUY_TRANSACTIONS': [0.5], 'PCT_GIFT_TRANSACTIONS': [0.5], 'PCT_REDEEM_TRANSACTIONS': [0], 'DAYS_SINCE_LAST_TRANSACTION': [0], 'predict_ats_ep': [150], 'predict_resp_ep': [0.58], 'offer_ep': ["OFFER_1"], 'read_data_latency': [0], 'member_features_latency_transform_features_latency': [0], 'member_features_latency_avg_points_bought_latency': [0], 'member_features_latency_avg_revenue_usd_latency': [0], 'member_features_latency_last_3_transactions_avg_points_bought_latency': [0], 'member_features_latency_last_3_transactions_avg_revenue_usd_latency': [0], 'member_features_latency_pct_buy_trancactions_latency': [0], 'member_features_latency_pct_gift_transactions_latency': [0], 'member_features_latency_pct_redeem_transactions_latency': [0], 'member_features_latency_days_since_last_transaction_latency': [0], 'prediction_ats_ep_latency': [0], 'prediction_resp_ep_latency': [0], 'offer_ep_latency': [0]})
-        pd.testing.assert_frame_equal(written_df, expected_df)
\ No newline at end of file
+        pd.testing.assert_frame_equal(written_df, expected_df)
+
+    @patch('src.excel.summarize')
+    def test_excel_save_sink(self, mock_summarize):
+        mock_summarize.side_effect = lambda member_id, dataset_file, cache = None, client = None: {
+            "member_id": member_id,
+            "member_features": MemberFeatures(AVG_POINTS_BOUGHT = member_id * 100),
+            "predict_ats_ep": 150,
+            "predict_resp_ep": 0.58,
+            "offer_ep": "OFFER_1",
+            "latencies": {"read_data_latency": 0, "member_features_latency": {"transform_features_latency": 0}}
+        }
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            xlsx_path = os.path.join(tmp_dir, 'results.xlsx')
+            with SQLiteResultStore(os.path.join(tmp_dir, 'results.db')) as sink:
+                with patch('pandas.read_excel') as mock_read_excel, patch('pandas.DataFrame.to_excel') as mock_to_excel:
+                    for member_id in [1, 2, 1]:
+                        excel_save(member_id, 'test_members.csv', sink = sink)
+                    # no excel file is read or written for each member
+                    mock_read_excel.assert_not_called()
+                    mock_to_excel.assert_not_called()
+
+                self.assertEqual(export_excel(sink, xlsx_path), 2)
+
+            written_df = pd.read_excel(xlsx_path, index_col = [0])
+
+        # the latest result of each member, in the same layout as excel_save
+        self.assertEqual(written_df['member_id'].tolist(), [2, 1])
+        self.assertEqual(written_df['AVG_POINTS_BOUGHT'].tolist(), [200, 100])
+        self.assertEqual(list(written_df.columns[:3]), ['member_id', 'AVG_POINTS_BOUGHT', 'AVG_REVENUE_USD'])
+        self.assertEqual(written_df.columns[-1], 'member_features_latency_transform_features_latency')
+
+    @patch('src.api_interaction.post_predict_ats_batch_ep', side_effect = lambda member_features_list, client = None: ([100.0 * (i + 1) for i in range(len(member_features_list))], 0.2))
+    @patch('src.api_interaction.post_predict_resp_batch_ep', side_effect = lambda member_features_list, client = None: ([0.5] * len(member_features_list), 0.2))
+    @patch('src.api_interaction.post_offer_batch_ep', side_effect = lambda predictions, client = None: (['OFFER_1'] * len(predictions), 0.2))
+    def test_excel_save_batch(self, mock_post_offer_batch_ep, mock_post_predict_resp_batch_ep, mock_post_predict_ats_batch_ep):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            test_file = os.path.join(tmp_dir, 'members.csv')
+            with open(test_file, 'w') as f:
+                f.write('memberId,lastTransatcionUtcTs,lastTransactionType,lastTransactionPointsBought,lastTransactionRevenueUSD\n'
+                        'A,2023-12-10 11:24:18,buy,100,10.0\n'
+                        'A,2020-12-22 14:40:25,gift,,20.0\n'
+                        'B,2022-06-13 17:16:38,redeem,300,30.0\n')
+            xlsx_path = os.path.join(tmp_dir, 'results.xlsx')
+
+            results_df, latency = excel_save_batch(['A', 'B', 'C'], test_file, xlsx_path = xlsx_path)
+            self.assertGreaterEqual(latency, 0.0)
+            written_df = pd.read_excel(xlsx_path, index_col = [0])
+            self.assertEqual(written_df['member_id'].tolist(), ['A', 'B', 'C'])
+            self.assertEqual(written_df['predict_ats_ep'].tolist()[:2], [100.0, 200.0])
+            self.assertTrue(pd.isna(written_df.at[2, 'offer_ep']), "Members without transactions should not get an offer")
+            self.assertEqual(list(written_df.columns), list(results_df.columns))
+
+            results_df, _ = excel_save_batch("all", test_file, xlsx_path = xlsx_path, sheets = True)
+            written_sheets = pd.read_excel(xlsx_path, sheet_name = None, index_col = [0])
+            self.assertEqual(list(written_sheets), ['features', 'predictions', 'latencies'])
+            self.assertEqual(written_sheets['features']['AVG_POINTS_BOUGHT'].tolist(), [50.0, 300.0])
+            self.assertEqual(list(written_sheets['predictions'].columns), ['member_id', 'predict_ats_ep', 'predict_resp_ep', 'offer_ep'])
+            self.assertIn('member_features_latency_transform_features_latency', written_sheets['latencies'].columns)
+
+    def test_flatten_summaries(self):
+        results = [{
+            "member_id": member_id,
+            "member_features": MemberFeatures(AVG_POINTS_BOUGHT = member_id * 100),
+            "predict_ats_ep": 150,
+            "offer_ep": None,
+            "latencies": {"read_data_latency": 0.1, "member_features_latency": {"transform_features_latency": 0.2 * member_id}, "offer_ep_latency": 0.3}
+        } for member_id in [1, 2]]
+
+        # the same columns, in the same order, and values as flattening each result
+        expected_df = pd.DataFrame([flatten_summary(res) for res in results])
+        pd.testing.assert_frame_equal(flatten_summaries(results), expected_df)
+        self.assertEqual(len(flatten_summaries([])), 0)
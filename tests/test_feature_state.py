@@ -0,0 +1,72 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+from src.data_processing import read_member_data, build_member_feature_table, clean_member_data
+from src.feature_state import MemberFeatureState, stream_member_features
+
+class TestFeatureStateFunctions(unittest.TestCase):
+    def setUp(self) -> None:
+        """SetUp a sample csv file, with a missing value and members spread over several chunks"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_file = os.path.join(self.tmp_dir.name, 'members.csv')
+        self.sample_data = pd.DataFrame({
+            'memberId': ['A', 'B', 'A', 'C', 'B', 'C', 'C', 'B', 'C', 'D'],
+            'lastTransatcionUtcTs': [
+                '2023-12-10 11:24:18',
+                '2022-06-13 17:16:38',
+                '2020-12-22 14:40:25',
+                '2021-11-07 06:20:36',
+                '2020-11-08 11:37:48',
+                '2019-01-25 04:00:33',
+                '2022-02-04 06:26:30',
+                '2022-10-13 13:19:55',
+                '2020-06-27 21:48:28',
+                '2020-06-27 21:48:28'
+            ],
+            'lastTransactionType': ['buy', 'redeem', 'gift', 'buy', 'gift', 'gift', 'buy', 'redeem', 'gift', 'buy'],
+            'lastTransactionPointsBought': [100, 300, 200, 600, 400, 700, 800, 500, 900, np.nan],
+            'lastTransactionRevenueUSD': [10.0, 30.0, 20.0, 60.0, 40.0, 70.0, 80.0, 50.0, 90.0, 100.0]
+            })
+        self.sample_data.to_csv(self.test_file, index=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_stream_member_features(self):
+        member_data, _ = read_member_data(self.test_file)
+        expected, _ = build_member_feature_table(member_data)
+
+        for chunksize in [1, 3, 100]:
+            feature_table, latency = stream_member_features(self.test_file, chunksize = chunksize)
+            pd.testing.assert_frame_equal(feature_table, expected)
+            self.assertTrue(latency >= 0, "Latency should be non-negative")
+
+        expected, _ = build_member_feature_table(member_data, as_of = '2024-01-01')
+        feature_table, _ = stream_member_features(self.test_file, chunksize = 3, as_of = '2024-01-01')
+        pd.testing.assert_frame_equal(feature_table, expected)
+
+    def test_member_feature_state(self):
+        state = MemberFeatureState(extra_windows = [])
+        self.assertEqual(len(state), 0)
+        self.assertEqual(len(state.features()), 0)
+
+        updated_members = state.update(clean_member_data(self.sample_data.iloc[:6].copy()))
+        self.assertEqual(set(updated_members), {'A', 'B', 'C'})
+        updated_members = state.update(clean_member_data(self.sample_data.iloc[6:].copy()))
+        self.assertEqual(set(updated_members), {'B', 'C', 'D'})
+
+        # only the n most recent transactions of each member are kept
+        self.assertEqual(len(state), 4)
+        self.assertEqual(len(state.recent), 2 + 3 + 3 + 1)
+
+        feature_table = state.features(['C'])
+        self.assertEqual(list(feature_table.index), ['C'])
+        self.assertEqual(feature_table.at['C', 'LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT'], 766.67)  # average of 600, 800, 900
+        self.assertEqual(feature_table.at['C', 'AVG_REVENUE_USD'], 75.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
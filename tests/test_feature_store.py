@@ -0,0 +1,157 @@
+import unittest
+import unittest.mock
+import os
+import sqlite3
+import tempfile
+import pandas as pd
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from src.app import app, get_feature_store
+from src.data_processing import read_member_data, create_member_features
+from src.feature_store import build_feature_store, update_feature_store, FeatureStore, FeatureStoreSchemaError
+from src.prediction_ep import predict_ats, predict_resp
+
+class TestFeatureStoreFunctions(unittest.TestCase):
+    def setUp(self) -> None:
+        """SetUp a sample csv file and a feature store built from it"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_file = os.path.join(self.tmp_dir.name, 'members.csv')
+        self.store_path = os.path.join(self.tmp_dir.name, 'feature_store.db')
+        with open(self.test_file, 'w') as f:
+            f.write('memberId,lastTransatcionUtcTs,lastTransactionType,lastTransactionPointsBought,lastTransactionRevenueUSD\n'
+                    'A,2023-12-10 11:24:18,buy,100,10.0\n'
+                    'A,2020-12-22 14:40:25,gift,200,20.0\n'
+                    'B,2022-06-13 17:16:38,redeem,300,30.0\n'
+                    'A,2021-11-07 06:20:36,buy,,40.0\n'
+                    'A,2019-01-25 04:00:33,redeem,500,\n'
+                    'C,2022-06-13 17:16:38,buy,90000,900.0\n')
+        self.member_count, self.latency = build_feature_store(self.test_file, self.store_path)
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+        self.tmp_dir.cleanup()
+
+    def test_build_feature_store(self):
+        self.assertEqual(self.member_count, 3)
+        self.assertTrue(self.latency >= 0, "Latency should be non-negative")
+
+        member_data, _ = read_member_data(self.test_file)
+        with FeatureStore(self.store_path) as feature_store:
+            self.assertEqual(len(feature_store), 3)
+            for member_id in ['A', 'B', 'C']:
+                expected_member_features, _ = create_member_features(member_data, member_id)
+                self.assertEqual(feature_store.get(member_id), expected_member_features)
+            self.assertIsNone(feature_store.get('D'))
+            # A's last transaction is 2023-12-10 11:24:18
+            self.assertEqual(feature_store.get('A', as_of = '2024-01-01').DAYS_SINCE_LAST_TRANSACTION, 21)
+
+        # rebuilding replaces the previous store
+        member_count, _ = build_feature_store(self.test_file, self.store_path)
+        self.assertEqual(member_count, 3)
+
+        with self.assertRaises(FileNotFoundError):
+            FeatureStore(os.path.join(self.tmp_dir.name, 'missing.db'))
+
+    def test_update_feature_store(self):
+        new_transactions = pd.DataFrame({
+            'memberId': ['A', 'D', 'B', 'D', 'A'],
+            'lastTransatcionUtcTs': ['2024-01-05 10:00:00', '2021-03-01 08:00:00', '2019-05-05 05:05:05', None, '2020-01-01 00:00:00'],
+            'lastTransactionType': ['redeem', 'buy', 'gift', 'gift', None],
+            'lastTransactionPointsBought': [700, 800, None, 50, 10],
+            'lastTransactionRevenueUSD': [70.0, 80.0, 90.0, 5.0, 1.0]
+        })
+        member_ids, latency = update_feature_store(new_transactions, self.store_path)
+        self.assertEqual(set(member_ids), {'A', 'B', 'D'})
+        self.assertTrue(latency >= 0, "Latency should be non-negative")
+
+        # the store is the same as a store built from all the transactions
+        all_transactions_file = os.path.join(self.tmp_dir.name, 'all_members.csv')
+        pd.concat([pd.read_csv(self.test_file), new_transactions]).to_csv(all_transactions_file, index=False)
+        member_data, _ = read_member_data(all_transactions_file)
+        with FeatureStore(self.store_path) as feature_store:
+            self.assertEqual(len(feature_store), 4)
+            for member_id in ['A', 'B', 'C', 'D']:
+                expected_member_features, _ = create_member_features(member_data, member_id)
+                self.assertEqual(feature_store.get(member_id), expected_member_features)
+
+        # a second update builds on the first one
+        member_ids, _ = update_feature_store(new_transactions.iloc[:1], self.store_path)
+        self.assertEqual(member_ids, ['A'])
+        member_data, _ = read_member_data(all_transactions_file)
+        member_data = pd.concat([member_data, new_transactions.iloc[:1]], ignore_index=True)
+        with FeatureStore(self.store_path) as feature_store:
+            expected_member_features, _ = create_member_features(member_data, 'A')
+            self.assertEqual(feature_store.get('A'), expected_member_features)
+
+    def test_score_member_ep(self):
+        feature_store = FeatureStore(self.store_path)
+        app.dependency_overrides[get_feature_store] = lambda: feature_store
+        client = TestClient(app)
+
+        response = client.get('/members/A/score')
+        self.assertEqual(response.status_code, 200)
+        member_features = feature_store.get('A')
+        self.assertEqual(response.json()['member_id'], 'A')
+        self.assertEqual(response.json()['ats_prediction'], predict_ats(member_features)['prediction'])
+        self.assertEqual(response.json()['resp_prediction'], predict_resp(member_features)['prediction'])
+        self.assertEqual(client.get('/members/C/score').json()['offer'], 'OFFER_2')
+
+        response = client.get('/members/A/score', params = {'as_of': '2024-01-01T00:00:00'})
+        self.assertEqual(response.json()['resp_prediction'], predict_resp(feature_store.get('A', as_of = '2024-01-01'))['prediction'])
+
+        response = client.get('/members/D/score')
+        self.assertEqual(response.status_code, 404)
+        feature_store.close()
+
+    def test_get_feature_store(self):
+        with unittest.mock.patch('src.app.DEFAULT_STORE_PATH', self.store_path):
+            feature_store = get_feature_store()
+            self.assertIs(get_feature_store(), feature_store)
+
+            # an update writes in place and is read through the open store
+            update_feature_store(pd.DataFrame({
+                'memberId': ['D'], 'lastTransatcionUtcTs': ['2024-01-05 10:00:00'], 'lastTransactionType': ['buy'],
+                'lastTransactionPointsBought': [700], 'lastTransactionRevenueUSD': [70.0]
+            }), self.store_path)
+            self.assertIs(get_feature_store(), feature_store)
+            self.assertIsNotNone(feature_store.get('D'))
+
+            # a rebuild replaces the file, and the new store is opened
+            build_feature_store(self.test_file, self.store_path)
+            rebuilt_feature_store = get_feature_store()
+            self.assertIsNot(rebuilt_feature_store, feature_store)
+            self.assertIsNone(rebuilt_feature_store.get('D'))
+
+        with unittest.mock.patch('src.app.DEFAULT_STORE_PATH', os.path.join(self.tmp_dir.name, 'missing.db')):
+            with self.assertRaises(HTTPException) as context:
+                get_feature_store()
+            self.assertEqual(context.exception.status_code, 503)
+            self.assertEqual(TestClient(app).get('/members/A/score').status_code, 503)
+
+    def test_old_feature_store(self):
+        # a store built before the LAST_5 and LAST_10 features has to be rebuilt
+        with sqlite3.connect(self.store_path) as connection:
+            for column in ['LAST_5_TRANSACTIONS_AVG_POINTS_BOUGHT', 'LAST_10_TRANSACTIONS_AVG_REVENUE_USD']:
+                connection.execute(f'ALTER TABLE member_features DROP COLUMN {column}')
+        connection.close()
+
+        with self.assertRaisesRegex(FeatureStoreSchemaError, 'LAST_5_TRANSACTIONS_AVG_POINTS_BOUGHT, LAST_10_TRANSACTIONS_AVG_REVENUE_USD'):
+            FeatureStore(self.store_path)
+        with self.assertRaises(FeatureStoreSchemaError):
+            update_feature_store(pd.DataFrame({
+                'memberId': ['D'], 'lastTransatcionUtcTs': ['2024-01-05 10:00:00'], 'lastTransactionType': ['buy'],
+                'lastTransactionPointsBought': [700], 'lastTransactionRevenueUSD': [70.0]
+            }), self.store_path)
+
+        with unittest.mock.patch('src.app.DEFAULT_STORE_PATH', self.store_path):
+            response = TestClient(app).get('/members/A/score')
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('rebuild it with build_feature_store', response.json()['detail'])
+
+            build_feature_store(self.test_file, self.store_path)
+            self.assertEqual(TestClient(app).get('/members/A/score').status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+import unittest
+import asyncio
+from unittest.mock import patch
+import os
+import json
+import tempfile
+
+import pandas as pd
+from fastapi.testclient import TestClient
+
+from src import instrumentation
+from src.app import app
+from src.data_processing import create_member_features
+from src.member_features import MemberFeatures
+from src.instrumentation import MetricsRegistry, JSONLinesExporter, span, instrumented, timed, add_exporter, remove_exporter, write_prometheus, NULL_SPAN
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+class TestInstrumentationFunctions(unittest.TestCase):
+    def setUp(self) -> None:
+        """SetUp an exporter collecting the span trees, with the instrumentation on (it is off by default)"""
+        enabled = patch('src.instrumentation.ENABLED', True)
+        enabled.start()
+        self.addCleanup(enabled.stop)
+        self.exporter = ListExporter()
+        add_exporter(self.exporter)
+
+    def tearDown(self):
+        remove_exporter(self.exporter)
+
+    def test_span_tree(self):
+        @instrumented
+        def inner():
+            return 1
+
+        @instrumented(name = 'outer_step')
+        def outer():
+            with span('block', member_id = 'A'):
+                inner()
+            return inner() + 1
+
+        self.assertEqual(outer(), 2)
+        self.assertEqual(outer.__name__, 'outer')
+
+        self.assertEqual(len(self.exporter.spans), 1)
+        root = self.exporter.spans[0].to_dict()
+        self.assertEqual(root['name'], 'outer_step')
+        self.assertEqual([child['name'] for child in root['children']], ['block', 'inner'])
+        self.assertEqual(root['children'][0]['attributes'], {'member_id': 'A'})
+        self.assertEqual(root['children'][0]['children'][0]['name'], 'inner')
+        self.assertTrue(root['duration_ns'] >= root['children'][0]['duration_ns'] + root['children'][1]['duration_ns'])
+
+        histogram = instrumentation.REGISTRY.histogram('span_duration_seconds', span = 'inner')
+        self.assertTrue(histogram.count >= 2)
+
+    def test_timed(self):
+        @timed
+        def function():
+            return 1
+
+        # the latency is the duration of the span of the call
+        value, latency = function()
+        self.assertEqual(value, 1)
+        self.assertEqual(self.exporter.spans[-1].name, 'function')
+        self.assertEqual(latency, self.exporter.spans[-1].seconds)
+
+        with patch('src.instrumentation.ENABLED', False):
+            value, latency = function()
+        self.assertEqual(value, 1)
+        self.assertTrue(latency >= 0)
+        self.assertEqual(len(self.exporter.spans), 1)
+
+    def test_timed_async(self):
+        @timed(name = 'async_step')
+        async def function():
+            with span('block'):
+                await asyncio.sleep(0)
+            return 1
+
+        value, latency = asyncio.run(function())
+        self.assertEqual(value, 1)
+        root = self.exporter.spans[-1]
+        self.assertEqual(root.name, 'async_step')
+        self.assertEqual([child.name for child in root.children], ['block'])
+        self.assertEqual(latency, root.seconds)
+
+        with patch('src.instrumentation.ENABLED', False):
+            value, latency = asyncio.run(function())
+        self.assertEqual(value, 1)
+        self.assertTrue(latency >= 0)
+        self.assertEqual(len(self.exporter.spans), 1)
+
+    def test_no_exporter(self):
+        # without an exporter, the spans only record their histogram and are not kept in a tree
+        remove_exporter(self.exporter)
+        try:
+            with span('root') as root:
+                with span('child'):
+                    pass
+        finally:
+            add_exporter(self.exporter)
+        self.assertEqual(root.children, [])
+        self.assertTrue(instrumentation.REGISTRY.histogram('span_duration_seconds', span = 'child').count >= 1)
+
+    def test_create_member_features_spans(self):
+        member_data = pd.DataFrame({
+            'memberId': ['A', 'A', 'B'],
+            'lastTransatcionUtcTs': ['2023-12-10 11:24:18', '2020-12-22 14:40:25', '2022-06-13 17:16:38'],
+            'lastTransactionType': ['buy', 'gift', 'redeem'],
+            'lastTransactionPointsBought': [100, 200, 300],
+            'lastTransactionRevenueUSD': [10.0, 20.0, 30.0]
+        })
+        create_member_features(member_data, 'A')
+
+        root = self.exporter.spans[-1].to_dict()
+        self.assertEqual(root['name'], 'create_member_features')
+        child_names = [child['name'] for child in root['children']]
+        self.assertEqual(child_names[0], 'build_member_feature_table')
+        self.assertIn('calculate_avg_points_bought', child_names)
+        self.assertIn('calcualte_days_sicne_last_transaction', child_names)
+
+    def test_disabled(self):
+        calls = []
+        with patch('src.instrumentation.ENABLED', False):
+            def function():
+                calls.append(1)
+            # decorating while disabled returns the function itself
+            self.assertIs(instrumented(function), function)
+            self.assertIs(span('block'), NULL_SPAN)
+            with span('block'):
+                function()
+        self.assertEqual(calls, [1])
+        self.assertEqual(self.exporter.spans, [])
+
+    def test_histogram_prometheus(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram('request_seconds', 'Request latency', buckets = (0.1, 1.0), route = '/score')
+        for value in [0.05, 0.5, 0.5, 2.0]:
+            histogram.observe(value)
+        self.assertIs(registry.histogram('request_seconds', route = '/score'), histogram)
+
+        text = registry.render_prometheus()
+        self.assertIn('# TYPE request_seconds histogram', text)
+        self.assertIn('request_seconds_bucket{route="/score",le="0.1"} 1', text)
+        self.assertIn('request_seconds_bucket{route="/score",le="1.0"} 3', text)
+        self.assertIn('request_seconds_bucket{route="/score",le="+Inf"} 4', text)
+        self.assertIn('request_seconds_sum{route="/score"} 3.05', text)
+        self.assertIn('request_seconds_count{route="/score"} 4', text)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metrics_file = os.path.join(tmp_dir, 'metrics.prom')
+            write_prometheus(metrics_file, registry)
+            with open(metrics_file) as f:
+                self.assertEqual(f.read(), text)
+
+    def test_json_lines_exporter(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace_file = os.path.join(tmp_dir, 'trace.jsonl')
+            exporter = JSONLinesExporter(trace_file)
+            add_exporter(exporter)
+            try:
+                with span('root'):
+                    with span('child'):
+                        pass
+                with span('other_root'):
+                    pass
+            finally:
+                remove_exporter(exporter)
+                exporter.close()
+
+            with open(trace_file) as f:
+                trees = [json.loads(line) for line in f]
+        self.assertEqual([tree['name'] for tree in trees], ['root', 'other_root'])
+        self.assertEqual(trees[0]['children'][0]['name'], 'child')
+
+    def test_metrics_ep(self):
+        client = TestClient(app)
+        registry = instrumentation.REGISTRY
+        requests = registry.counter('http_requests_total', method = 'POST', route = '/score', status = '200')
+        errors = registry.counter('http_requests_total', method = 'POST', route = '/score', status = '422')
+        latency = registry.histogram('http_request_duration_seconds', method = 'POST', route = '/score')
+        request_count, error_count, latency_count = requests.value, errors.value, latency.count
+
+        payload = MemberFeatures(AVG_POINTS_BOUGHT = 100).dict()
+        for _ in range(3):
+            self.assertEqual(client.post('/score', json = payload).status_code, 200)
+        self.assertEqual(client.post('/score', json = {'AVG_POINTS_BOUGHT': 'abc'}).status_code, 422)
+        client.get('/members/A/score')
+
+        self.assertEqual(requests.value - request_count, 3)
+        self.assertEqual(errors.value - error_count, 1)
+        self.assertEqual(latency.count - latency_count, 4)
+        self.assertEqual(registry.gauge('http_requests_in_progress', method = 'POST', route = '/score').value, 0)
+        self.assertTrue(registry.histogram('http_request_size_bytes', method = 'POST', route = '/score').sum > 0)
+
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['content-type'].startswith('text/plain'))
+        self.assertIn('# TYPE http_request_duration_seconds histogram', response.text)
+        self.assertIn('http_requests_total{method="POST",route="/score",status="200"}', response.text)
+        # the route template is used as the label, not the path of each member
+        self.assertIn('route="/members/{member_id}/score"', response.text)
+        self.assertIn('http_response_size_bytes_bucket{method="POST",route="/score",le="+Inf"}', response.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import logging
+import pandas as pd
+
+from src.log_sampling import is_sampled, log_member, log_batch, batch_logged
+from src.data_processing import create_member_features
+
+class TestLogSamplingFunctions(unittest.TestCase):
+    def test_is_sampled(self):
+        member_ids = [f'{i:08X}' for i in range(10000)]
+        self.assertTrue(all(is_sampled(member_id, 1.0) for member_id in member_ids))
+        self.assertFalse(any(is_sampled(member_id, 0.0) for member_id in member_ids))
+
+        sampled = [member_id for member_id in member_ids if is_sampled(member_id, 0.1)]
+        self.assertTrue(800 < len(sampled) < 1200)
+        # the same members are sampled every time
+        self.assertEqual(sampled, [member_id for member_id in member_ids if is_sampled(member_id, 0.1)])
+
+    def test_log_member(self):
+        with self.assertLogs(level = 'INFO') as logs:
+            log_member('A', 'Score for member %s: %s', 'A', 0.5)
+            with patch('src.log_sampling.LOG_SAMPLE_RATE', 0.0):
+                log_member('A', 'Score for member %s: %s', 'A', 0.5)
+            logging.info('done')
+        self.assertEqual(logs.output, ['INFO:root:Score for member A: 0.5', 'INFO:root:done'])
+
+        # the message is not formatted if the level is disabled
+        argument = MagicMock()
+        log_member('A', 'Debug %s', argument, level = logging.DEBUG)
+        argument.__str__.assert_not_called()
+
+    def test_log_batch(self):
+        @batch_logged
+        def score_members(member_ids):
+            for member_id in member_ids:
+                log_member(member_id, 'Sending POST request with member_id %s', member_id)
+                log_member(member_id, 'Offer for member %s: %s', member_id, 'OFFER_1')
+            return len(member_ids)
+
+        with self.assertLogs(level = 'INFO') as logs:
+            self.assertEqual(score_members(['A', 'B', 'C']), 3)
+        # one summary record instead of the per-member records
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Batch score_members: 6 per-member log records summarized', logs.output[0])
+        self.assertIn('3 x "Offer for member %s: %s"', logs.output[0])
+
+        # the sampled members are still logged inside a batch
+        with patch('src.log_sampling.LOG_BATCH_SAMPLE_RATE', 1.0), self.assertLogs(level = 'INFO') as logs:
+            with log_batch('sampled') as batch:
+                log_member('A', 'Offer for member %s: %s', 'A', 'OFFER_1')
+        self.assertEqual(logs.output[0], 'INFO:root:Offer for member A: OFFER_1')
+        self.assertEqual(batch.counts['Offer for member %s: %s'], 1)
+
+    def test_create_member_features_batch(self):
+        member_data = pd.DataFrame({
+            'memberId': ['A', 'A', 'B'],
+            'lastTransatcionUtcTs': ['2023-12-10 11:24:18', '2020-12-22 14:40:25', '2022-06-13 17:16:38'],
+            'lastTransactionType': ['buy', 'gift', 'redeem'],
+            'lastTransactionPointsBought': [100, 200, 300],
+            'lastTransactionRevenueUSD': [10.0, 20.0, 30.0]
+        })
+        with self.assertLogs(level = 'INFO') as logs:
+            with log_batch('features'):
+                for member_id in ['A', 'B']:
+                    create_member_features(member_data, member_id)
+        self.assertFalse(any('for member_id A' in line for line in logs.output))
+        self.assertIn('Batch features:', logs.output[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
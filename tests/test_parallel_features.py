@@ -0,0 +1,59 @@
+import unittest
+import pandas as pd
+import numpy as np
+
+from src.data_processing import build_member_feature_table, IndexedMemberData
+from src.parallel_features import build_member_feature_table_parallel, split_member_ranges
+
+class TestParallelFeatureFunctions(unittest.TestCase):
+    def setUp(self) -> None:
+        """SetUp a sample DataFrame with string member ids"""
+        self.sample_data = pd.DataFrame({
+            'memberId': ['A', 'A', 'B', 'B', 'B', 'C', 'C', 'C', 'C', 'D'],
+            'lastTransatcionUtcTs': [
+                '2023-12-10 11:24:18',
+                '2020-12-22 14:40:25',
+                '2022-06-13 17:16:38',
+                '2020-11-08 11:37:48',
+                '2022-10-13 13:19:55',
+                '2021-11-07 06:20:36',
+                '2019-01-25 04:00:33',
+                '2022-02-04 06:26:30',
+                '2020-06-27 21:48:28',
+                '2020-06-27 21:48:28'
+            ],
+            'lastTransactionType': ['buy', 'gift', 'redeem', 'gift', 'redeem', 'buy', 'gift', 'buy', 'gift', ''],
+            'lastTransactionPointsBought': [100, 200, 300, 400, 500, 600, 700, 800, 900, 0],
+            'lastTransactionRevenueUSD': [10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0, 90.0, 100.0]
+            })
+
+    def test_split_member_ranges(self):
+        member_codes = np.array([0, 0, 1, 1, 1, 2, 2, 2, 2, 3])
+        self.assertEqual(split_member_ranges(member_codes, 1), [(0, 10)])
+        self.assertEqual(split_member_ranges(member_codes, 2), [(0, 5), (5, 10)])
+        # a member is never split across chunks, even with more chunks than members
+        ranges = split_member_ranges(member_codes, 20)
+        self.assertEqual(ranges, [(0, 2), (2, 5), (5, 9), (9, 10)])
+        self.assertEqual(split_member_ranges(np.array([], dtype=np.int64), 4), [])
+
+    def test_build_member_feature_table_parallel(self):
+        expected, _ = build_member_feature_table(self.sample_data)
+        for executor in ['process', 'thread']:
+            feature_table, latency = build_member_feature_table_parallel(self.sample_data, workers = 2, executor = executor)
+            pd.testing.assert_frame_equal(feature_table.sort_index(), expected.sort_index())
+            self.assertTrue(latency >= 0, "Latency should be non-negative")
+
+        feature_table, _ = build_member_feature_table_parallel(IndexedMemberData(self.sample_data), workers = 3, executor = 'thread')
+        pd.testing.assert_frame_equal(feature_table.sort_index(), expected.sort_index())
+
+        # every worker computes the days to the same as_of time
+        expected, _ = build_member_feature_table(self.sample_data, as_of = '2024-01-01')
+        feature_table, _ = build_member_feature_table_parallel(self.sample_data, workers = 2, as_of = '2024-01-01')
+        pd.testing.assert_frame_equal(feature_table.sort_index(), expected.sort_index())
+
+        with self.assertRaises(ValueError):
+            build_member_feature_table_parallel(self.sample_data, executor = 'gpu')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from src.member_features import MemberFeatures
+from src.prediction_ep import Prediction, predict_ats, predict_resp, predict_ats_batch, predict_resp_batch
+from src.prediction_ep import ATS_FEATURES, RESP_FEATURES, unscorable_members
+from src.offer_ep import get_offer, get_offer_batch
+
+class TestVectorizedPredictionFunctions(unittest.TestCase):
+    def setUp(self) -> None:
+        """SetUp random member features, including negative ATS weights and RESP values above the 0.9 cap"""
+        rng = np.random.default_rng(0)
+        size = 500
+        self.features = pd.DataFrame({
+            'AVG_POINTS_BOUGHT': rng.uniform(-5000, 5000, size).round(2),
+            'AVG_REVENUE_USD': rng.uniform(0, 100, size).round(2),
+            'LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT': rng.uniform(-5000, 5000, size).round(2),
+            'LAST_3_TRANSACTIONS_AVG_REVENUE_USD': rng.uniform(0, 100, size).round(2),
+            'PCT_BUY_TRANSACTIONS': rng.uniform(0, 1, size).round(2),
+            'PCT_GIFT_TRANSACTIONS': rng.uniform(0, 1, size).round(2),
+            'PCT_REDEEM_TRANSACTIONS': rng.uniform(0, 1, size).round(2),
+            'DAYS_SINCE_LAST_TRANSACTION': rng.integers(0, 2000, size)
+        })
+        self.member_features = [MemberFeatures(**row) for row in self.features.to_dict(orient='records')]
+
+    def test_predict_ats_batch(self):
+        expected = [predict_ats(member_features)['prediction'] for member_features in self.member_features]
+        np.testing.assert_array_equal(predict_ats_batch(self.features), expected)
+
+        # a structured array gives the same result as a DataFrame
+        np.testing.assert_array_equal(predict_ats_batch(self.features.to_records(index=False)), expected)
+
+    def test_predict_resp_batch(self):
+        expected = [predict_resp(member_features)['prediction'] for member_features in self.member_features]
+        predictions = predict_resp_batch(self.features)
+        np.testing.assert_array_equal(predictions, expected)
+        self.assertTrue((predictions <= 0.9).all())
+        self.assertTrue((predictions == 0.9).any())
+
+    def test_get_offer_batch(self):
+        predictions = pd.DataFrame({
+            'ats_prediction': predict_ats_batch(self.features),
+            'resp_prediction': predict_resp_batch(self.features)
+        })
+        expected = [get_offer(Prediction(**row))['offer'] for row in predictions.to_dict(orient='records')]
+        offers = get_offer_batch(predictions)
+        self.assertEqual(offers.tolist(), expected)
+        self.assertEqual(set(offers), {'OFFER_1', 'OFFER_2'})
+
+    def test_unscorable_members(self):
+        features = {
+            'AVG_POINTS_BOUGHT': [1.0, None, 3.0],
+            'AVG_REVENUE_USD': [1.0, 2.0, None],
+            'DAYS_SINCE_LAST_TRANSACTION': [-1, 0, 5],
+            **{name: [1.0] * 3 for name in set(ATS_FEATURES + RESP_FEATURES) - {'AVG_POINTS_BOUGHT', 'AVG_REVENUE_USD', 'DAYS_SINCE_LAST_TRANSACTION'}}
+        }
+        self.assertEqual(unscorable_members(features, ATS_FEATURES), [(1, 'AVG_POINTS_BOUGHT', None)])
+        self.assertEqual(unscorable_members(features, RESP_FEATURES), [(0, 'DAYS_SINCE_LAST_TRANSACTION', -1), (2, 'AVG_REVENUE_USD', None)])
+        self.assertEqual(unscorable_members(self.features, RESP_FEATURES), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
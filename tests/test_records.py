@@ -0,0 +1,129 @@
+import unittest
+from decimal import Decimal
+from typing import List
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from src.app import app
+from src.records import MemberFeaturesRecord, PredictionRecord, RecordValidationError
+from src.member_features import MemberFeatures
+from src.prediction_ep import Prediction
+
+FEATURES = dict(
+    AVG_POINTS_BOUGHT = 1500.0, AVG_REVENUE_USD = 12.5, LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT = 2000.0, LAST_3_TRANSACTIONS_AVG_REVENUE_USD = 15.0,
+    PCT_BUY_TRANSACTIONS = 0.5, PCT_GIFT_TRANSACTIONS = 0.25, PCT_REDEEM_TRANSACTIONS = 0.25, DAYS_SINCE_LAST_TRANSACTION = 30
+)
+
+# inputs the records must accept or reject exactly as the models do
+VALUES = [
+    1, 1.0, -2.5, True, '1', '1.5', '3.0', '3.', '3.10', '1e3', ' 1', 'abc', '', b'2', b'\xff', None, [], {}, Decimal('1.5'), Decimal('2'), Decimal('1e400'),
+    1e20, 2 ** 70, 2 ** 2000, float('nan'), float('inf'), 'inf', 'NaN', '1_000', '-_1', '1__0', '_1', '1_0.0', '1'*4300, '1'*4301, '\u0661', '\uff11', '\u0663.\u0665'
+]
+
+def validate_model(model, values):
+    try:
+        return model(**values).model_dump(), None
+    except ValidationError as e:
+        return None, e.errors()
+
+def validate_record(record_class, values):
+    try:
+        return record_class(**values).as_dict(), None
+    except RecordValidationError as e:
+        return None, e.errors()
+
+class TestRecordsFunctions(unittest.TestCase):
+    def test_validation_parity(self):
+        for field in ('AVG_POINTS_BOUGHT', 'DAYS_SINCE_LAST_TRANSACTION'):
+            for value in VALUES:
+                with self.subTest(field = field, value = value):
+                    values = {**FEATURES, field: value}
+                    # compared by repr since a NaN is never equal to itself
+                    self.assertEqual(repr(validate_record(MemberFeaturesRecord, values)), repr(validate_model(MemberFeatures, values)))
+
+        # missing fields take their default, or are reported if they are required
+        self.assertEqual(validate_record(MemberFeaturesRecord, {}), validate_model(MemberFeatures, {}))
+        for values in ({}, {'ats_prediction': 1, 'resp_prediction': 'x'}, {'ats_prediction': 1, 'resp_prediction': 0.5, 'other': 1}):
+            with self.subTest(values = values):
+                self.assertEqual(validate_record(PredictionRecord, values), validate_model(Prediction, values))
+
+    def test_from_dict(self):
+        record = MemberFeaturesRecord.from_dict(FEATURES)
+        self.assertEqual(record.DAYS_SINCE_LAST_TRANSACTION, 30)
+        self.assertFalse(hasattr(record, '__dict__'))
+
+        with self.assertRaises(RecordValidationError) as context:
+            MemberFeaturesRecord.from_dict([1])
+        self.assertEqual(context.exception.errors()[0]['type'], 'model_attributes_type')
+
+        with self.assertRaises(RecordValidationError) as context:
+            PredictionRecord.from_dict({'ats_prediction': 'abc'})
+        self.assertEqual([(error['type'], error['loc']) for error in context.exception.errors()], [('float_parsing', ('ats_prediction',)), ('missing', ('resp_prediction',))])
+
+    def test_conversions(self):
+        model = MemberFeatures(**FEATURES)
+        record = MemberFeaturesRecord.from_model(model)
+
+        self.assertEqual(record, model)
+        self.assertEqual(record, MemberFeaturesRecord(**FEATURES))
+        self.assertNotEqual(record, MemberFeaturesRecord(**{**FEATURES, 'AVG_POINTS_BOUGHT': 0}))
+        self.assertEqual(record.to_model(), model)
+        self.assertEqual(MemberFeaturesRecord.dump(model), model.model_dump())
+        self.assertEqual(MemberFeaturesRecord.dump(record), model.model_dump())
+        self.assertEqual(PredictionRecord(ats_prediction = 1, resp_prediction = 0.5).dict(), {'ats_prediction': 1.0, 'resp_prediction': 0.5})
+
+    def test_app_validation(self):
+        # the endpoints reading their body with the records answer invalid bodies as FastAPI does with the models
+        reference_app = FastAPI()
+
+        @reference_app.post('/score')
+        async def score_ep(member_features: MemberFeatures):
+            return {}
+
+        @reference_app.post('/offer/assign_batch')
+        async def assign_offer_batch_ep(predictions: List[Prediction]):
+            return {}
+
+        client = TestClient(app)
+        reference_client = TestClient(reference_app)
+        bodies = [
+            ('/score', {'AVG_POINTS_BOUGHT': 'abc', 'DAYS_SINCE_LAST_TRANSACTION': 1.5}),
+            ('/score', [1]),
+            ('/score', None),
+            ('/offer/assign_batch', {'ats_prediction': 1}),
+            ('/offer/assign_batch', [{'ats_prediction': 1, 'resp_prediction': 0.5}, {'ats_prediction': []}])
+        ]
+        for path, body in bodies:
+            with self.subTest(path = path, body = body):
+                response = client.post(path, json = body)
+                reference_response = reference_client.post(path, json = body)
+                self.assertEqual(response.status_code, 422)
+                self.assertEqual(response.json(), reference_response.json())
+
+        # bodies FastAPI does not decode as JSON, or that only the standard library decodes (NaN, integers beyond 64 bits, UTF-16)
+        contents = [
+            (b'{"AVG_POINTS_BOUGHT": 1}', 'text/plain'),
+            (b'{"AVG_POINTS_BOUGHT": 1}', 'application/vnd.api+json'),
+            (b'{"AVG_POINTS_BOUGHT": 1', 'application/json'),
+            (b'{"AVG_POINTS_BOUGHT": NaN}', 'application/json'),
+            (b'{"DAYS_SINCE_LAST_TRANSACTION": 123456789012345678901234567890}', 'application/json'),
+            (b'{"AVG_POINTS_BOUGHT": 123456789012345678901234567890}', 'application/json'),
+            ('{"AVG_POINTS_BOUGHT": 1}'.encode('utf-16'), 'application/json'),
+            (b'null', 'application/json'),
+            (b'', 'text/plain')
+        ]
+        for content, content_type in contents:
+            with self.subTest(content = content, content_type = content_type):
+                response = client.post('/score', content = content, headers = {'content-type': content_type})
+                reference_response = reference_client.post('/score', content = content, headers = {'content-type': content_type})
+                self.assertEqual(response.status_code, reference_response.status_code)
+                if response.status_code == 422:
+                    self.assertEqual(response.json(), reference_response.json())
+
+        # the request bodies are still documented
+        schema = client.get('/openapi.json').json()['paths']['/offer/assign_batch']['post']['requestBody']['content']['application/json']['schema']
+        self.assertEqual(schema['items']['properties'].keys(), Prediction.model_fields.keys())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+
+from src.result_store import SQLiteResultStore, JSONLinesResultLog
+
+class TestResultStoreFunctions(unittest.TestCase):
+    def setUp(self) -> None:
+        """SetUp a temporary directory for the result stores"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.rows = [
+            {'member_id': 1, 'AVG_POINTS_BOUGHT': 150.0, 'offer_ep': 'OFFER_1'},
+            {'member_id': '5D72524D', 'AVG_POINTS_BOUGHT': np.float64(760.0), 'offer_ep': 'OFFER_1'},
+            {'member_id': 1, 'AVG_POINTS_BOUGHT': 300.0, 'offer_ep': 'OFFER_2'}
+        ]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def check_upsert(self, sink):
+        for row in self.rows:
+            sink.upsert(row)
+
+        # the latest row of each member, in the order they were last saved
+        self.assertEqual(len(sink), 2)
+        self.assertEqual(sink.rows(), [
+            {'member_id': '5D72524D', 'AVG_POINTS_BOUGHT': 760.0, 'offer_ep': 'OFFER_1'},
+            {'member_id': 1, 'AVG_POINTS_BOUGHT': 300.0, 'offer_ep': 'OFFER_2'}
+        ])
+
+    def test_sqlite_result_store(self):
+        path = os.path.join(self.tmp_dir.name, 'results.db')
+        with SQLiteResultStore(path) as sink:
+            self.check_upsert(sink)
+
+        # the results are kept when the store is opened again
+        with SQLiteResultStore(path) as sink:
+            self.assertEqual(len(sink), 2)
+
+    def test_json_lines_result_log(self):
+        path = os.path.join(self.tmp_dir.name, 'results.jsonl')
+        with JSONLinesResultLog(path) as sink:
+            self.check_upsert(sink)
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 3)
+
+            sink.compact()
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 2)
+            self.assertEqual(sink.rows()[1]['AVG_POINTS_BOUGHT'], 300.0)
+
+            # appending after a compaction goes to the compacted log
+            sink.upsert({'member_id': 2, 'AVG_POINTS_BOUGHT': 0.0, 'offer_ep': 'OFFER_1'})
+            self.assertEqual(len(sink), 3)
+
+    def test_json_lines_result_log_compact_every(self):
+        path = os.path.join(self.tmp_dir.name, 'results.jsonl')
+        with JSONLinesResultLog(path, compact_every = 3) as sink:
+            self.check_upsert(sink)
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 2, "The log should be compacted after 3 rows")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from unittest.mock import patch
+import httpx
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.testclient import TestClient
+
+from src.app import app, score
+from src.records import MemberFeaturesRecord
+from src.member_features import MemberFeatures
+from src.server import run
+from src.load_test import run_load, PAYLOADS
+
+class TestServerFunctions(unittest.TestCase):
+    @patch('src.server.uvicorn.run')
+    def test_run(self, mock_run):
+        run(port = 9000, workers = 4, keep_alive = 30, backlog = 4096, limit_concurrency = 500)
+
+        args, kwargs = mock_run.call_args
+        # the app is passed as an import string, which uvicorn needs to start several workers
+        self.assertEqual(args, ('src.app:app',))
+        self.assertEqual(kwargs['port'], 9000)
+        self.assertEqual(kwargs['workers'], 4)
+        self.assertEqual(kwargs['timeout_keep_alive'], 30)
+        self.assertEqual(kwargs['backlog'], 4096)
+        self.assertEqual(kwargs['limit_concurrency'], 500)
+        self.assertFalse(kwargs['access_log'])
+
+    @patch('src.load_test.create_async_client')
+    def test_run_load(self, mock_create_async_client):
+        # send the load to the app in-process
+        mock_create_async_client.side_effect = lambda base_url, pool_size, timeout: httpx.AsyncClient(transport = httpx.ASGITransport(app = app), base_url = base_url)
+
+        report = run_load('http://test', '/score', concurrency = 4, duration = 0.2, warmup = 0.05)
+        self.assertTrue(report['requests'] > 0)
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['concurrency'], 4)
+        self.assertTrue(report['requests_per_second'] > 0)
+        self.assertTrue(report['latency']['p50'] <= report['latency']['p99'])
+
+    def test_orjson_responses(self):
+        client = TestClient(app)
+        response = client.post('/score', json = PAYLOADS['/score'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        self.assertEqual(response.json(), score(MemberFeatures(**PAYLOADS['/score'])))
+        self.assertIs([route for route in app.routes if route.path == '/score'][0].response_class, ORJSONResponse)
+
+    def test_max_batch_size(self):
+        client = TestClient(app)
+        with patch('src.app.MAX_BATCH_SIZE', 2):
+            self.assertEqual(client.post('/ml/ats/predict_batch', json = [PAYLOADS['/score']] * 2).status_code, 200)
+
+            # oversized batches are rejected before their items are validated
+            with patch.object(MemberFeaturesRecord, 'from_dict') as mock_from_dict:
+                response = client.post('/ml/ats/predict_batch', json = [PAYLOADS['/score']] * 3)
+                mock_from_dict.assert_not_called()
+            self.assertEqual(response.status_code, 413)
+            self.assertEqual(client.post('/offer/assign_batch', json = [PAYLOADS['/offer/assign']] * 3).status_code, 413)
+
+    def test_unscorable_batch(self):
+        # the members the scalar endpoints fail on are rejected by the batch endpoints, instead of being predicted as NaN or inf
+        client = TestClient(app, raise_server_exceptions = False)
+        payload = [PAYLOADS['/score'], {**PAYLOADS['/score'], 'DAYS_SINCE_LAST_TRANSACTION': -1}, {**PAYLOADS['/score'], 'AVG_REVENUE_USD': None}]
+        self.assertEqual(client.post('/ml/resp/predict', json = payload[1]).status_code, 500)
+
+        response = client.post('/ml/resp/predict_batch', json = payload)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual([error['loc'] for error in response.json()['detail']], [['body', 1, 'DAYS_SINCE_LAST_TRANSACTION'], ['body', 2, 'AVG_REVENUE_USD']])
+
+        # ATS does not use DAYS_SINCE_LAST_TRANSACTION nor AVG_REVENUE_USD
+        self.assertEqual(client.post('/ml/ats/predict_batch', json = payload).status_code, 200)
+        response = client.post('/ml/ats/predict_batch', json = [*payload, {**PAYLOADS['/score'], 'AVG_POINTS_BOUGHT': None}])
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual([error['loc'] for error in response.json()['detail']], [['body', 3, 'AVG_POINTS_BOUGHT']])
+
+        with patch('src.app.ResponseClass', JSONResponse):
+            self.assertEqual(client.post('/ml/resp/predict_batch', json = payload).status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()